@@ -0,0 +1,459 @@
+# -*- coding: utf-8 -*-
+"""
+benchmark.py
+
+This file contains the benchmark suite for the hot paths of JWTJuggernaut, used to check that an upgrade of the tool
+hasn't made it slower. Every benchmark measures a throughput (operations per second) on deterministic input, except
+startup, which measures the wall time of a cold `jwtjuggernaut.py -q read -t <jwt>` run against a fixed budget.
+
+Each benchmark is run several times and the best run is kept, since noise (other processes, CPU frequency changes)
+only ever makes a run slower. Results are written as JSON, and a later run can be compared against them, failing
+(exit code 1) if any benchmark got slower by more than the threshold. A baseline recorded with a different --quick
+setting or CPU count is not comparable and is refused (exit code 2) unless --force is given.
+
+Example:
+    $ python3 benchmarks/benchmark.py -o baseline.json
+    $ python3 benchmarks/benchmark.py --baseline baseline.json --threshold 10
+
+Functions:
+- run_benchmarks: Runs every benchmark whose name matches the filter and returns the results.
+- compare_results: Compares results against a baseline and returns the benchmarks that regressed.
+- baseline_mismatches: Returns how a baseline's run settings differ from the current run.
+- bench_base64_decode: parse_token.base64_decode on a small and a large payload.
+- bench_parse_token: parse_token.parse_token (without terminal output) on a small and a large token.
+- bench_fetch_details: Claim definition lookup through parse_token.fetch_details.
+- bench_bruteforce: Bruteforce keys/sec per HMAC algorithm and per worker count.
+- bench_batch_read: read --batch tokens/sec.
+- bench_attack: Attack engine requests/sec against a local stub server.
+- bench_startup: Cold start time of read -t <jwt>.
+"""
+
+import os
+import sys
+import json
+import time
+import hmac
+import random
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import contextlib
+import subprocess
+from datetime import datetime, timezone
+from colorama import Fore, Style
+
+# the benchmarks import the tool's modules the same way jwtjuggernaut.py does, from the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import src.utils.parse_token  # noqa: E402
+import src.utils.bruteforce  # noqa: E402
+import src.utils.batch_decode  # noqa: E402
+import src.utils.http_client  # noqa: E402
+
+RESULTS_VERSION = 1
+
+# default maximum drop in throughput, in percent, before a benchmark counts as a regression
+THRESHOLD = 10
+
+# default number of times each benchmark is run, the best run is kept
+REPEAT = 5
+
+# default cold start budget for read -t <jwt>, in seconds
+STARTUP_BUDGET = 0.3
+
+# seed for every generated input, so each run measures exactly the same work
+SEED = 1337
+
+
+def run_benchmarks(name_filter: str = None, repeat: int = REPEAT, quick: bool = False, workers: list = None) -> dict:
+    """
+    :param name_filter: Only run benchmarks whose name contains this string, or None for all of them.
+    :param repeat: Number of times to run each benchmark.
+    :param quick: Use smaller inputs, for a fast (but noisier) check? T/F
+    :param workers: Worker counts to run the bruteforce benchmark with, or None for 1 and one per core.
+    :return: Dictionary object of benchmark name -> {value, unit, higher_is_better, runs}.
+    """
+    scale = 0.2 if quick else 1.0
+    workers = workers or sorted({1, os.cpu_count() or 1})
+    # each suite checks the filter before building its inputs, so filtered out suites cost nothing
+    suites = [
+        lambda: bench_base64_decode(scale, name_filter),
+        lambda: bench_parse_token(scale, name_filter),
+        lambda: bench_fetch_details(scale, name_filter),
+        lambda: bench_bruteforce(scale, workers, name_filter),
+        lambda: bench_batch_read(scale, name_filter),
+        lambda: bench_attack(scale, name_filter),
+        lambda: bench_startup(name_filter),
+    ]
+
+    results = {}
+    for suite in suites:
+        for name, unit, higher_is_better, function in suite():
+            runs = [function() for _ in range(repeat)]
+            results[name] = {
+                'value': max(runs) if higher_is_better else min(runs),
+                'unit': unit,
+                'higher_is_better': higher_is_better,
+                'runs': runs,
+            }
+            _print_result(name, results[name])
+    return results
+
+
+def compare_results(results: dict, baseline: dict, threshold: float = THRESHOLD) -> list:
+    """
+    Prints the change of every benchmark against the baseline.
+
+    :param results: Dictionary object returned by run_benchmarks.
+    :param baseline: Results of an earlier run, e.g. loaded from a results file.
+    :param threshold: Maximum drop in throughput (or rise in time, for startup), in percent.
+    :return: List of the names of the benchmarks that regressed by more than the threshold.
+    """
+    regressions = []
+    print()
+    print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Compared to the baseline (threshold '+Fore.CYAN+str(threshold)+'%' +
+          Fore.MAGENTA+'):'+Style.RESET_ALL)
+    for name, result in results.items():
+        if name not in baseline:
+            print('   '+Fore.MAGENTA+name.ljust(40)+'      (not in baseline)'+Style.RESET_ALL)
+            continue
+        old, new = baseline[name]['value'], result['value']
+        change = 100 * (new - old) / old if old else 0.0
+        # a positive slowdown is always worse, whichever direction the unit goes
+        slowdown = -change if result['higher_is_better'] else change
+        regressed = slowdown > threshold
+        if regressed:
+            regressions.append(name)
+        print('   '+(Fore.RED if regressed else Fore.MAGENTA)+name.ljust(40)+'{:+8.1f}%'.format(change) +
+              ('  REGRESSION' if regressed else '')+Style.RESET_ALL)
+    return regressions
+
+
+def baseline_mismatches(baseline: dict, quick: bool) -> tuple:
+    """
+    Checks that a baseline was recorded under the same conditions as the current run.
+
+    :param baseline: Contents of a results file.
+    :param quick: Is the current run using --quick? T/F
+    :return: Tuple of (settings that make the results incomparable, differences that are only worth a warning).
+    """
+    errors = []
+    if baseline.get('quick', False) != quick:
+        errors.append('the baseline was run {} --quick, this run {}'.format(
+            'with' if baseline.get('quick') else 'without', 'with' if quick else 'without'))
+    if baseline.get('cpu_count') != os.cpu_count():
+        errors.append('the baseline was run with {} CPUs, this machine has {}'.format(baseline.get('cpu_count'),
+                                                                                    os.cpu_count()))
+    warnings = []
+    if baseline.get('python') != platform.python_version():
+        warnings.append('the baseline was run on Python {}, this is Python {}'.format(baseline.get('python'),
+                                                                                      platform.python_version()))
+    return errors, warnings
+
+
+def bench_base64_decode(scale: float, name_filter: str = None) -> list:
+    """
+    :param scale: Input size multiplier.
+    :param name_filter: Only build the benchmarks whose name contains this string, or None for all of them.
+    :return: List of (name, unit, higher is better, function returning the measured value).
+    """
+    benchmarks = []
+    for size, claims in (('small', 5), ('large', 200)):
+        if not _wanted('base64_decode_' + size, name_filter):
+            continue
+        segment = src.utils.parse_token.base64_encode(_payload(claims))
+        count = int((20000 if size == 'small' else 1000) * scale)
+
+        def run(segment=segment, count=count):
+            decode = src.utils.parse_token.base64_decode
+            return _rate(lambda: [decode(segment) for _ in range(count)], count)
+        benchmarks.append(('base64_decode_' + size, 'ops/s', True, run))
+    return benchmarks
+
+
+def bench_parse_token(scale: float, name_filter: str = None) -> list:
+    """
+    :param scale: Input size multiplier.
+    :param name_filter: Only build the benchmarks whose name contains this string, or None for all of them.
+    :return: List of (name, unit, higher is better, function returning the measured value).
+    """
+    benchmarks = []
+    for size, claims in (('small', 5), ('large', 200)):
+        if not _wanted('parse_token_' + size, name_filter):
+            continue
+        token = _token(_payload(claims), b'benchmark')
+        count = int((10000 if size == 'small' else 500) * scale)
+
+        def run(token=token, count=count):
+            parse = src.utils.parse_token.parse_token
+            return _rate(lambda: [parse(token, False, output=False) for _ in range(count)], count)
+        benchmarks.append(('parse_token_' + size, 'ops/s', True, run))
+    return benchmarks
+
+
+def bench_fetch_details(scale: float, name_filter: str = None) -> list:
+    """
+    :param scale: Input size multiplier.
+    :param name_filter: Only build the benchmarks whose name contains this string, or None for all of them.
+    :return: List of (name, unit, higher is better, function returning the measured value).
+    """
+    if not _wanted('fetch_details', name_filter):
+        return []
+    header = {'alg': 'HS256', 'typ': 'JWT', 'kid': 'key-1'}
+    # registered claims (found in the table) and custom ones (not found), in both cases
+    payload = {'iss': 'https://issuer', 'sub': 'user', 'aud': 'api', 'exp': 1700003600, 'iat': 1700000000,
+               'jti': 'abc', 'Email': 'a@b.c', 'role': 'admin', 'tenant': 'x', 'scope': 'read'}
+    count = int(20000 * scale)
+
+    def run():
+        fetch = src.utils.parse_token.fetch_details
+        return _rate(lambda: [fetch(header, payload) for _ in range(count)], count)
+    src.utils.parse_token.fetch_details(header, payload)  # load the claims table outside the measurement
+    return [('fetch_details', 'ops/s', True, run)]
+
+
+def bench_bruteforce(scale: float, workers: list, name_filter: str = None) -> list:
+    """
+    Cracks a token whose key is not in the wordlist, so every key is tested. Pool startup is included, as it is in a
+    real run.
+
+    :param scale: Input size multiplier.
+    :param workers: Worker counts to run with.
+    :param name_filter: Only build the benchmarks whose name contains this string, or None for all of them.
+    :return: List of (name, unit, higher is better, function returning the measured value).
+    """
+    names = {(alg, processes): 'bruteforce_' + alg.lower() + '_' + str(processes) + '_workers'
+             for alg in src.utils.bruteforce.HMAC_ALGORITHMS for processes in workers}
+    names = {key: name for key, name in names.items() if _wanted(name, name_filter)}
+    if not names:
+        return []
+    path = _temp_file('wordlist.txt', ''.join('candidate-{:08d}\n'.format(i) for i in range(int(400000 * scale))))
+    source = src.utils.bruteforce.wordlist_source(path)
+    benchmarks = []
+    for (alg, processes), name in names.items():
+        target = src.utils.bruteforce.prepare_target(_token({'sub': 'benchmark'}, b'not in the wordlist', alg))
+
+        def run(target=target, processes=processes):
+            with _quiet():
+                result = src.utils.bruteforce.crack([target], source, processes)
+            return result['tested'] / result['elapsed']
+        benchmarks.append((name, 'keys/s', True, run))
+    return benchmarks
+
+
+def bench_batch_read(scale: float, name_filter: str = None) -> list:
+    """
+    :param scale: Input size multiplier.
+    :param name_filter: Only build the benchmarks whose name contains this string, or None for all of them.
+    :return: List of (name, unit, higher is better, function returning the measured value).
+    """
+    if not _wanted('batch_read', name_filter):
+        return []
+    count = int(50000 * scale)
+    rng = random.Random(SEED)
+    path = _temp_file('tokens.txt', ''.join(_token({'sub': 'user-' + str(rng.randrange(10 ** 6)), 'iat': 1700000000 + i,
+                                                    'role': rng.choice(['user', 'admin'])}, b'key') + '\n'
+                                            for i in range(count)))
+
+    def run():
+        return _rate(lambda: src.utils.batch_decode.batch_decode(path, os.devnull), count)
+    return [('batch_read', 'tokens/s', True, run)]
+
+
+def bench_attack(scale: float, name_filter: str = None) -> list:
+    """
+    Sends requests to a stub HTTP/1.1 server on localhost, which answers every request with the same small keep-alive
+    response, so only the request engine is measured.
+
+    :param scale: Input size multiplier.
+    :param name_filter: Only build the benchmarks whose name contains this string, or None for all of them.
+    :return: List of (name, unit, higher is better, function returning the measured value).
+    """
+    if not _wanted('attack_requests', name_filter):
+        return []
+    count = int(5000 * scale)
+
+    def run():
+        with _stub_server() as port:
+            url = 'http://127.0.0.1:' + str(port) + '/'
+            requests = ({'method': 'GET', 'url': url, 'headers': [('Authorization', 'Bearer x')]}
+                        for _ in range(count))
+
+            async def send():
+                async for response in src.utils.http_client.stream_requests(requests, 10):
+                    if 'error' in response:
+                        raise RuntimeError('Stub server request failed: ' + response['error'])
+            return _rate(lambda: asyncio.run(send()), count)
+    return [('attack_requests', 'requests/s', True, run)]
+
+
+def bench_startup(name_filter: str = None) -> list:
+    """
+    :param name_filter: Only build the benchmarks whose name contains this string, or None for all of them.
+    :return: List of (name, unit, higher is better, function returning the measured value).
+    """
+    if not _wanted('startup_read', name_filter):
+        return []
+    command = [sys.executable, os.path.join(ROOT, 'jwtjuggernaut.py'), '-q', 'read', '-t',
+               _token(_payload(5), b'benchmark')]
+
+    def run():
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        return time.perf_counter() - start
+    return [('startup_read', 's', False, run)]
+
+
+def _wanted(name: str, name_filter: str = None) -> bool:
+    return not name_filter or name_filter in name
+
+
+def _rate(function, count: int) -> float:
+    start = time.perf_counter()
+    function()
+    return count / (time.perf_counter() - start)
+
+
+def _payload(claims: int) -> dict:
+    rng = random.Random(SEED + claims)
+    payload = {'iss': 'https://issuer.example', 'sub': 'user', 'iat': 1700000000, 'exp': 1700003600}
+    for i in range(len(payload), claims):
+        payload['claim_' + str(i)] = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(32))
+    return payload
+
+
+def _token(payload: dict, key: bytes, alg: str = 'HS256') -> str:
+    encode = src.utils.parse_token.base64_encode
+    signing_input = encode({'alg': alg, 'typ': 'JWT'}) + '.' + encode(payload)
+    signature = hmac.digest(key, signing_input.encode('ascii'), src.utils.bruteforce.HMAC_ALGORITHMS[alg])
+    return signing_input + '.' + src.utils.parse_token.base64_encode_bytes(signature)
+
+
+_temp_dir = None
+
+
+def _temp_file(name: str, content: str) -> str:
+    # inputs are written once per run to a directory removed at exit
+    global _temp_dir
+    if _temp_dir is None:
+        _temp_dir = tempfile.TemporaryDirectory(prefix='jwtjuggernaut-benchmark-')
+    path = os.path.join(_temp_dir.name, name)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return path
+
+
+@contextlib.contextmanager
+def _quiet():
+    # the engines print progress and results, which would be mixed in with the benchmark output
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+@contextlib.contextmanager
+def _stub_server():
+    # a keep-alive HTTP/1.1 server on its own event loop and thread, yielding its port
+    response = b'HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 2\r\n\r\nok'
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                await reader.readuntil(b'\r\n\r\n')
+                writer.write(response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    loop = asyncio.new_event_loop()
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    server = loop.run_until_complete(asyncio.start_server(handle, sock=sock))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield sock.getsockname()[1]
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
+
+
+def _print_result(name: str, result: dict):
+    value = result['value']
+    formatted = '{:.3f}'.format(value) if result['unit'] == 's' else '{:,.0f}'.format(value)
+    print(Fore.CYAN+'➤  '+Fore.MAGENTA+name.ljust(40)+Fore.CYAN+formatted.rjust(14)+' '+Fore.MAGENTA+result['unit'] +
+          Style.RESET_ALL)
+
+
+def main():
+    """
+    Runs the benchmarks, writes the results and compares them against a baseline if one is provided.
+
+    :return: Exit code: 0, 1 if a benchmark regressed past the threshold or startup is over budget, or 2 if the
+        baseline is not comparable.
+    """
+    parser = argparse.ArgumentParser(description='JWTJuggernaut benchmark suite')
+    parser.add_argument('-o', '--output', required=False, help='File to write the results to as JSON')
+    parser.add_argument('-b', '--baseline', required=False,
+                        help='Results file of an earlier run to compare against')
+    parser.add_argument('-t', '--threshold', required=False, type=float, default=THRESHOLD,
+                        help='Maximum slowdown against the baseline, in percent (default: 10)')
+    parser.add_argument('-f', '--filter', required=False, help='Only run benchmarks whose name contains this string')
+    parser.add_argument('-n', '--repeat', required=False, type=int, default=REPEAT,
+                        help='Number of times to run each benchmark, the best run is kept (default: 5)')
+    parser.add_argument('-w', '--workers', required=False, type=int, action='append',
+                        help='Bruteforce worker count - can be used more than once (default: 1 and one per core)')
+    parser.add_argument('--startup_budget', required=False, type=float, default=STARTUP_BUDGET,
+                        help='Maximum cold start time of read -t <jwt>, in seconds (default: 0.3)')
+    parser.add_argument('--quick', required=False, action='store_true',
+                        help='Use smaller inputs for a fast, noisier check')
+    parser.add_argument('--force', required=False, action='store_true',
+                        help='Compare against a baseline even if it was run with a different --quick or CPU count')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        errors, warnings = baseline_mismatches(baseline, args.quick)
+        for warning in (warnings + errors) if args.force else warnings:
+            print(Fore.RED+'➤  Warning: '+warning+Style.RESET_ALL)
+        if errors and not args.force:
+            print(Fore.RED+'➤  Not comparable with '+args.baseline+': '+'; '.join(errors) +
+                  ' (use --force to compare anyway)'+Style.RESET_ALL)
+            return 2
+        baseline = baseline['results']
+
+    results = run_benchmarks(args.filter, args.repeat, args.quick, args.workers)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': RESULTS_VERSION,
+                'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'quick': args.quick,
+                'results': results,
+            }, f, indent=4)
+
+    failed = False
+    if 'startup_read' in results and results['startup_read']['value'] > args.startup_budget:
+        print(Fore.RED+'➤  Startup took {:.3f}s, over the {:.3f}s budget'.format(results['startup_read']['value'],
+                                                                               args.startup_budget)+Style.RESET_ALL)
+        failed = True
+    if baseline is not None and compare_results(results, baseline, args.threshold):
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
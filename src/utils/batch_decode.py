@@ -0,0 +1,199 @@
+"""
+batch_decode.py
+
+This file contains the batch mode of the read subcommand (read --batch). Tokens are streamed one per line from a file
+or stdin, decoded without any terminal rendering, and written out as JSON lines or CSV. Malformed tokens are written
+as error rows rather than stopping the run, and decoding can optionally be spread across a process pool.
+
+Functions:
+- batch_decode: The main function for batch decoding, streams tokens from the input to the output.
+- iter_batches: Streams (line number, token) batches from a file object.
+- decode_batch: Decodes a batch of tokens into formatted output rows.
+- decode_row: Decodes a single token into an output row dictionary.
+- map_batches: Applies a function to every batch, in-process or across a process pool, keeping the input order.
+"""
+
+import io
+import os
+import csv
+import sys
+import json
+import collections
+import multiprocessing
+
+import src.utils.parse_token
+import src.utils.error_handler
+
+FORMATS = ('jsonl', 'csv')
+
+CSV_COLUMNS = ['line', 'token', 'alg', 'typ', 'kid', 'header', 'payload', 'signature', 'error']
+
+# number of tokens decoded (and handed to a worker) at a time
+BATCH_SIZE = 2000
+
+
+def batch_decode(input_path: str, output_path: str = None, output_format: str = 'jsonl', details: bool = False,
+                 processes: int = 1) -> dict:
+    """
+    Decodes every token in the input, writing one output row per token.
+
+    :param input_path: Path to a file of tokens (one per line), or - for stdin.
+    :param output_path: Path to write the output to, or None for stdout.
+    :param output_format: Output format, jsonl or csv.
+    :param details: Include claim definitions in each row? T/F
+    :param processes: Number of worker processes to decode with, 1 to decode in-process.
+    :return: Dictionary object with the number of tokens decoded and the number of error rows.
+    """
+    if output_format not in FORMATS:
+        src.utils.error_handler.print_error('Unsupported output format: ' + str(output_format) +
+                                            '. Supported: ' + ', '.join(FORMATS))
+    if input_path != '-' and not os.path.isfile(input_path):
+        src.utils.error_handler.print_error('Token file not found: ' + input_path)
+
+    infile = sys.stdin if input_path == '-' else open(input_path, 'r', encoding='utf-8', errors='replace')
+    outfile = sys.stdout if not output_path else open(output_path, 'w', encoding='utf-8', newline='')
+    counts = {'tokens': 0, 'errors': 0}
+    try:
+        if output_format == 'csv':
+            csv.writer(outfile).writerow(CSV_COLUMNS)
+
+        batches = iter_batches(infile)
+        for rows, tokens, errors in map_batches(decode_batch, batches, (output_format, details), processes):
+            outfile.write(rows)
+            counts['tokens'] += tokens
+            counts['errors'] += errors
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+        else:
+            outfile.flush()
+    return counts
+
+
+def iter_batches(infile, batch_size: int = BATCH_SIZE):
+    """
+    Streams the tokens from the file object in batches, skipping blank lines.
+
+    :param infile: File object to read tokens from, one per line.
+    :param batch_size: Maximum number of tokens per batch.
+    :return: Generator of lists of (line number, token) tuples.
+    """
+    batch = []
+    for line_number, line in enumerate(infile, 1):
+        token = line.strip()
+        if token:
+            batch.append((line_number, token))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def decode_batch(batch: list, output_format: str, details: bool) -> tuple:
+    """
+    Decodes a batch of tokens and formats them as a single block of output, so that workers return one string per
+    batch rather than one object per token.
+
+    :param batch: List of (line number, token) tuples.
+    :param output_format: Output format, jsonl or csv.
+    :param details: Include claim definitions in each row? T/F
+    :return: Tuple of (formatted rows, number of tokens, number of error rows).
+    """
+    rows = [decode_row(line_number, token, details) for line_number, token in batch]
+
+    if output_format == 'jsonl':
+        dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), allow_nan=False).encode
+        lines = []
+        for row in rows:
+            try:
+                lines.append(dumps(row) + '\n')
+            except (ValueError, RecursionError):
+                row = _unencodable_row(row)
+                lines.append(dumps(row) + '\n')
+        return ''.join(lines), len(rows), sum('error' in row for row in rows)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    errors = 0
+    for row in rows:
+        try:
+            header = json.dumps(row['header'], ensure_ascii=False, allow_nan=False) if 'header' in row else ''
+            payload = json.dumps(row['payload'], ensure_ascii=False, allow_nan=False) if 'payload' in row else ''
+        except (ValueError, RecursionError):
+            row = _unencodable_row(row)
+            header = payload = ''
+        errors += 'error' in row
+        claims = row.get('header', {})
+        writer.writerow([
+            row['line'],
+            row['token'],
+            claims.get('alg', ''),
+            claims.get('typ', ''),
+            claims.get('kid', ''),
+            header,
+            payload,
+            row.get('signature', ''),
+            row.get('error', ''),
+        ])
+    return buffer.getvalue(), len(rows), errors
+
+
+def decode_row(line_number: int, token: str, details: bool = False) -> dict:
+    """
+    Decodes a single token into an output row. Malformed tokens produce a row with an error instead of exiting.
+
+    :param line_number: Line of the input the token was read from.
+    :param token: The JWT to decode.
+    :param details: Include claim definitions in the row? T/F
+    :return: Dictionary object with the line, token and either header/payload/signature or error.
+    """
+    try:
+        token_dict = src.utils.parse_token.decode_token(token)
+    except ValueError as e:
+        return {'line': line_number, 'token': token, 'error': str(e)}
+
+    row = {
+        'line': line_number,
+        'token': token,
+        'header': token_dict['header_dict'],
+        'payload': token_dict['payload_dict'],
+        'signature': token_dict['signature'],
+    }
+    if details:
+        row['details'] = src.utils.parse_token.fetch_details(token_dict['header_dict'], token_dict['payload_dict'])
+    return row
+
+
+def _unencodable_row(row: dict) -> dict:
+    # NaN and Infinity (e.g. from {"exp":1e400}) decode fine but are not valid JSON, so they can't be written out
+    return {'line': row['line'], 'token': row['token'],
+            'error': 'JWT header or payload contains a number that is not valid JSON (NaN or Infinity).'}
+
+
+def map_batches(function, batches, args: tuple = (), processes: int = 1):
+    """
+    Applies the function to every batch, yielding the results in input order. With more than one process, only a few
+    batches per worker are read ahead, so memory use doesn't grow with the input.
+
+    :param function: Module-level function called as function(batch, *args), so it can be sent to a worker process.
+    :param batches: Iterable of batches, e.g. from iter_batches.
+    :param args: Extra arguments passed to the function after the batch.
+    :param processes: Number of worker processes, 1 to run in-process.
+    :return: Generator of the function's results.
+    """
+    if not processes or processes <= 1:
+        for batch in batches:
+            yield function(batch, *args)
+        return
+
+    with multiprocessing.Pool(processes) as pool:
+        pending = collections.deque()
+        for batch in batches:
+            pending.append(pool.apply_async(function, (batch,) + tuple(args)))
+            if len(pending) >= processes * 4:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
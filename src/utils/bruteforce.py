@@ -0,0 +1,635 @@
+"""
+bruteforce.py
+
+This file contains the signing key bruteforce engine used by the bruteforce subcommand. Candidate keys are checked
+against any number of HS256, HS384 and HS512 signed tokens at once, with the keyspace spread across every available
+core.
+
+The keyspace is described by a source, either a wordlist (optionally mangled by rules) or a mask. Both are addressed by
+an integer offset - a byte offset into the wordlist or an index into the mask keyspace - so the engine only ever hands
+(start, end) ranges to its workers, and checkpoints and progress reporting are the same for both.
+
+Functions:
+- bruteforce: The main function for the bruteforce subcommand, tests a single key, a wordlist or a mask.
+- load_tokens: Reads a file of JWTs to attack in a single pass.
+- prepare_targets: Prepares and deduplicates a list of JWTs, skipping any that can not be bruteforced.
+- prepare_target: Splits a JWT into the digest name, signing input bytes and raw signature bytes.
+- check_key: Tests a single candidate key against a prepared target.
+- wordlist_source: Describes a wordlist (and optional rules) keyspace.
+- mask_source: Describes a mask keyspace.
+- source_id: Returns a string identifying a keyspace, used for checkpoints.
+- source_fingerprint: Returns a location independent fingerprint of a keyspace, used for the potfile.
+- source_size: Returns the size of a keyspace.
+- source_ranges: Splits a keyspace into contiguous ranges.
+- crack: Tests every key in a keyspace against all prepared targets using a process pool.
+- print_result: Outputs the outcome and throughput of a bruteforce run to the user.
+"""
+
+import os
+import sys
+import hmac
+import time
+import collections
+import multiprocessing
+from colorama import Fore, Style
+
+import src.utils.parse_token
+import src.utils.error_handler
+import src.utils.checkpoint
+import src.utils.wordlist
+import src.utils.rules
+import src.utils.mask
+import src.utils.potfile
+import src.utils.metrics
+
+# JWT alg header value -> hashlib digest name
+HMAC_ALGORITHMS = {
+    'HS256': 'sha256',
+    'HS384': 'sha384',
+    'HS512': 'sha512',
+}
+
+# seconds between checkpoint writes
+CHECKPOINT_INTERVAL = 30
+
+# number of mask candidates handed to a worker at a time
+MASK_CHUNK_SIZE = 256 * 1024
+
+# per-worker state, populated by _init_worker so it is not pickled with every range
+_targets = None
+_cracked_flags = None
+_cracked_snapshot = None
+_active = None
+_batches = None
+
+
+def bruteforce(tokens: list, token_key: str, wordlist: str, processes: int, resume: bool = False,
+               checkpoint: str = None, rules: str = None, mask: str = None, mask_length: str = None,
+               potfile: str = None, serve: str = None, secret: str = None) -> dict:
+    """
+    Attempts to recover the HMAC signing keys of the provided tokens.
+
+    The potfile is checked first: tokens already cracked are answered instantly, tokens whose keyspace has already been
+    exhausted are skipped, and every key cracked in a previous run is tried as a first pass. A single key provided with
+    -tk is then tested in-process. Otherwise every key in the -D wordlist (mangled by every rule in the -R rule file,
+    if provided) or the --mask keyspace is tested using a process pool with one worker per core (or the number of
+    workers provided with -p). Every candidate is checked against all tokens not yet cracked, so the keyspace is only
+    read once no matter how many tokens are provided. With --serve, the keyspace is instead leased out to --worker
+    processes on other machines.
+    :param tokens: List of HS256/HS384/HS512 signed JWTs to attack.
+    :param token_key: Single signing key to test, or None.
+    :param wordlist: Path to a newline delimited list of signing keys, or None.
+    :param processes: Number of worker processes to use, or None for one per core.
+    :param resume: Continue a previously interrupted run from its checkpoint? T/F
+    :param checkpoint: Path to the checkpoint file, or None for the default location.
+    :param rules: Path to a hashcat-style rule file or name of a built-in rule set, or None.
+    :param mask: Mask describing the keyspace to test, e.g. ?l?l?d?d?s, or None.
+    :param mask_length: Range of candidate lengths to test for the mask, e.g. 1-6, or None for the full mask length.
+    :param potfile: Path to the potfile, or None to disable it.
+    :param serve: HOST:PORT to run a distributed coordinator on, or None to run locally.
+    :param secret: Shared secret the coordinator requires from workers, or None.
+    :return: Dictionary object containing the recovered keys (token -> key), keys tested, elapsed time and keys/sec.
+    """
+    targets, token_targets = prepare_targets(tokens)
+    source = None
+    if not token_key:
+        try:
+            if mask:
+                source = mask_source(mask, mask_length)
+            else:
+                if not os.path.isfile(wordlist):
+                    raise ValueError('Wordlist not found: ' + wordlist)
+                source = wordlist_source(wordlist, rules)
+        except ValueError as e:
+            src.utils.error_handler.print_error(str(e))
+
+    start = time.perf_counter()
+    keys = {}
+    skipped = set()
+    index = src.utils.potfile.load_potfile(potfile) if potfile else None
+    if index:
+        with src.utils.metrics.timer('bruteforce.potfile_seconds'):
+            keys, skipped = _check_potfile(index, targets, source)
+
+    # keys tested by an earlier run being resumed, excluded from keys/sec
+    resumed = 0
+    tested = 0
+    remaining = [i for i in range(len(targets)) if i not in keys and i not in skipped]
+    if remaining and token_key:
+        key = token_key.encode('utf-8')
+        keys.update({i: key for i in remaining if check_key(targets[i], key)})
+        tested = 1
+    elif remaining:
+        # checkpoints are tied to the whole set of tokens being attacked
+        token_set = '\n'.join(sorted(token for token, i in token_targets.items() if i in remaining))
+        checkpoint = checkpoint or src.utils.checkpoint.checkpoint_path(token_set, source_id(source))
+        start_offset = 0
+        if resume:
+            try:
+                start_offset, resumed = src.utils.checkpoint.load_checkpoint(checkpoint, token_set, source_id(source))
+            except ValueError as e:
+                src.utils.error_handler.print_error(str(e))
+
+        if serve:
+            # imported here since distributed imports this module
+            import src.utils.distributed
+            # one token per target, so workers can prepare the same target list
+            target_tokens = {i: token for token, i in token_targets.items()}
+            result = src.utils.distributed.serve(serve, [target_tokens[i] for i in remaining],
+                                                 [targets[i] for i in remaining], source, start_offset, resumed,
+                                                 (checkpoint, token_set), secret)
+        else:
+            result = crack([targets[i] for i in remaining], source, processes, start_offset, resumed,
+                           (checkpoint, token_set))
+        keys.update({remaining[i]: key for i, key in result['keys'].items()})
+        tested = result['tested']
+        # the run finished (keys found or keyspace exhausted), so there is nothing left to resume
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        if index and result['exhausted']:
+            fingerprint = source_fingerprint(source)
+            for i in remaining:
+                if i not in keys:
+                    src.utils.potfile.record_exhausted(index, targets[i], fingerprint)
+
+    if index:
+        for i, key in keys.items():
+            src.utils.potfile.record_cracked(index, targets[i], key)
+
+    elapsed = time.perf_counter() - start
+    result = {
+        'keys': {token: keys.get(i) for token, i in token_targets.items()},
+        'tested': tested,
+        'elapsed': elapsed,
+        'rate': (tested - resumed) / elapsed if elapsed else 0.0,
+    }
+    print_result(result)
+    return result
+
+
+def _check_potfile(index: dict, targets: list, source: dict) -> tuple:
+    # answers what it can from the potfile: (keys found by target index, target indexes already exhausted)
+    keys = {}
+    for i, target in enumerate(targets):
+        key = index['cracked'].get(src.utils.potfile.target_id(target))
+        if key is not None:
+            keys[i] = key
+    if keys:
+        print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Already cracked in potfile: '+Fore.CYAN+str(len(keys))+Fore.MAGENTA +
+              ' token(s)'+Style.RESET_ALL)
+
+    # previously cracked keys from any engagement are a tiny, high-yield first pass
+    for key in src.utils.potfile.known_keys(index):
+        for i, target in enumerate(targets):
+            if i not in keys and check_key(target, key):
+                keys[i] = key
+
+    skipped = set()
+    if source:
+        fingerprint = source_fingerprint(source)
+        skipped = {i for i, target in enumerate(targets) if i not in keys and
+                   fingerprint in index['exhausted'].get(src.utils.potfile.target_id(target), ())}
+        if skipped:
+            print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Keyspace already exhausted in potfile for: '+Fore.CYAN +
+                  str(len(skipped))+Fore.MAGENTA+' token(s), skipping'+Style.RESET_ALL)
+    return keys, skipped
+
+
+def load_tokens(tokens_file: str) -> list:
+    """
+    Reads a file of JWTs, one per line. Blank lines are skipped.
+
+    :param tokens_file: Path to the file of tokens.
+    :return: List of tokens.
+    """
+    if not os.path.isfile(tokens_file):
+        src.utils.error_handler.print_error('Tokens file not found: ' + tokens_file)
+    with open(tokens_file, 'r', encoding='utf-8', errors='replace') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def prepare_targets(tokens: list) -> tuple:
+    """
+    Prepares every token for bruteforcing, skipping (with a warning) any that are malformed or not HMAC signed.
+    Duplicate tokens are only attacked once.
+
+    :param tokens: List of JWTs.
+    :return: Tuple of (list of unique targets from prepare_target, dict of token -> index into the targets list).
+    """
+    targets = []
+    target_index = {}
+    token_targets = {}
+    for token in tokens:
+        try:
+            target = prepare_target(token)
+        except ValueError as e:
+            if len(tokens) == 1:
+                src.utils.error_handler.print_error(str(e))
+            print(Fore.RED+'➤  Skipping token '+_short_token(token)+': '+str(e)+Style.RESET_ALL)
+            continue
+        if target not in target_index:
+            target_index[target] = len(targets)
+            targets.append(target)
+        token_targets[token] = target_index[target]
+
+    if not targets:
+        src.utils.error_handler.print_error('No HS256/HS384/HS512 tokens to bruteforce.')
+    return targets, token_targets
+
+
+def prepare_target(token: str) -> tuple:
+    """
+    Splits the token into everything needed to test candidate keys, so that no Base64 or string handling is needed
+    per candidate.
+
+    :param token: The JWT to be attacked.
+    :return: Tuple of (hashlib digest name, signing input bytes, raw signature bytes).
+    """
+    try:
+        header, payload, signature = token.split('.')
+    except ValueError:
+        raise ValueError('JWT not in correct format. Expected: <header>.<payload>.<signature>')
+
+    try:
+        alg = src.utils.parse_token.base64_decode(header).get('alg')
+        signature_bytes = src.utils.parse_token.base64_decode_bytes(signature)
+    except (ValueError, AttributeError):
+        raise ValueError('JWT header or signature could not be decoded.')
+
+    if alg not in HMAC_ALGORITHMS:
+        raise ValueError('Unsupported algorithm for bruteforcing: ' + str(alg) + '. Supported: ' +
+                         ', '.join(HMAC_ALGORITHMS))
+
+    return HMAC_ALGORITHMS[alg], (header + '.' + payload).encode('ascii'), signature_bytes
+
+
+def check_key(target: tuple, key: bytes) -> bool:
+    """
+    Tests a single candidate key against a prepared target.
+
+    :param target: Tuple returned by prepare_target.
+    :param key: Candidate signing key as raw bytes.
+    :return: True if the key produces the token's signature, else False.
+    """
+    digest_name, signing_input, signature = target
+    return hmac.digest(key, signing_input, digest_name) == signature
+
+
+def wordlist_source(wordlist: str, rules: str = None) -> dict:
+    """
+    Describes a wordlist keyspace, addressed by byte offset into the wordlist.
+
+    :param wordlist: Path to a newline delimited list of signing keys.
+    :param rules: Path to a hashcat-style rule file or name of a built-in rule set, or None.
+    :return: Dictionary object describing the keyspace, small enough to send to every worker.
+    """
+    rule_lines = src.utils.rules.load_rules(rules) if rules else []
+    # compile once up front so a bad rule is reported before any workers start
+    src.utils.rules.compile_rules(rule_lines)
+    return {'type': 'wordlist', 'path': os.path.abspath(wordlist), 'rules': rule_lines}
+
+
+def mask_source(mask: str, mask_length: str = None) -> dict:
+    """
+    Describes a mask keyspace, addressed by candidate index.
+
+    :param mask: Mask describing the keyspace, e.g. ?l?l?d?d?s
+    :param mask_length: Range of candidate lengths, e.g. 1-6, or None for the full mask length.
+    :return: Dictionary object describing the keyspace, small enough to send to every worker.
+    """
+    positions = src.utils.mask.parse_mask(mask)
+    min_len, max_len = src.utils.mask.parse_lengths(mask_length, positions)
+    return {'type': 'mask', 'mask': mask, 'lengths': (min_len, max_len)}
+
+
+def source_id(source: dict) -> str:
+    """
+    Returns a string identifying the keyspace, including the wordlist size and modification time so a checkpoint is
+    never resumed against a wordlist that has since changed.
+
+    :param source: Dictionary object returned by wordlist_source or mask_source.
+    :return: Keyspace identifier string.
+    """
+    if source['type'] == 'mask':
+        return 'mask:{}:{}-{}'.format(source['mask'], *source['lengths'])
+    stat = os.stat(source['path'])
+    return 'wordlist:{}:{}:{}:{}'.format(source['path'], stat.st_size, stat.st_mtime_ns,
+                                         src.utils.rules.rules_hash(source['rules']))
+
+
+def source_fingerprint(source: dict) -> str:
+    """
+    Returns a fingerprint of the keyspace that is independent of where the wordlist is stored, used to record
+    exhausted keyspaces in the potfile.
+
+    :param source: Dictionary object returned by wordlist_source or mask_source.
+    :return: Keyspace fingerprint string.
+    """
+    if source['type'] == 'mask':
+        return source_id(source)
+    return 'wordlist:{}:{}'.format(src.utils.wordlist.fingerprint(source['path']),
+                                   src.utils.rules.rules_hash(source['rules']))
+
+
+def source_size(source: dict) -> int:
+    """
+    :param source: Dictionary object returned by wordlist_source or mask_source.
+    :return: Size of the keyspace, in wordlist bytes or mask candidates.
+    """
+    if source['type'] == 'mask':
+        positions = src.utils.mask.parse_mask(source['mask'])
+        return src.utils.mask.keyspace_size(src.utils.mask.keyspace(positions, *source['lengths']))
+    return os.path.getsize(source['path'])
+
+
+def source_ranges(source: dict, start: int = 0, end: int = None, chunk_size: int = None):
+    """
+    Splits the keyspace (or the part of it between start and end) into contiguous (start, end) ranges. Wordlist ranges
+    always start and end on line boundaries.
+
+    :param source: Dictionary object returned by wordlist_source or mask_source.
+    :param start: Offset to start from.
+    :param end: Offset to stop at, or None for the end of the keyspace.
+    :param chunk_size: Approximate size of each range, or None for the default size handed to a single worker.
+    :return: Generator of (start, end) tuples.
+    """
+    end = source_size(source) if end is None else end
+    if source['type'] == 'mask':
+        chunk_size = chunk_size or MASK_CHUNK_SIZE
+        for i in range(start, end, chunk_size):
+            yield i, min(i + chunk_size, end)
+        return
+
+    mm = src.utils.wordlist.open_wordlist(source['path'])
+    try:
+        yield from src.utils.wordlist.chunk_ranges(mm, start, chunk_size or src.utils.wordlist.CHUNK_SIZE, end)
+    finally:
+        if mm is not None:
+            mm.close()
+
+
+def crack(targets: list, source: dict, processes: int = None, start_offset: int = 0, tested: int = 0,
+          checkpoint: tuple = None, end_offset: int = None, cracked_flags=None) -> dict:
+    """
+    Tests every key in the keyspace against every target, spreading ranges of the keyspace across a process pool.
+
+    Only the (start, end) offsets of each range are sent to the workers, which map the wordlist or expand the mask
+    themselves, and only a bounded number of ranges are in flight at a time. Cracked targets are shared with every
+    worker through a flag array so they are dropped from the active set straight away, and every worker stops as soon
+    as all targets are cracked.
+    :param targets: List of targets returned by prepare_target.
+    :param source: Dictionary object returned by wordlist_source or mask_source.
+    :param processes: Number of worker processes to use, or None for one per core.
+    :param start_offset: Offset into the keyspace to start from, used when resuming from a checkpoint.
+    :param tested: Number of keys already tested before start_offset, used when resuming from a checkpoint.
+    :param checkpoint: Tuple of (checkpoint path, checkpoint token string) to periodically save progress to, or None.
+    :param end_offset: Offset into the keyspace to stop at, or None for the end of the keyspace.
+    :param cracked_flags: Shared flag array (one byte per target) to use, so targets cracked elsewhere can be dropped
+                          while the run is in progress, or None.
+    :return: Dictionary object containing the recovered keys (target index -> key), keys tested, elapsed time, end
+             offset and whether the whole keyspace (up to end_offset) was tested.
+    """
+    processes = processes or os.cpu_count() or 1
+    if cracked_flags is None:
+        cracked_flags = multiprocessing.Array('b', len(targets), lock=False)
+    keys = {}
+    offset = start_offset
+    resumed = tested
+    # seconds spent by the workers generating candidates and checking them, summed across workers
+    stage_seconds = [0.0, 0.0]
+    start = time.perf_counter()
+    last_report = last_checkpoint = start
+    size = source_size(source) if end_offset is None else end_offset
+    ranges = source_ranges(source, start_offset, size)
+
+    try:
+        with multiprocessing.Pool(processes, initializer=_init_worker,
+                                  initargs=(targets, cracked_flags, source)) as pool:
+            pending = collections.deque()
+            exhausted = False
+            while pending or not exhausted:
+                # keep every worker busy without queueing more than a few ranges
+                while not exhausted and len(pending) < processes * 4:
+                    key_range = next(ranges, None)
+                    if key_range is None:
+                        exhausted = True
+                    else:
+                        pending.append((key_range, pool.apply_async(_check_range, key_range)))
+                if not pending:
+                    break
+
+                # results are collected in order, so everything below range_end has been tested
+                (range_start, range_end), result = pending.popleft()
+                found, count, timings = result.get()
+                tested += count
+                stage_seconds[0] += timings[0]
+                stage_seconds[1] += timings[1]
+                _record_range(source, range_end - range_start, count, timings)
+                for target_id, key in found:
+                    keys.setdefault(target_id, key)
+                    cracked_flags[target_id] = 1
+                # every target cracked, here or (via cracked_flags) elsewhere
+                if all(cracked_flags):
+                    # workers set the flags themselves, so the key that cracked the last target may still be in a
+                    # later result. The other workers see the flags and stop at their next batch, so this is quick.
+                    for (later_start, later_end), later in pending:
+                        found, count, timings = later.get()
+                        tested += count
+                        _record_range(source, later_end - later_start, count, timings)
+                        for target_id, key in found:
+                            keys.setdefault(target_id, key)
+                    break
+                offset = range_end
+
+                now = time.perf_counter()
+                if now - last_report >= 1:
+                    last_report = now
+                    _print_progress(tested, tested - resumed, now - start, offset - start_offset, size - offset)
+                    _record_rates(source, tested - resumed, now - start, offset - start_offset, stage_seconds)
+                if checkpoint and now - last_checkpoint >= CHECKPOINT_INTERVAL:
+                    last_checkpoint = now
+                    src.utils.checkpoint.save_checkpoint(checkpoint[0], checkpoint[1], source_id(source), offset,
+                                                         tested)
+            # leaving the context manager terminates any workers still running
+    except KeyboardInterrupt:
+        if not checkpoint:
+            raise
+        src.utils.checkpoint.save_checkpoint(checkpoint[0], checkpoint[1], source_id(source), offset, tested)
+        print()
+        src.utils.error_handler.print_error('Interrupted. Progress saved to ' + checkpoint[0] +
+                                            ', continue with --resume.')
+    finally:
+        ranges.close()
+        _record_rates(source, tested - resumed, time.perf_counter() - start, offset - start_offset, stage_seconds)
+
+    if sys.stdout.isatty():
+        print()
+    return {'keys': keys, 'tested': tested, 'elapsed': time.perf_counter() - start, 'offset': offset,
+            'exhausted': offset >= size}
+
+
+def _init_worker(targets: list, cracked_flags, source: dict):
+    global _targets, _cracked_flags, _cracked_snapshot, _active, _batches
+    _targets = targets
+    _cracked_flags = cracked_flags
+    _cracked_snapshot = None
+    _active = None
+    _batches = _source_batches(source)
+
+
+def _active_targets() -> list:
+    # regroups the uncracked targets whenever the shared flags change:
+    # [(digest name, [(signing input, {signature: target index}), ...]), ...]
+    global _cracked_snapshot, _active
+    snapshot = bytes(_cracked_flags)
+    if snapshot != _cracked_snapshot:
+        groups = {}
+        for target_id, (digest_name, signing_input, signature) in enumerate(_targets):
+            if not snapshot[target_id]:
+                messages = groups.setdefault(digest_name, {})
+                # tokens sharing a signing input only need a single HMAC per candidate
+                messages.setdefault(signing_input, {})[signature] = target_id
+        _active = [(digest_name, list(messages.items())) for digest_name, messages in groups.items()]
+        _cracked_snapshot = snapshot
+    return _active
+
+
+def _source_batches(source: dict):
+    # builds the per-worker function that turns a (start, end) range into batches of candidates
+    if source['type'] == 'mask':
+        positions = src.utils.mask.parse_mask(source['mask'])
+        segments = src.utils.mask.keyspace(positions, *source['lengths'])
+
+        def mask_batches(start: int, end: int):
+            return src.utils.mask.iter_batches(positions, segments, start, end)
+        return mask_batches
+
+    # each worker maps the wordlist and compiles the rules once, the OS page cache is shared between them
+    mm = src.utils.wordlist.open_wordlist(source['path'])
+    program = src.utils.rules.compile_rules(source['rules'])
+
+    def wordlist_batches(start: int, end: int):
+        words = src.utils.wordlist.iter_lines(mm, start, end)
+        return src.utils.rules.iter_batches(words, program) if program else (words,)
+    return wordlist_batches
+
+
+def _check_range(start: int, end: int) -> tuple:
+    # returns (hits, keys tested, (seconds generating candidates, seconds checking them)), timed per batch so the
+    # clock is only read twice per few thousand keys
+    active = _active_targets()
+    found = []
+    tested = 0
+    generate_seconds = check_seconds = 0.0
+    clock = time.perf_counter
+    mark = clock()
+    for batch in _batches(start, end):
+        generated = clock()
+        generate_seconds += generated - mark
+        # all targets cracked (possibly by another worker), don't waste time on the rest of this range
+        if not active:
+            break
+        hits = _check_batch(batch, active)
+        tested += len(batch)
+        if hits:
+            for target_id, key in hits:
+                _cracked_flags[target_id] = 1
+            found.extend(hits)
+        active = _active_targets()
+        mark = clock()
+        check_seconds += mark - generated
+    return found, tested, (generate_seconds, check_seconds)
+
+
+def _check_batch(batch: list, active: list) -> list:
+    hits = []
+    if len(active) == 1 and len(active[0][1]) == 1:
+        # a single signing input, the one-shot digest is the fastest path
+        digest_name, ((signing_input, signatures),) = active[0]
+        digest = hmac.digest
+        for key in batch:
+            target_id = signatures.get(digest(key, signing_input, digest_name))
+            if target_id is not None:
+                hits.append((target_id, key))
+        return hits
+
+    new = hmac.new
+    for key in batch:
+        for digest_name, messages in active:
+            # the key pads are computed once per algorithm, then copied for every signing input
+            keyed = new(key, digestmod=digest_name)
+            for signing_input, signatures in messages:
+                mac = keyed.copy()
+                mac.update(signing_input)
+                target_id = signatures.get(mac.digest())
+                if target_id is not None:
+                    hits.append((target_id, key))
+    return hits
+
+
+def _record_range(source: dict, range_size: int, count: int, timings: tuple):
+    src.utils.metrics.increment('bruteforce.ranges')
+    src.utils.metrics.increment('bruteforce.keys_tested', count)
+    src.utils.metrics.increment('bruteforce.generate_seconds', timings[0])
+    src.utils.metrics.increment('bruteforce.check_seconds', timings[1])
+    if source['type'] == 'wordlist':
+        src.utils.metrics.increment('bruteforce.wordlist_bytes', range_size)
+
+
+def _record_rates(source: dict, tested: int, elapsed: float, covered: int, stage_seconds: list):
+    # overall rates, plus the rate of each stage per worker - the lower of the two stage rates is the bottleneck
+    if not elapsed:
+        return
+    src.utils.metrics.set_gauge('bruteforce.keys_per_second', tested / elapsed)
+    if source['type'] == 'wordlist':
+        src.utils.metrics.set_gauge('bruteforce.wordlist_bytes_per_second', covered / elapsed)
+    if stage_seconds[0]:
+        src.utils.metrics.set_gauge('bruteforce.candidates_per_second_per_worker', tested / stage_seconds[0])
+    if stage_seconds[1]:
+        src.utils.metrics.set_gauge('bruteforce.hmac_checks_per_second_per_worker', tested / stage_seconds[1])
+
+
+def _print_progress(tested: int, tested_this_run: int, elapsed: float, covered: int, remaining: int):
+    # covered and remaining are keyspace offsets (bytes or mask indexes), so percentage and ETA are simple arithmetic
+    if sys.stdout.isatty():
+        percent = 100 * covered / (covered + remaining) if covered + remaining else 100.0
+        eta = int(remaining * elapsed / covered) if covered else 0
+        print('\r' + Fore.CYAN + '➤  ' + Fore.MAGENTA + 'Tested: ' + Fore.CYAN + str(tested) + Fore.MAGENTA +
+              ' (' + str(int(tested_this_run / elapsed)) + ' keys/sec, ' + '{:.1f}'.format(percent) + '%, ETA ' +
+              time.strftime('%H:%M:%S', time.gmtime(eta)) + ')' + Style.RESET_ALL, end='', flush=True)
+
+
+def print_result(result: dict):
+    """
+    Outputs the recovered keys (if any) and throughput of the bruteforce run to the terminal
+
+    :param result: Dictionary object returned by bruteforce
+    :return: None
+    """
+    keys = result['keys']
+    if len(keys) == 1:
+        key = next(iter(keys.values()))
+        if key is not None:
+            print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Signing key found: '+Fore.CYAN+_decode_key(key)+Style.RESET_ALL)
+        else:
+            print(Fore.RED+'➤  Signing key not found.'+Style.RESET_ALL)
+    else:
+        for token, key in keys.items():
+            if key is not None:
+                print(Fore.CYAN+'➤  '+Fore.MAGENTA+_short_token(token)+': '+Fore.CYAN+_decode_key(key)+Style.RESET_ALL)
+        cracked = sum(key is not None for key in keys.values())
+        print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Tokens cracked: '+Fore.CYAN+str(cracked)+Fore.MAGENTA+' of '+Fore.CYAN +
+              str(len(keys))+Style.RESET_ALL)
+    print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Keys tested: '+Fore.CYAN+str(result['tested'])+Fore.MAGENTA+' in ' +
+          Fore.CYAN+'{:.2f}s'.format(result['elapsed'])+Fore.MAGENTA+' (' +
+          Fore.CYAN+'{:,.0f}'.format(result['rate'])+Fore.MAGENTA+' keys/sec)'+Style.RESET_ALL)
+    print()
+
+
+def _decode_key(key: bytes) -> str:
+    return key.decode('utf-8', errors='backslashreplace')
+
+
+def _short_token(token: str) -> str:
+    return token if len(token) <= 40 else token[:18] + '...' + token[-18:]
@@ -0,0 +1,91 @@
+"""
+checkpoint.py
+
+This file contains the checkpoint files that allow an interrupted bruteforce to be resumed. A checkpoint records the
+offset into the keyspace (a byte offset into a wordlist, or a mask index) below which every candidate has been tested,
+and is tied to the token and keyspace it was created for.
+
+Functions:
+- token_hash: Returns the hash used to tie a checkpoint to the token being attacked.
+- checkpoint_path: Returns the default checkpoint file location for a token and keyspace pair.
+- save_checkpoint: Atomically writes the current offset of a bruteforce run to disk.
+- load_checkpoint: Reads a checkpoint file and returns the offset to resume from.
+"""
+
+import os
+import json
+import hashlib
+
+
+def token_hash(token: str) -> str:
+    """
+    Hashes the token being attacked so checkpoints can be matched to it without storing the token itself.
+
+    :param token: The JWT being attacked.
+    :return: Hex encoded SHA-256 hash of the token.
+    """
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def checkpoint_path(token: str, source_id: str) -> str:
+    """
+    Returns the default checkpoint location, ~/.jwtjuggernaut/checkpoints/<hash>.json, where the hash covers both the
+    token and the keyspace so separate runs never share a checkpoint.
+
+    :param token: The JWT being attacked.
+    :param source_id: String identifying the keyspace (wordlist and rules, or mask) being tested.
+    :return: Path to the checkpoint file.
+    """
+    name = hashlib.sha256((token + '\0' + source_id).encode('utf-8')).hexdigest()[:32]
+    return os.path.join(os.path.expanduser('~'), '.jwtjuggernaut', 'checkpoints', name + '.json')
+
+
+def save_checkpoint(path: str, token: str, source_id: str, offset: int, tested: int):
+    """
+    Writes the checkpoint to a temporary file and renames it into place, so a job killed mid-write never leaves a
+    corrupt checkpoint behind.
+
+    :param path: Path to the checkpoint file.
+    :param token: The JWT being attacked.
+    :param source_id: String identifying the keyspace being tested.
+    :param offset: Offset below which every candidate has been tested.
+    :param tested: Number of candidates tested so far.
+    :return: None
+    """
+    if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    checkpoint = {
+        'token_hash': token_hash(token),
+        'source': source_id,
+        'offset': offset,
+        'tested': tested,
+    }
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as jsonfile:
+        json.dump(checkpoint, jsonfile, indent=4)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path: str, token: str, source_id: str) -> tuple:
+    """
+    Reads the checkpoint file and validates that it belongs to the same token and an unchanged keyspace.
+
+    :param path: Path to the checkpoint file.
+    :param token: The JWT being attacked.
+    :param source_id: String identifying the keyspace being tested.
+    :return: Tuple of (offset, candidates tested) to resume from.
+    """
+    if not os.path.exists(path):
+        raise ValueError('No checkpoint found at ' + path)
+
+    with open(path, 'r', encoding='utf-8') as jsonfile:
+        checkpoint = json.load(jsonfile)
+
+    if checkpoint.get('token_hash') != token_hash(token):
+        raise ValueError('Checkpoint ' + path + ' was created for a different token.')
+    if checkpoint.get('source') != source_id:
+        raise ValueError('Checkpoint ' + path + ' was created for a different (or since modified) wordlist, rule set '
+                         'or mask.')
+
+    return int(checkpoint['offset']), int(checkpoint.get('tested', 0))
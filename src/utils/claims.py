@@ -0,0 +1,67 @@
+"""
+claims.py
+
+This file contains the claim definitions table used to add details to decoded tokens (read -d). The definitions are
+read from the snapshot shipped in src/data/claims.json the first time they are needed and then kept for the rest of
+the process, so decoding many tokens only loads the file once and never needs network access. The snapshot is only
+refreshed when the update subcommand is run (see data_updater.py).
+
+Functions:
+- load_claims: Loads the claims snapshot once per process and returns it as a read-only table.
+- claim_index: Returns the case-folded lookup index of the claims table.
+- lookup_claim: Returns the definition of a single claim name, if it has one.
+"""
+
+import os
+import json
+import types
+import functools
+
+# snapshot of the IANA JSON Web Token Claims registry, shipped with the tool and refreshed by data_updater.py
+CLAIMS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'claims.json')
+
+CUSTOM_CLAIM = '**Custom Claim**'
+
+
+@functools.lru_cache(maxsize=None)
+def load_claims() -> types.MappingProxyType:
+    """
+    Reads the claims snapshot. The result is cached, so the file is only read the first time this is called.
+
+    :return: Read-only mapping with the snapshot's source, last_updated date and claims (claim name -> definition).
+    """
+    try:
+        with open(CLAIMS_PATH, 'r', encoding='utf-8') as jsonfile:
+            data = json.load(jsonfile)
+    except (OSError, ValueError):
+        # a missing or damaged snapshot only means there are no definitions to show
+        data = {}
+
+    return types.MappingProxyType({
+        'source': data.get('source'),
+        'last_updated': data.get('last_updated'),
+        'claims': types.MappingProxyType(dict(data.get('claims', {}))),
+    })
+
+
+@functools.lru_cache(maxsize=None)
+def claim_index() -> types.MappingProxyType:
+    """
+    Builds the case-insensitive lookup index of the claims table, so 'EXP', 'Exp' and 'exp' all find the same
+    definition. Where two registered names only differ by case, the first one in the snapshot wins.
+
+    :return: Read-only mapping of case-folded claim name -> definition.
+    """
+    index = {}
+    for name, definition in load_claims()['claims'].items():
+        index.setdefault(name.casefold(), definition)
+    return types.MappingProxyType(index)
+
+
+def lookup_claim(name: str, default: str = CUSTOM_CLAIM) -> str:
+    """
+    :param name: Claim name from a JWT header or payload.
+    :param default: Value to return if the claim is not in the table.
+    :return: Definition of the claim, or the default if it is not a registered claim.
+    """
+    return claim_index().get(name.casefold(), default)
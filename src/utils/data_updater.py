@@ -1,8 +1,9 @@
 """
 data_updater.py
 
-This script intends to automate as much of the updating of the data stored in the data/ folder as possible and will
-run @TODO how often? to keep JWTJuggernaut's data up-to-date.
+This script intends to automate as much of the updating of the data stored in the src/data/ folder as possible. It is
+never run implicitly: the snapshot in src/data/claims.json ships with the tool, and is only refreshed from IANA.org when
+the update subcommand (or this script) is run.
 
 Functions:
 - scrape_jwt_claims: Scrapes the officially defined JWT claims from IANA.org
@@ -15,6 +16,8 @@ import requests
 from bs4 import BeautifulSoup
 from datetime import datetime
 
+import src.utils.claims
+
 
 def scrape_jwt_claims(url) -> dict:
     """
@@ -25,7 +28,8 @@ def scrape_jwt_claims(url) -> dict:
     :param url: The URL from which to scrape JWT claims information.
     :return: A dictionary with JWT claims as keys and their descriptions as values.
     """
-    response = requests.get(url)
+    response = requests.get(url, timeout=30)
+    response.raise_for_status()
     soup = BeautifulSoup(response.content, 'html.parser')
 
     # Find the table by ID
@@ -67,28 +71,38 @@ def main():
     """
     Main function to orchestrate the data updating process (currently, only the JWT claims updating process).
 
-    Calls scrape_jwt_claims to fetch the latest JWT claims data from the official source and updates data/claims.json. The function also sets the current date as the last updated date in the JSON file.
+    Calls scrape_jwt_claims to fetch the latest JWT claims data from the official source and updates src/data/claims.json. The function also sets the current date as the last updated date in the JSON file.
 
-    :return: None
+    :return: The new contents of src/data/claims.json
     """
     url = 'https://www.iana.org/assignments/jwt/jwt.xhtml'
     claims = scrape_jwt_claims(url)
+    if len(claims) <= 3:
+        # only the manual entries were found, so the page layout has changed - keep the existing snapshot
+        raise ValueError('No JWT claims found at ' + url)
     json_data = {
         "source": url,
         "last_updated": datetime.now().strftime("%Y-%m-%d"),
         "claims": claims
     }
 
-    # Define the file path using os.path.join for cross-platform compatibility
-    file_path = os.path.join('data', 'claims.json')
+    # Always write the snapshot shipped with the tool, regardless of the current working directory
+    file_path = src.utils.claims.CLAIMS_PATH
 
     # Check if the file exists
     if not os.path.exists(os.path.dirname(file_path)):
         # If the directory does not exist, create it
         os.makedirs(os.path.dirname(file_path))
 
-    with open(file_path, 'w', encoding='utf-8') as jsonfile:
+    # Write to a temporary file first so an interrupted update never leaves a damaged snapshot behind
+    with open(file_path + '.tmp', 'w', encoding='utf-8') as jsonfile:
         json.dump(json_data, jsonfile, indent=4)
+    os.replace(file_path + '.tmp', file_path)
+
+    # Drop the cached table so the rest of this process sees the new definitions
+    src.utils.claims.load_claims.cache_clear()
+    src.utils.claims.claim_index.cache_clear()
+    return json_data
 
 
 if __name__ == "__main__":
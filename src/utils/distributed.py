@@ -0,0 +1,420 @@
+"""
+distributed.py
+
+This file contains the distributed mode of the bruteforce subcommand. A coordinator (bruteforce --serve) splits the
+keyspace into leases - wordlist byte ranges or mask index ranges - and any number of workers (bruteforce --worker)
+pull leases, test them on all of their local cores using the same engine as a local run, and report the results.
+
+Workers renew their lease while testing it. A lease that is not renewed within LEASE_TTL seconds (e.g. because the
+worker died) expires and is handed to the next worker that asks. Every renewal also tells the worker which targets
+have been cracked elsewhere, so a found key stops the whole cluster.
+
+The coordinator hands out the target tokens and cracked keys, so it listens on 127.0.0.1 unless another host is given.
+With --secret every request must carry the same shared secret. A coordinator bound to any other interface without
+one generates a secret and prints it, to be passed to the workers with --secret.
+
+The protocol is one JSON request and one JSON response per TCP connection, each terminated by a newline.
+Every request also carries "secret" when the coordinator has one:
+    {"op": "job"}                                      -> tokens, keyspace source and cracked targets
+    {"op": "lease", "worker": id}                      -> a lease, a request to wait, or done
+    {"op": "renew", "worker": id, "lease": id}         -> whether the lease is still held, cracked targets, done
+    {"op": "report", "worker": id, "lease": id, ...}   -> tested count and found keys for a lease
+
+Functions:
+- parse_address: Parses a HOST:PORT (or PORT) string.
+- is_loopback: Checks if a host only accepts local connections.
+- serve: Runs the coordinator until every target is cracked or the keyspace is exhausted.
+- work: Runs a worker until the coordinator reports the job is done.
+"""
+
+import os
+import sys
+import json
+import time
+import hmac
+import uuid
+import socket
+import secrets
+import ipaddress
+import threading
+import collections
+import socketserver
+import multiprocessing
+from colorama import Fore, Style
+
+import src.utils.bruteforce
+import src.utils.checkpoint
+import src.utils.error_handler
+
+# seconds a lease is held without being renewed before it is handed to another worker
+LEASE_TTL = 60
+
+# size of each lease, in wordlist bytes or mask candidates
+WORDLIST_LEASE_SIZE = 16 * 1024 * 1024
+MASK_LEASE_SIZE = 16 * 1024 * 1024
+
+# seconds a worker waits before asking again when every remaining lease is held by another worker
+WAIT_INTERVAL = 2
+
+# longest the coordinator keeps answering after the job is done, so polling workers learn that it is over. It stops
+# sooner once every known worker has been told
+SHUTDOWN_GRACE = LEASE_TTL // 3 + WAIT_INTERVAL
+
+SOCKET_TIMEOUT = 30
+
+
+def parse_address(address: str, default_host: str = '127.0.0.1') -> tuple:
+    """
+    Parses a HOST:PORT string, or a PORT on its own.
+
+    :param address: Address string, e.g. 0.0.0.0:9999 or 9999
+    :param default_host: Host to use when only a port is provided.
+    :return: Tuple of (host, port).
+    """
+    host, _, port = address.rpartition(':')
+    try:
+        return host or default_host, int(port)
+    except ValueError:
+        raise ValueError('Address must be in the format HOST:PORT, e.g. 127.0.0.1:9999')
+
+
+def is_loopback(host: str) -> bool:
+    """
+    Checks if a host only accepts connections from this machine.
+
+    :param host: Host name or IP address.
+    :return: True if the host is localhost or a loopback address, False otherwise.
+    """
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def serve(address: str, tokens: list, targets: list, source: dict, start_offset: int = 0, tested: int = 0,
+          checkpoint: tuple = None, secret: str = None) -> dict:
+    """
+    Runs the coordinator. The keyspace is handed out as leases to workers until every target is cracked or every
+    lease has been completed, then the coordinator keeps answering until every worker has been told the job is done
+    (or for at most SHUTDOWN_GRACE seconds).
+
+    :param address: HOST:PORT (or PORT, to listen on 127.0.0.1) to listen on.
+    :param tokens: List of tokens (one per target) sent to the workers.
+    :param targets: List of targets returned by bruteforce.prepare_target, in the same order as tokens.
+    :param source: Dictionary object returned by bruteforce.wordlist_source or bruteforce.mask_source.
+    :param start_offset: Offset into the keyspace to start from, used when resuming from a checkpoint.
+    :param tested: Number of keys already tested before start_offset, used when resuming from a checkpoint.
+    :param checkpoint: Tuple of (checkpoint path, checkpoint token string) to periodically save progress to, or None.
+    :param secret: Shared secret workers must send with every request, or None. One is generated when listening on
+        anything but a loopback address without one.
+    :return: Dictionary object in the same format as bruteforce.crack.
+    """
+    try:
+        host, port = parse_address(address)
+        if not secret and not is_loopback(host):
+            secret = secrets.token_hex(16)
+            print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Listening beyond localhost, workers must join with '+Fore.CYAN +
+                  '--secret '+secret+Style.RESET_ALL)
+        server = _Server((host, port), _Handler)
+    except (ValueError, OSError) as e:
+        src.utils.error_handler.print_error('Could not listen on ' + address + ': ' + str(e))
+    state = _Coordinator(tokens, targets, source, start_offset, tested, secret)
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Coordinator listening on '+Fore.CYAN+'{}:{}'.format(*server.server_address) +
+          Fore.MAGENTA+', '+Fore.CYAN+str(state.size)+Fore.MAGENTA+' keyspace to lease'+Style.RESET_ALL)
+
+    start = time.perf_counter()
+    last_checkpoint = start
+    try:
+        while not state.done():
+            time.sleep(1)
+            now = time.perf_counter()
+            with state.lock:
+                state.expire_leases()
+                offset, count, workers = state.offset, state.tested, len(state.workers)
+            if sys.stdout.isatty():
+                print('\r' + Fore.CYAN + '➤  ' + Fore.MAGENTA + 'Workers: ' + Fore.CYAN + str(workers) +
+                      Fore.MAGENTA + ', tested: ' + Fore.CYAN + str(count) + Fore.MAGENTA + ' (' +
+                      str(int((count - tested) / (now - start))) + ' keys/sec, ' +
+                      '{:.1f}'.format(100 * offset / state.size if state.size else 100.0) + '%)' + Style.RESET_ALL,
+                      end='', flush=True)
+            if checkpoint and now - last_checkpoint >= src.utils.bruteforce.CHECKPOINT_INTERVAL:
+                last_checkpoint = now
+                src.utils.checkpoint.save_checkpoint(checkpoint[0], checkpoint[1],
+                                                     src.utils.bruteforce.source_id(source), offset, count)
+        # keep answering until every worker has heard that the job is done. Workers that died between leases never
+        # ask again, so this is bounded by SHUTDOWN_GRACE
+        deadline = time.perf_counter() + SHUTDOWN_GRACE
+        while time.perf_counter() < deadline:
+            with state.lock:
+                state.expire_leases()
+                if state.workers <= state.notified:
+                    break
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        if not checkpoint:
+            raise
+        src.utils.checkpoint.save_checkpoint(checkpoint[0], checkpoint[1], src.utils.bruteforce.source_id(source),
+                                             state.offset, state.tested)
+        print()
+        src.utils.error_handler.print_error('Interrupted. Progress saved to ' + checkpoint[0] +
+                                            ', continue with --resume.')
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    if sys.stdout.isatty():
+        print()
+    return {'keys': dict(state.keys), 'tested': state.tested, 'elapsed': time.perf_counter() - start,
+            'offset': state.offset, 'exhausted': state.offset >= state.size}
+
+
+def work(address: str, processes: int = None, wordlist: str = None, secret: str = None):
+    """
+    Runs a worker. Leases are pulled from the coordinator and tested with bruteforce.crack on every local core, while a
+    background thread renews the lease and drops targets cracked elsewhere. Returns once the coordinator reports that
+    the job is done (or can no longer be reached).
+
+    :param address: HOST:PORT of the coordinator.
+    :param processes: Number of worker processes to use, or None for one per core.
+    :param wordlist: Local path of the coordinator's wordlist, or None if it is at the same path on this machine.
+    :param secret: Shared secret the coordinator was started with, or None.
+    :return: None
+    """
+    try:
+        coordinator = _Connection(parse_address(address), secret)
+    except ValueError as e:
+        src.utils.error_handler.print_error(str(e))
+    worker_id = socket.gethostname() + '-' + uuid.uuid4().hex[:8]
+    try:
+        job = coordinator.request({'op': 'job', 'worker': worker_id})
+    except (OSError, ValueError) as e:
+        src.utils.error_handler.print_error('Could not reach coordinator ' + address + ': ' + str(e))
+    if 'error' in job:
+        src.utils.error_handler.print_error('Coordinator ' + address + ' refused the worker: ' + job['error'])
+
+    targets = [src.utils.bruteforce.prepare_target(token) for token in job['tokens']]
+    source = job['source']
+    if source['type'] == 'wordlist':
+        source['path'] = os.path.abspath(wordlist or source['path'])
+        if not os.path.isfile(source['path']):
+            src.utils.error_handler.print_error('Wordlist not found: ' + source['path'] +
+                                                ' (provide the local copy of the coordinator\'s wordlist with -D)')
+        if src.utils.bruteforce.source_fingerprint(source) != job['fingerprint']:
+            src.utils.error_handler.print_error('Local wordlist ' + source['path'] +
+                                                ' does not match the coordinator\'s wordlist.')
+
+    print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Worker '+Fore.CYAN+worker_id+Fore.MAGENTA+' joined coordinator '+Fore.CYAN +
+          address+Fore.MAGENTA+' ('+str(len(targets))+' token(s))'+Style.RESET_ALL)
+
+    message = 'Coordinator reports the job is done, worker exiting.'
+    while True:
+        try:
+            response = coordinator.request({'op': 'lease', 'worker': worker_id})
+        except (OSError, ValueError):
+            # the coordinator has shut down, there is nothing left to do
+            message = 'Coordinator can no longer be reached, worker exiting.'
+            break
+        if response.get('done'):
+            break
+        if 'lease' not in response:
+            time.sleep(response.get('wait', WAIT_INTERVAL))
+            continue
+
+        lease = response['lease']
+        cracked_flags = multiprocessing.Array('b', len(targets), lock=False)
+        for target_id in response.get('cracked', ()):
+            cracked_flags[target_id] = 1
+        stop = threading.Event()
+        renewer = threading.Thread(target=_renew, args=(coordinator, worker_id, lease['id'], cracked_flags, stop),
+                                   daemon=True)
+        renewer.start()
+        try:
+            result = src.utils.bruteforce.crack(targets, source, processes, lease['start'], 0, None, lease['end'],
+                                                cracked_flags)
+        finally:
+            stop.set()
+            renewer.join()
+
+        print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Lease '+Fore.CYAN+str(lease['id'])+Fore.MAGENTA+' ['+str(lease['start']) +
+              ', '+str(lease['end'])+'): '+Fore.CYAN+str(result['tested'])+Fore.MAGENTA+' keys tested, ' +
+              Fore.CYAN+str(len(result['keys']))+Fore.MAGENTA+' found'+Style.RESET_ALL)
+        report = {
+            'op': 'report',
+            'worker': worker_id,
+            'lease': lease['id'],
+            'tested': result['tested'],
+            'found': [[target_id, key.hex()] for target_id, key in result['keys'].items()],
+            'complete': result['exhausted'],
+        }
+        try:
+            coordinator.request(report)
+        except (OSError, ValueError):
+            message = 'Coordinator can no longer be reached, worker exiting.'
+            break
+
+    print(Fore.CYAN+'➤  '+Fore.MAGENTA+message+Style.RESET_ALL)
+
+
+def _renew(coordinator, worker_id: str, lease_id: int, cracked_flags, stop):
+    # renews the lease until stopped, setting the flags of targets cracked elsewhere. If the lease is lost or the job is
+    # done, every flag is set so the local run stops straight away
+    while not stop.wait(LEASE_TTL / 3):
+        try:
+            response = coordinator.request({'op': 'renew', 'worker': worker_id, 'lease': lease_id})
+        except (OSError, ValueError):
+            continue
+        for target_id in response.get('cracked', ()):
+            cracked_flags[target_id] = 1
+        if response.get('done') or not response.get('ok'):
+            for target_id in range(len(cracked_flags)):
+                cracked_flags[target_id] = 1
+            return
+
+
+class _Connection:
+    # address of the coordinator and the secret to send with every request
+
+    def __init__(self, address: tuple, secret: str = None):
+        self.address = address
+        self.secret = secret
+
+    def request(self, message: dict) -> dict:
+        if self.secret:
+            message = dict(message, secret=self.secret)
+        with socket.create_connection(self.address, timeout=SOCKET_TIMEOUT) as sock:
+            sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+            with sock.makefile('rb') as f:
+                line = f.readline()
+        if not line:
+            raise ValueError('Empty response from coordinator')
+        return json.loads(line)
+
+
+class _Coordinator:
+    # shared coordinator state, every access is made while holding lock
+
+    def __init__(self, tokens: list, targets: list, source: dict, start_offset: int, tested: int,
+                 secret: str = None):
+        self.lock = threading.Lock()
+        self.secret = secret
+        self.tokens = tokens
+        self.targets = targets
+        self.source = source
+        self.fingerprint = src.utils.bruteforce.source_fingerprint(source)
+        self.size = src.utils.bruteforce.source_size(source)
+        lease_size = MASK_LEASE_SIZE if source['type'] == 'mask' else WORDLIST_LEASE_SIZE
+        self.fresh = src.utils.bruteforce.source_ranges(source, start_offset, self.size, lease_size)
+        self.requeued = collections.deque()
+        self.active = {}
+        self.completed = {}
+        self.next_id = 0
+        self.offset = start_offset
+        self.tested = tested
+        self.keys = {}
+        self.workers = set()
+        # workers that have been told the job is done
+        self.notified = set()
+
+    def authorized(self, message: dict) -> bool:
+        if not self.secret:
+            return True
+        return hmac.compare_digest(str(message.get('secret', '')).encode('utf-8'), self.secret.encode('utf-8'))
+
+    def all_cracked(self) -> bool:
+        return len(self.keys) == len(self.targets)
+
+    def done(self) -> bool:
+        with self.lock:
+            return self.all_cracked() or self.offset >= self.size
+
+    def expire_leases(self):
+        now = time.monotonic()
+        for lease_id, (start, end, worker, expires) in list(self.active.items()):
+            if expires < now:
+                del self.active[lease_id]
+                self.workers.discard(worker)
+                self.requeued.append((start, end))
+
+    def lease(self, worker: str) -> dict:
+        self.expire_leases()
+        self.workers.add(worker)
+        if self.all_cracked():
+            self.notified.add(worker)
+            return {'done': True}
+
+        key_range = self.requeued.popleft() if self.requeued else next(self.fresh, None)
+        if key_range is None:
+            # everything is leased out, but a lease may yet expire and need reassigning
+            if self.active:
+                return {'wait': WAIT_INTERVAL}
+            self.notified.add(worker)
+            return {'done': True}
+
+        lease_id = self.next_id
+        self.next_id += 1
+        self.active[lease_id] = (key_range[0], key_range[1], worker, time.monotonic() + LEASE_TTL)
+        return {'lease': {'id': lease_id, 'start': key_range[0], 'end': key_range[1]}, 'cracked': list(self.keys)}
+
+    def renew(self, worker: str, lease_id: int) -> dict:
+        held = lease_id in self.active and self.active[lease_id][2] == worker
+        if held:
+            start, end, worker, expires = self.active[lease_id]
+            self.active[lease_id] = (start, end, worker, time.monotonic() + LEASE_TTL)
+        return {'ok': held, 'cracked': list(self.keys), 'done': self.all_cracked()}
+
+    def report(self, message: dict) -> dict:
+        # found keys are verified, so a misbehaving worker can't report a false positive
+        for target_id, key in message.get('found', ()):
+            key = bytes.fromhex(key)
+            if 0 <= target_id < len(self.targets) and src.utils.bruteforce.check_key(self.targets[target_id], key):
+                self.keys.setdefault(target_id, key)
+
+        lease = self.active.get(message['lease'])
+        if lease and lease[2] == message['worker']:
+            del self.active[message['lease']]
+            self.tested += message.get('tested', 0)
+            if message.get('complete'):
+                self.completed[lease[0]] = lease[1]
+                # everything below offset has been tested once every lease before it has completed
+                while self.offset in self.completed:
+                    self.offset = self.completed.pop(self.offset)
+            else:
+                self.requeued.appendleft((lease[0], lease[1]))
+        return {'ok': True, 'done': self.all_cracked()}
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        self.connection.settimeout(SOCKET_TIMEOUT)
+        try:
+            message = json.loads(self.rfile.readline())
+            state = self.server.state
+            with state.lock:
+                if not state.authorized(message):
+                    response = {'error': 'wrong or missing secret'}
+                elif message['op'] == 'job':
+                    state.workers.add(message.get('worker'))
+                    source = dict(state.source)
+                    response = {'tokens': state.tokens, 'source': source, 'fingerprint': state.fingerprint,
+                                'cracked': list(state.keys)}
+                elif message['op'] == 'lease':
+                    response = state.lease(message['worker'])
+                elif message['op'] == 'renew':
+                    response = state.renew(message['worker'], message['lease'])
+                elif message['op'] == 'report':
+                    response = state.report(message)
+                else:
+                    response = {'error': 'unknown op'}
+        except (ValueError, KeyError, TypeError) as e:
+            response = {'error': str(e)}
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
@@ -0,0 +1,165 @@
+"""
+fingerprint.py
+
+This file contains the response fingerprinting used by the attack subcommand to spot likely bypasses. Every response
+is reduced to a small fingerprint - status code, length bucket, hash of the body with dynamic values stripped, and the
+set of header names - so thousands of responses can be grouped into a handful of clusters and compared against the
+response to the original token (the baseline) without ever comparing bodies pairwise.
+
+Fingerprints are cached per endpoint in ~/.jwtjuggernaut/fingerprints/, as JSON lines keyed by a hash of the token
+variant, so repeat runs against the same endpoint only send the variants they have not classified yet. The cache is
+tied to the baseline fingerprint, so if the endpoint starts responding differently to the original token, everything
+is sent again.
+
+Functions:
+- fingerprint: Reduces a response to its fingerprint.
+- normalize_body: Replaces dynamic values (timestamps, ids, CSRF values etc.) in a response body.
+- length_bucket: Returns the power of two bucket of a body length.
+- describe: Returns a short human-readable description of a fingerprint.
+- default_dir: Returns the default fingerprint cache directory.
+- cache_path: Returns the cache file for an endpoint and its baseline fingerprint.
+- load_cache: Reads the cached fingerprints of an endpoint.
+- token_key: Returns the cache key of a token variant.
+- record_fingerprint: Appends a fingerprint to the cache.
+"""
+
+import os
+import re
+import json
+import hashlib
+
+# name of a CSRF-style value, e.g. csrf_token" value=" or "requestId": "
+_DYNAMIC_NAME = (rb'(?i:(?:csrf|xsrf|nonce|authenticity|request.?id|trace.?id|_token)[\w-]*'
+                 rb'["\']?\s*(?:[:=]|value=)\s*["\']?)')
+
+# values that change between otherwise identical responses. One alternation, so a body is only scanned once.
+_DYNAMIC_PATTERN = re.compile(
+    _DYNAMIC_NAME + rb'[^"\'\s<>&,;]+'
+    rb'|\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?'
+    rb'|(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun), \d{2} \w{3} \d{4} \d{2}:\d{2}:\d{2} \w+'
+    rb'|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}'
+    rb'|\b\d{10}(?:\d{3})?\b'
+    rb'|\b[0-9a-fA-F]{16,}\b'
+    rb'|[A-Za-z0-9_-]{10,}\.[A-Za-z0-9_-]{10,}\.[A-Za-z0-9_-]*'
+)
+_DYNAMIC_NAME_PATTERN = re.compile(_DYNAMIC_NAME)
+
+
+def fingerprint(response: dict) -> tuple:
+    """
+    :param response: Response dictionary from http_client.stream_requests.
+    :return: Tuple of (status, length bucket, body hash, tuple of header names), or ('error',) for a failed request.
+    """
+    if 'error' in response:
+        return ('error',)
+    body = response['body']
+    body_hash = hashlib.blake2b(normalize_body(body), digest_size=8).hexdigest()
+    headers = tuple(sorted({name.lower() for name, _ in response['headers']}))
+    return response['status'], length_bucket(len(body)), body_hash, headers
+
+
+def normalize_body(body: bytes) -> bytes:
+    """
+    :param body: Raw response body.
+    :return: The body with timestamps, dates, UUIDs, long hex ids, JWTs and CSRF-style values replaced by '*'.
+    """
+    return _DYNAMIC_PATTERN.sub(_mask, body)
+
+
+def length_bucket(length: int) -> int:
+    """
+    :param length: Body length in bytes.
+    :return: Bucket number, where bucket n holds lengths from 2^(n-1) to 2^n - 1 (bucket 0 is an empty body).
+    """
+    return length.bit_length()
+
+
+def describe(fp: tuple) -> str:
+    """
+    :param fp: Fingerprint returned by fingerprint.
+    :return: Short description, e.g. '200, 32-63 bytes, body 1f2e3d4c'
+    """
+    if fp[0] == 'error':
+        return 'request failed'
+    status, bucket, body_hash = fp[:3]
+    size = '0 bytes' if bucket == 0 else str(2 ** (bucket - 1)) + '-' + str(2 ** bucket - 1) + ' bytes'
+    return str(status) + ', ' + size + ', body ' + body_hash[:8]
+
+
+def default_dir() -> str:
+    """
+    :return: Path to the default fingerprint cache directory, ~/.jwtjuggernaut/fingerprints
+    """
+    return os.path.join(os.path.expanduser('~'), '.jwtjuggernaut', 'fingerprints')
+
+
+def cache_path(method: str, url: str, baseline: tuple, directory: str = None) -> str:
+    """
+    :param method: HTTP method of the endpoint.
+    :param url: URL of the endpoint.
+    :param baseline: Fingerprint of the response to the original token.
+    :param directory: Cache directory, or None for the default.
+    :return: Path to the cache file for the endpoint and baseline.
+    """
+    key = json.dumps([method.upper(), url, list(baseline)])
+    return os.path.join(directory or default_dir(), hashlib.sha256(key.encode('utf-8')).hexdigest()[:32] + '.jsonl')
+
+
+def load_cache(path: str) -> dict:
+    """
+    Reads the cached fingerprints. Unreadable lines (e.g. from a run killed mid-write) are skipped.
+
+    :param path: Path returned by cache_path.
+    :return: Dictionary object with 'path' and 'fingerprints' (hash of token -> fingerprint).
+    """
+    cache = {'path': path, 'fingerprints': {}}
+    if not os.path.exists(path):
+        return cache
+
+    with open(path, 'r', encoding='utf-8') as cachefile:
+        for line in cachefile:
+            try:
+                record = json.loads(line)
+                fp = record['fingerprint']
+                cache['fingerprints'][record['token']] = tuple(tuple(part) if isinstance(part, list) else part
+                                                               for part in fp)
+            except (ValueError, KeyError, TypeError):
+                continue
+    return cache
+
+
+def token_key(token: str) -> str:
+    """
+    :param token: A token variant.
+    :return: The key of the token in the cache, so the cache never stores the tokens themselves.
+    """
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def record_fingerprint(cache: dict, token: str, fp: tuple):
+    """
+    Caches the fingerprint of the response to the token. Failed requests are not cached, so they are retried.
+
+    :param cache: Dictionary object returned by load_cache.
+    :param token: The token variant that was sent.
+    :param fp: Fingerprint of the response.
+    :return: None
+    """
+    if fp[0] == 'error':
+        return
+    key = token_key(token)
+    if cache['fingerprints'].get(key) == fp:
+        return
+    cache['fingerprints'][key] = fp
+
+    path = cache['path']
+    if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'a', encoding='utf-8') as cachefile:
+        cachefile.write(json.dumps({'token': key, 'fingerprint': list(fp)}) + '\n')
+
+
+def _mask(match: re.Match) -> bytes:
+    # keep the name of CSRF-style values, only the value itself is dynamic
+    prefix = _DYNAMIC_NAME_PATTERN.match(match.group(0))
+    return (prefix.group(0) if prefix else b'') + b'*'
@@ -0,0 +1,376 @@
+"""
+harvest.py
+
+This file contains the harvest subcommand, which passively collects JWTs from growing log files (nginx/ALB access
+logs, HAR exports, mitmproxy dumps or anything else with tokens in it). The files are polled like tail -F: only the
+bytes appended since the last read are scanned, and rotated (renamed and recreated) or truncated files are followed.
+
+Gateways log the same few thousand tokens millions of times, so every occurrence is checked against a Bloom filter
+keyed on the token's signature, and only tokens not seen before are decoded and written out. The filter has a fixed
+size, set from the expected number of distinct tokens and an acceptable false positive rate (a false positive means a
+new token is mistaken for a seen one and skipped), so memory use never grows with the logs.
+
+The file offsets and the Bloom filter are saved to a state file, by default ~/.jwtjuggernaut/harvest/<hash>.json (and
+<hash>.bloom), so a restarted harvest continues where it stopped and does not repeat tokens it has already output.
+
+Functions:
+- harvest: The main function for the harvest subcommand, tails the files until interrupted (or once, with --once).
+- state_path: Returns the default state file location for a set of log files.
+- load_state: Reads the saved file offsets and Bloom filter.
+- save_state: Atomically writes the file offsets and Bloom filter.
+- dedupe_key: Returns the part of a token the Bloom filter is keyed on.
+
+Classes:
+- BloomFilter: Fixed-size set membership filter with no false negatives.
+- LogTail: Incremental reader of a single growing log file.
+"""
+
+import os
+import sys
+import math
+import json
+import time
+import hashlib
+from colorama import Fore, Style
+
+import src.utils.parse_token
+import src.utils.parse_http_request
+import src.utils.metrics
+import src.utils.error_handler
+
+# default number of distinct tokens the Bloom filter is sized for, and its false positive rate at that size
+CAPACITY = 1000000
+ERROR_RATE = 0.001
+
+# default seconds between polls of the log files
+INTERVAL = 1.0
+
+# bytes read from a log file at a time
+READ_SIZE = 1024 * 1024
+
+# seconds between state saves while following the files
+STATE_INTERVAL = 10
+
+# number of recently seen keys checked exactly before the Bloom filter. Logs repeat the same tokens over and over, so
+# nearly every occurrence is answered by one dict lookup instead of the filter's hashes. Cleared when full.
+RECENT_SIZE = 65536
+
+
+def harvest(paths: list, output: str = None, read: bool = False, details: bool = False, once: bool = False,
+            interval: float = INTERVAL, state: str = None, capacity: int = CAPACITY,
+            error_rate: float = ERROR_RATE) -> dict:
+    """
+    Follows the log files and writes every new distinct token, as a JSON line (source, offset, token, header, payload,
+    signature, or error if it can't be decoded) or rendered the way the read subcommand renders it.
+
+    :param paths: Paths of the log files to follow. Files that don't exist yet are picked up once they are created.
+    :param output: Path to append the JSON lines to, or None for stdout.
+    :param read: Print each token the way read does, instead of as JSON lines? T/F
+    :param details: Include claim definitions when printing the way read does? T/F
+    :param once: Read what is in the files now and exit, instead of following them? T/F
+    :param interval: Seconds between polls of the files.
+    :param state: Path to the state file, None for the default location, or '' to not save state.
+    :param capacity: Number of distinct tokens the Bloom filter is sized for.
+    :param error_rate: False positive rate of the Bloom filter at its capacity.
+    :return: Dictionary object with the number of bytes read, tokens seen and new tokens output.
+    """
+    if capacity <= 0 or not 0 < error_rate < 1:
+        src.utils.error_handler.print_error('The Bloom filter needs a positive capacity and an error rate between '
+                                            '0 and 1.')
+    paths = [os.path.abspath(path) for path in paths]
+    if state is None:
+        state = state_path(paths)
+    offsets, bloom = load_state(state, capacity, error_rate) if state else ({}, BloomFilter(capacity, error_rate))
+    tails = [LogTail(path, offsets.get(path)) for path in paths]
+
+    counts = {'bytes': 0, 'tokens': 0, 'new': 0}
+    recent = set()
+    outfile = open(output, 'a', encoding='utf-8') if output and not read else sys.stdout
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    last_save = time.monotonic()
+    try:
+        while True:
+            for tail in tails:
+                for offset, data in tail.read(final=once):
+                    counts['bytes'] += len(data)
+                    src.utils.metrics.increment('harvest.bytes', len(data))
+                    for match in src.utils.parse_http_request.JWT_PATTERN.finditer(data):
+                        counts['tokens'] += 1
+                        token = match.group(0)
+                        key = dedupe_key(token)
+                        if key in recent:
+                            continue
+                        if len(recent) >= RECENT_SIZE:
+                            recent.clear()
+                        recent.add(key)
+                        if not bloom.add(key):
+                            continue
+                        counts['new'] += 1
+                        token = token.decode('ascii')
+                        if read:
+                            try:
+                                src.utils.parse_token.decode_token(token)
+                            except ValueError:
+                                # parse_token exits on a malformed token, a harvest just skips it
+                                continue
+                            src.utils.parse_token.parse_token(token, details)
+                        else:
+                            outfile.write(dumps(_row(tail.path, offset + match.start(), token)) + '\n')
+                if not read:
+                    outfile.flush()
+
+            src.utils.metrics.set_gauge('harvest.tokens_seen', counts['tokens'])
+            src.utils.metrics.set_gauge('harvest.tokens_new', counts['new'])
+            if once:
+                break
+            if state and time.monotonic() - last_save >= STATE_INTERVAL:
+                save_state(state, tails, bloom)
+                last_save = time.monotonic()
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    except BrokenPipeError:
+        # the tool reading the tokens has exited (e.g. head), which is not an error - silence the final flush
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    finally:
+        if outfile is not sys.stdout:
+            outfile.close()
+        for tail in tails:
+            tail.close()
+        if state:
+            save_state(state, tails, bloom)
+
+    # the summary goes to stderr, so stdout stays clean JSON lines
+    print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Read '+Fore.CYAN+str(counts['bytes'])+Fore.MAGENTA+' bytes, '+Fore.CYAN +
+          str(counts['tokens'])+Fore.MAGENTA+' tokens seen, '+Fore.CYAN+str(counts['new'])+Fore.MAGENTA +
+          ' new'+Style.RESET_ALL, file=sys.stderr)
+    return counts
+
+
+def state_path(paths: list) -> str:
+    """
+    :param paths: Absolute paths of the log files being followed.
+    :return: Path to the default state file, ~/.jwtjuggernaut/harvest/<hash>.json, where the hash covers the set of
+             files, so the same files always continue from the same state.
+    """
+    name = hashlib.sha256('\0'.join(sorted(set(paths))).encode('utf-8')).hexdigest()[:32]
+    return os.path.join(os.path.expanduser('~'), '.jwtjuggernaut', 'harvest', name + '.json')
+
+
+def load_state(path: str, capacity: int, error_rate: float) -> tuple:
+    """
+    Reads the state file. The saved Bloom filter is only reused if it was sized with the same capacity and error
+    rate, otherwise (or if the state can't be read) harvesting starts over with an empty filter.
+
+    :param path: Path to the state file.
+    :param capacity: Number of distinct tokens the Bloom filter should be sized for.
+    :param error_rate: False positive rate the Bloom filter should have at its capacity.
+    :return: Tuple of (dict of log file path -> saved position, BloomFilter).
+    """
+    bloom = BloomFilter(capacity, error_rate)
+    try:
+        with open(path, 'r', encoding='utf-8') as statefile:
+            saved = json.load(statefile)
+        offsets = saved['files']
+        if saved['bloom'] == bloom.parameters():
+            with open(_bloom_path(path), 'rb') as f:
+                bloom.load(f.read())
+        else:
+            # tokens already output would be output again, so the offsets are only kept with the filter
+            offsets = {}
+    except (OSError, ValueError, KeyError, TypeError):
+        offsets = {}
+        bloom = BloomFilter(capacity, error_rate)
+    return offsets, bloom
+
+
+def save_state(path: str, tails: list, bloom):
+    """
+    Writes the state to temporary files and renames them into place, so a harvest killed mid-write never leaves a
+    corrupt state behind.
+
+    :param path: Path to the state file.
+    :param tails: List of LogTail objects, whose positions are saved.
+    :param bloom: The BloomFilter.
+    :return: None
+    """
+    if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    bloom_path = _bloom_path(path)
+    with open(bloom_path + '.tmp', 'wb') as f:
+        f.write(bloom.dump())
+    os.replace(bloom_path + '.tmp', bloom_path)
+
+    saved = {
+        'files': {tail.path: tail.position() for tail in tails if tail.position()},
+        'bloom': bloom.parameters(),
+    }
+    with open(path + '.tmp', 'w', encoding='utf-8') as statefile:
+        json.dump(saved, statefile, indent=4)
+    os.replace(path + '.tmp', path)
+
+
+def dedupe_key(token: bytes) -> bytes:
+    """
+    :param token: A JWT as bytes.
+    :return: The signature segment, which is unique per token and much shorter than the token. Unsigned tokens (empty
+             signature) are keyed on the whole token instead.
+    """
+    signature = token[token.rfind(b'.') + 1:]
+    return signature or token
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter: a bit array and a number of hash functions chosen for the capacity and error rate. There
+    are no false negatives - a key that was added is always found - but a key that was never added is reported as
+    found with probability error_rate once capacity keys are in the filter.
+    """
+
+    def __init__(self, capacity: int = CAPACITY, error_rate: float = ERROR_RATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        # optimal size and number of hashes for n keys at false positive rate p: m = -n ln p / (ln 2)^2, k = m/n ln 2
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def add(self, key: bytes) -> bool:
+        """
+        :param key: Key to add.
+        :return: True if the key was not in the filter before, False if it was (or is a false positive).
+        """
+        # double hashing: the k bit positions are h1 + i*h2, from a single 128-bit digest
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        bits, size = self.bits, self.size
+        new = False
+        for i in range(self.hashes):
+            position = (h1 + i * h2) % size
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                new = True
+        return new
+
+    def parameters(self) -> dict:
+        """
+        :return: Dictionary object with the capacity, error rate, size in bits and number of hashes.
+        """
+        return {'capacity': self.capacity, 'error_rate': self.error_rate, 'size': self.size, 'hashes': self.hashes}
+
+    def dump(self) -> bytes:
+        """
+        :return: The bit array.
+        """
+        return bytes(self.bits)
+
+    def load(self, data: bytes):
+        """
+        :param data: Bit array returned by dump, from a filter with the same parameters.
+        :return: None
+        """
+        if len(data) != len(self.bits):
+            raise ValueError('Bloom filter size mismatch')
+        self.bits[:] = data
+
+
+class LogTail:
+    """
+    Incremental reader of a growing log file. Only complete lines are returned, so a token being written while the
+    file is read is never cut in two, and the offset of the first unread byte is remembered between reads.
+
+    The file is identified by its device and inode: if the path is replaced (the log was rotated), the rest of the
+    old file is read before switching to the new one, and if the file shrinks (it was truncated, e.g. by copytruncate)
+    it is read again from the start.
+    """
+
+    def __init__(self, path: str, saved: dict = None):
+        self.path = path
+        self.file = None
+        self.inode = None
+        self.offset = 0
+        if saved:
+            self.inode = (saved['device'], saved['inode'])
+            self.offset = saved['offset']
+
+    def read(self, final: bool = False):
+        """
+        :param final: Also return a last line without a line ending (when reading once, rather than following)? T/F
+        :return: Generator of (offset, bytes) chunks of new complete lines.
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            stat = None
+
+        if self.file is not None and (stat is None or (stat.st_dev, stat.st_ino) != self.inode):
+            # rotated: whatever was written to the old file before the switch is still unread
+            yield from self._read_available(True)
+            self.close()
+            self.inode, self.offset = None, 0
+        if stat is None:
+            return
+
+        if self.file is None:
+            try:
+                self.file = open(self.path, 'rb')
+            except OSError:
+                return
+            stat = os.fstat(self.file.fileno())
+            if (stat.st_dev, stat.st_ino) != self.inode:
+                # a different file from the one in the saved state, so read it from the start
+                self.inode, self.offset = (stat.st_dev, stat.st_ino), 0
+        if stat.st_size < self.offset:
+            self.offset = 0
+        yield from self._read_available(final)
+
+    def position(self) -> dict:
+        """
+        :return: Dictionary object with the device, inode and offset, or None if the file has not been opened.
+        """
+        if self.inode is None:
+            return None
+        return {'device': self.inode[0], 'inode': self.inode[1], 'offset': self.offset}
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _read_available(self, final: bool):
+        # reads from the offset to the end of the file, a chunk at a time, stopping at the last complete line
+        self.file.seek(self.offset)
+        pending = b''
+        while True:
+            data = self.file.read(READ_SIZE)
+            if not data:
+                break
+            data = pending + data
+            end = data.rfind(b'\n') + 1
+            if end:
+                yield self.offset, data[:end]
+                self.offset += end
+            pending = data[end:]
+        if final and pending:
+            yield self.offset, pending
+            self.offset += len(pending)
+
+
+def _bloom_path(path: str) -> str:
+    # the bit array is kept next to the state file, as <name>.bloom
+    return (path[:-len('.json')] if path.endswith('.json') else path) + '.bloom'
+
+
+def _row(path: str, offset: int, token: str) -> dict:
+    row = {'source': path, 'offset': offset, 'token': token}
+    try:
+        token_dict = src.utils.parse_token.decode_token(token)
+    except ValueError as e:
+        row['error'] = str(e)
+        return row
+    row['header'] = token_dict['header_dict']
+    row['payload'] = token_dict['payload_dict']
+    row['signature'] = token_dict['signature']
+    return row
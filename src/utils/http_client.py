@@ -0,0 +1,330 @@
+"""
+http_client.py
+
+This file contains the asynchronous HTTP/1.1 request engine used by the attack subcommand. Requests are sent over a
+shared pool of keep-alive connections, with a limit on how many are in flight at once, an optional per-host rate limit,
+a timeout, and a retry budget for connection errors. Responses are streamed back as each one completes.
+
+Only the standard library is used (asyncio streams and ssl), so the engine has no dependencies beyond Python itself.
+With --metrics, request latency, requests in flight, retries and errors are recorded under attack.*
+
+Functions:
+- stream_requests: Sends every request in an iterable and yields each response as it completes.
+
+Classes:
+- ConnectionPool: Keep-alive connections shared between requests, grouped by scheme, host and port.
+- RateLimiter: Per-host token bucket limiting the number of requests per second.
+"""
+
+import ssl
+import time
+import asyncio
+import urllib.parse
+
+import src.utils.metrics
+
+# default number of requests in flight at once
+CONCURRENCY = 10
+
+# default seconds to wait for a connection and for each response
+TIMEOUT = 10
+
+# default number of times a request is retried after a connection error or timeout
+RETRIES = 2
+
+# seconds to wait before the first retry, doubled for each further retry
+RETRY_BACKOFF = 0.5
+
+# status codes whose responses never have a body, regardless of their headers
+_NO_BODY_STATUS = (204, 304)
+
+
+async def stream_requests(requests, concurrency: int = CONCURRENCY, rate: float = None, timeout: float = TIMEOUT,
+                          retries: int = RETRIES, verify_ssl: bool = False):
+    """
+    Sends every request, with up to concurrency requests in flight at once, and yields each response as soon as it
+    completes (so not necessarily in the order the requests were given). Requests are only taken from the iterable as
+    a slot frees up, so it can be a lazy generator of any size.
+
+    :param requests: Iterable of request dictionaries with method, url, headers (list of (name, value) tuples) and
+                     optionally body (bytes). Any other keys are passed through to the response, e.g. a variant name.
+    :param concurrency: Maximum number of requests in flight at once.
+    :param rate: Maximum number of requests per second to each host, or None for no limit.
+    :param timeout: Seconds to wait to connect and for each response.
+    :param retries: Number of times a request is retried after a connection error or timeout.
+    :param verify_ssl: Verify the target's TLS certificate? T/F
+    :return: Async generator of response dictionaries (see ConnectionPool.request), each with a 'request' key.
+    """
+    pool = ConnectionPool(timeout, retries, verify_ssl)
+    limiter = RateLimiter(rate) if rate else None
+    requests = iter(requests)
+    # unbounded so a worker never blocks on it - the consumer only has to print each response, so it keeps up
+    results = asyncio.Queue()
+    counts = {'requests': 0, 'errors': 0}
+
+    async def worker():
+        try:
+            # the iterator is shared by every worker, each takes the next request when it is free
+            for request in requests:
+                if limiter:
+                    waited = time.perf_counter()
+                    await limiter.acquire(urllib.parse.urlsplit(request['url']).netloc)
+                    src.utils.metrics.increment('attack.rate_limit_wait_seconds', time.perf_counter() - waited)
+                src.utils.metrics.add_gauge('attack.in_flight', 1)
+                try:
+                    response = await pool.request(request['method'], request['url'], request.get('headers', []),
+                                                  request.get('body', b''))
+                finally:
+                    src.utils.metrics.add_gauge('attack.in_flight', -1)
+                _record_response(response, counts)
+                response['request'] = request
+                await results.put(response)
+        finally:
+            await results.put(None)
+
+    tasks = [asyncio.ensure_future(worker()) for _ in range(max(1, concurrency))]
+    try:
+        running = len(tasks)
+        while running:
+            response = await results.get()
+            if response is None:
+                running -= 1
+                continue
+            yield response
+        # re-raise anything unexpected from the workers
+        for task in tasks:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        pool.close()
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP/1.1 connections, reused across requests to the same scheme, host and port. A connection is only
+    returned to the pool once its response has been fully read, so it can never be shared by two requests at once.
+    """
+
+    def __init__(self, timeout: float = TIMEOUT, retries: int = RETRIES, verify_ssl: bool = False):
+        self.timeout = timeout
+        self.retries = retries
+        self.ssl_context = ssl.create_default_context()
+        if not verify_ssl:
+            # attack targets are usually test environments with self-signed certificates
+            self.ssl_context.check_hostname = False
+            self.ssl_context.verify_mode = ssl.CERT_NONE
+        self._idle = {}
+
+    async def request(self, method: str, url: str, headers: list, body: bytes = b'') -> dict:
+        """
+        Sends a single request, retrying connection errors and timeouts up to the retry budget. A failure on a reused
+        keep-alive connection (which the server may have closed while it was idle) is retried on a new connection
+        without using up the budget.
+
+        :param method: HTTP method, e.g. GET.
+        :param url: Absolute http:// or https:// URL.
+        :param headers: List of (name, value) tuples. Host and Content-Length are added if they are not included.
+        :param body: Request body.
+        :return: Dictionary object with status, reason, headers (list of (name, value) tuples), body (bytes), elapsed
+                 (seconds) and attempts, or with error (string) and attempts if every attempt failed.
+        """
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            return {'error': 'Unsupported URL: ' + url, 'attempts': 0}
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        data = _build_request(method, parts, headers, body)
+
+        attempts = 0
+        error = None
+        while attempts <= self.retries:
+            start = time.perf_counter()
+            try:
+                reader, writer, reused = await self._acquire(key)
+            except (OSError, asyncio.TimeoutError) as e:
+                error = e
+                attempts += 1
+                await self._backoff(attempts)
+                continue
+
+            try:
+                writer.write(data)
+                await writer.drain()
+                response, keep_alive = await asyncio.wait_for(_read_response(reader, method), self.timeout)
+            except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                writer.close()
+                error = e
+                if reused and not isinstance(e, asyncio.TimeoutError):
+                    continue
+                attempts += 1
+                await self._backoff(attempts)
+                continue
+
+            if keep_alive:
+                self._idle.setdefault(key, []).append((reader, writer))
+            else:
+                writer.close()
+            response['elapsed'] = time.perf_counter() - start
+            response['attempts'] = attempts + 1
+            return response
+
+        return {'error': _describe(error), 'attempts': attempts}
+
+    def close(self):
+        """
+        Closes every idle connection in the pool.
+
+        :return: None
+        """
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+    async def _acquire(self, key: tuple) -> tuple:
+        idle = self._idle.get(key)
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+
+        scheme, host, port = key
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=self.ssl_context if scheme == 'https' else None,
+                                    server_hostname=host if scheme == 'https' else None),
+            self.timeout)
+        return reader, writer, False
+
+    async def _backoff(self, attempts: int):
+        if attempts <= self.retries:
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempts - 1))
+
+
+class RateLimiter:
+    """
+    Token bucket per host, allowing a burst of up to one second's worth of requests (at least one request, so rates
+    below one per second still make progress) and then rate requests per second.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.burst = max(1.0, float(rate))
+        self._buckets = {}
+
+    async def acquire(self, host: str):
+        """
+        Waits until a request to the host is allowed.
+
+        :param host: Host (and port) the request is sent to.
+        :return: None
+        """
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = {'tokens': self.burst, 'updated': time.monotonic(),
+                                            'lock': asyncio.Lock()}
+
+        async with bucket['lock']:
+            while True:
+                now = time.monotonic()
+                bucket['tokens'] = min(self.burst, bucket['tokens'] + (now - bucket['updated']) * self.rate)
+                bucket['updated'] = now
+                if bucket['tokens'] >= 1:
+                    bucket['tokens'] -= 1
+                    return
+                await asyncio.sleep((1 - bucket['tokens']) / self.rate)
+
+
+def _record_response(response: dict, counts: dict):
+    # counts are kept per stream_requests call, so the error rate is for this run's requests only
+    counts['requests'] += 1
+    src.utils.metrics.increment('attack.requests')
+    src.utils.metrics.increment('attack.retries', max(0, response['attempts'] - 1))
+    if 'error' in response:
+        counts['errors'] += 1
+        src.utils.metrics.increment('attack.errors')
+    else:
+        src.utils.metrics.observe('attack.request_seconds', response['elapsed'])
+        src.utils.metrics.increment('attack.responses_' + str(response['status'])[0] + 'xx')
+    src.utils.metrics.set_gauge('attack.error_rate', counts['errors'] / counts['requests'])
+
+
+def _build_request(method: str, parts: urllib.parse.SplitResult, headers: list, body: bytes) -> bytes:
+    target = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+    names = {name.lower() for name, _ in headers}
+
+    lines = [method + ' ' + target + ' HTTP/1.1']
+    if 'host' not in names:
+        lines.append('Host: ' + parts.netloc)
+    for name, value in headers:
+        # the body may have changed length since the headers were captured (e.g. a token was swapped into it)
+        if name.lower() not in ('content-length', 'connection', 'transfer-encoding'):
+            lines.append(name + ': ' + value)
+    if body or method.upper() in ('POST', 'PUT', 'PATCH'):
+        lines.append('Content-Length: ' + str(len(body)))
+    lines.append('Connection: keep-alive')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+
+async def _read_response(reader: asyncio.StreamReader, method: str) -> tuple:
+    while True:
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('Connection closed before a response was received')
+        version, _, rest = status_line.decode('latin-1').strip().partition(' ')
+        status, _, reason = rest.partition(' ')
+        status = int(status)
+
+        headers = []
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n'):
+                break
+            if not line:
+                raise asyncio.IncompleteReadError(b'', None)
+            name, _, value = line.decode('latin-1').partition(':')
+            headers.append((name.strip(), value.strip()))
+
+        # skip interim responses (e.g. 100 Continue) and wait for the final one
+        if status >= 200:
+            break
+
+    fields = {name.lower(): value for name, value in headers}
+    connection = fields.get('connection', '').lower()
+    keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+
+    if method.upper() == 'HEAD' or status in _NO_BODY_STATUS:
+        body = b''
+    elif 'chunked' in fields.get('transfer-encoding', '').lower():
+        body = await _read_chunked(reader)
+    elif 'content-length' in fields:
+        body = await reader.readexactly(int(fields['content-length']))
+    else:
+        # the body runs until the server closes the connection
+        body = await reader.read()
+        keep_alive = False
+
+    return {'status': status, 'reason': reason, 'headers': headers, 'body': body}, keep_alive
+
+
+async def _read_chunked(reader: asyncio.StreamReader) -> bytes:
+    chunks = []
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise asyncio.IncompleteReadError(b''.join(chunks), None)
+        size = int(line.split(b';', 1)[0].strip(), 16)
+        if size == 0:
+            # skip any trailers up to the blank line ending the body
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            return b''.join(chunks)
+        chunks.append(await reader.readexactly(size))
+        await reader.readexactly(2)
+
+
+def _describe(error: Exception) -> str:
+    if isinstance(error, asyncio.TimeoutError):
+        return 'Timed out'
+    return str(error) or type(error).__name__
@@ -0,0 +1,195 @@
+"""
+mask.py
+
+This file contains the mask (keyspace) candidate generator used by the bruteforce subcommand. A mask such as
+?l?l?d?d?s describes the charset of every position, and every candidate in the keyspace is addressed by an integer
+index. Any contiguous index range can therefore be handed to any worker, and sharding, resuming and progress reporting
+are simple arithmetic on the index rather than a replay of the generator.
+
+Built-in charsets:
+    ?l  abcdefghijklmnopqrstuvwxyz         ?u  ABCDEFGHIJKLMNOPQRSTUVWXYZ
+    ?d  0123456789                         ?s  printable symbols (including space)
+    ?a  ?l?u?d?s                           ?h  0123456789abcdef
+    ?H  0123456789ABCDEF                   ?b  every byte 0x00 - 0xff
+    ??  a literal ?                        any other character is used literally
+
+Functions:
+- parse_mask: Parses a mask string into the list of charsets for each position.
+- parse_lengths: Parses a MIN-MAX length range for a mask.
+- keyspace: Splits the keyspace of a mask into one segment per candidate length.
+- keyspace_size: Returns the total number of candidates in a keyspace.
+- candidate_at: Returns the candidate at a given index of the keyspace.
+- iter_batches: Yields the candidates of a contiguous index range in batches.
+"""
+
+import string
+
+CHARSETS = {
+    'l': string.ascii_lowercase,
+    'u': string.ascii_uppercase,
+    'd': string.digits,
+    's': ' ' + string.punctuation,
+    'a': string.ascii_lowercase + string.ascii_uppercase + string.digits + ' ' + string.punctuation,
+    'h': '0123456789abcdef',
+    'H': '0123456789ABCDEF',
+}
+
+# number of candidates handed to the HMAC check at a time
+BATCH_SIZE = 4096
+
+
+def parse_mask(mask: str) -> list:
+    """
+    Parses the mask into the charset of each position. Each charset is a tuple of single byte candidates so that
+    candidates can be built by concatenation without any encoding.
+
+    :param mask: Mask string, e.g. ?u?l?l?d?d
+    :return: List of tuples of bytes, one per position.
+    """
+    positions = []
+    i = 0
+    while i < len(mask):
+        char = mask[i]
+        if char == '?':
+            if i + 1 >= len(mask):
+                raise ValueError('Mask ends with an incomplete charset: ' + mask)
+            name = mask[i + 1]
+            i += 2
+            if name == '?':
+                positions.append((b'?',))
+            elif name == 'b':
+                positions.append(tuple(bytes([b]) for b in range(256)))
+            elif name in CHARSETS:
+                positions.append(tuple(c.encode('ascii') for c in CHARSETS[name]))
+            else:
+                raise ValueError('Unknown mask charset ?' + name + ' in mask: ' + mask)
+        else:
+            positions.append((char.encode('utf-8'),))
+            i += 1
+
+    if not positions:
+        raise ValueError('Mask is empty.')
+    return positions
+
+
+def parse_lengths(lengths: str, positions: list) -> tuple:
+    """
+    Parses a length range such as 4-6 (or a single length such as 5) for the mask. Candidates of length N use the
+    first N positions of the mask. With no range provided, only the full mask length is used.
+
+    :param lengths: Length range string, or None.
+    :param positions: List of charsets returned by parse_mask.
+    :return: Tuple of (minimum length, maximum length).
+    """
+    if not lengths:
+        return len(positions), len(positions)
+
+    try:
+        if '-' in lengths:
+            min_len, max_len = (int(part) for part in lengths.split('-', 1))
+        else:
+            min_len = max_len = int(lengths)
+    except ValueError:
+        raise ValueError('Mask length must be in the format MIN-MAX, e.g. 1-6')
+
+    if not 1 <= min_len <= max_len <= len(positions):
+        raise ValueError('Mask length range must be between 1 and the mask length (' + str(len(positions)) + ')')
+    return min_len, max_len
+
+
+def keyspace(positions: list, min_len: int, max_len: int) -> list:
+    """
+    Splits the keyspace into one segment per candidate length, shortest first.
+
+    :param positions: List of charsets returned by parse_mask.
+    :param min_len: Minimum candidate length.
+    :param max_len: Maximum candidate length.
+    :return: List of (length, first index, number of candidates) tuples.
+    """
+    segments = []
+    first = 0
+    for length in range(min_len, max_len + 1):
+        size = 1
+        for charset in positions[:length]:
+            size *= len(charset)
+        segments.append((length, first, size))
+        first += size
+    return segments
+
+
+def keyspace_size(segments: list) -> int:
+    """
+    :param segments: List of segments returned by keyspace.
+    :return: Total number of candidates in the keyspace.
+    """
+    length, first, size = segments[-1]
+    return first + size
+
+
+def candidate_at(positions: list, segments: list, index: int) -> bytes:
+    """
+    Returns the candidate at the index of the keyspace. The last position of the mask changes fastest.
+
+    :param positions: List of charsets returned by parse_mask.
+    :param segments: List of segments returned by keyspace.
+    :param index: Index into the keyspace.
+    :return: Candidate as bytes.
+    """
+    for length, first, size in segments:
+        if first <= index < first + size:
+            digits = _digits(positions[:length], index - first)
+            return b''.join(charset[digit] for charset, digit in zip(positions, digits))
+    raise IndexError('Index outside of the mask keyspace: ' + str(index))
+
+
+def iter_batches(positions: list, segments: list, start: int, end: int, batch_size: int = BATCH_SIZE):
+    """
+    Yields every candidate with an index in [start, end) in batches. The starting digits are computed once from the
+    index, after which the prefix is advanced like an odometer and the last position is filled by concatenation.
+
+    :param positions: List of charsets returned by parse_mask.
+    :param segments: List of segments returned by keyspace.
+    :param start: First index of the range.
+    :param end: Index after the last candidate of the range.
+    :param batch_size: Approximate number of candidates per batch.
+    :return: Generator of lists of candidates as bytes.
+    """
+    batch = []
+    for length, first, size in segments:
+        lo, hi = max(start, first), min(end, first + size)
+        if lo >= hi:
+            continue
+
+        charsets = positions[:length]
+        digits = _digits(charsets, lo - first)
+        last = charsets[-1]
+        remaining = hi - lo
+        while remaining > 0:
+            prefix = b''.join(charset[digit] for charset, digit in zip(charsets, digits[:-1]))
+            take = min(len(last) - digits[-1], remaining)
+            batch.extend([prefix + char for char in last[digits[-1]:digits[-1] + take]])
+            remaining -= take
+
+            # advance the prefix digits by one, carrying leftwards
+            digits[-1] = 0
+            position = length - 2
+            while position >= 0:
+                digits[position] += 1
+                if digits[position] < len(charsets[position]):
+                    break
+                digits[position] = 0
+                position -= 1
+
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def _digits(charsets: list, index: int) -> list:
+    # mixed radix decomposition of index, most significant position first
+    digits = [0] * len(charsets)
+    for position in range(len(charsets) - 1, -1, -1):
+        index, digits[position] = divmod(index, len(charsets[position]))
+    return digits
@@ -0,0 +1,331 @@
+"""
+metrics.py
+
+This file contains the optional instrumentation used to find the slow stage of a long run: counters, gauges and
+histograms (e.g. token decode time, keys tested, request latency) kept in memory by name and exported with the global
+--metrics flag, plus the --profile (cProfile) and --tracemalloc hooks around the subcommand.
+
+Recording does nothing until enable() is called, so the instrumented code costs a single flag check when metrics are
+off. Only the process that enabled metrics records them - worker processes (e.g. bruteforce) send their timings back
+with their results, and the parent records them.
+
+Snapshots are written every few seconds while the subcommand runs, and once more when it finishes. JSON snapshots are
+appended to the file as JSON lines, so the history of a slow run is kept. Prometheus snapshots replace the file each
+time (atomically, for the node_exporter textfile collector), since the scraper keeps the history.
+
+Functions:
+- enable: Turns recording on.
+- increment: Adds to a counter.
+- set_gauge: Sets a gauge to the current value of something, e.g. requests in flight.
+- add_gauge: Adds to (or subtracts from) a gauge.
+- observe: Records a value (e.g. a duration in seconds) in a histogram.
+- timer: Context manager that records the duration of a block in a histogram.
+- timed: Decorator that records the duration and errors of every call to a function.
+- snapshot: Returns every metric recorded so far.
+- format_prometheus: Formats a snapshot in the Prometheus text exposition format.
+- write_snapshot: Writes a snapshot to a file.
+- run: Runs a subcommand with the requested metrics, profiling and memory tracing.
+"""
+
+import os
+import sys
+import json
+import time
+import bisect
+import functools
+import threading
+import contextlib
+from colorama import Fore, Style
+
+FORMATS = ('json', 'prometheus')
+
+# default seconds between snapshots
+INTERVAL = 10
+
+# default histogram bucket upper bounds, in seconds
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# prefix of every metric name in the Prometheus format
+PROMETHEUS_PREFIX = 'jwtjuggernaut_'
+
+# number of functions and allocation sites listed by --profile and --tracemalloc
+_REPORT_LINES = 25
+
+_enabled = False
+_started = None
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+
+
+def enable():
+    """
+    Turns recording on, and starts the clock for the elapsed time in each snapshot.
+
+    :return: None
+    """
+    global _enabled, _started
+    _started = time.time()
+    _enabled = True
+
+
+def increment(name: str, value: float = 1):
+    """
+    :param name: Counter name, e.g. bruteforce.keys_tested
+    :param value: Amount to add.
+    :return: None
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value: float):
+    """
+    :param name: Gauge name, e.g. bruteforce.keys_per_second
+    :param value: Current value.
+    :return: None
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _gauges[name] = value
+
+
+def add_gauge(name: str, value: float):
+    """
+    :param name: Gauge name, e.g. attack.in_flight
+    :param value: Amount to add, negative to subtract.
+    :return: None
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _gauges[name] = _gauges.get(name, 0) + value
+
+
+def observe(name: str, value: float, buckets: tuple = BUCKETS):
+    """
+    :param name: Histogram name, e.g. attack.request_seconds
+    :param value: Value to record.
+    :param buckets: Bucket upper bounds, used when the histogram is first created.
+    :return: None
+    """
+    if not _enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = {'buckets': tuple(buckets), 'counts': [0] * (len(buckets) + 1),
+                                             'count': 0, 'sum': 0.0, 'min': value, 'max': value}
+        histogram['counts'][bisect.bisect_left(histogram['buckets'], value)] += 1
+        histogram['count'] += 1
+        histogram['sum'] += value
+        histogram['min'] = min(histogram['min'], value)
+        histogram['max'] = max(histogram['max'], value)
+
+
+@contextlib.contextmanager
+def timer(name: str):
+    """
+    Records the duration of the block, in seconds, in the histogram.
+
+    :param name: Histogram name, e.g. bruteforce.potfile_seconds
+    :return: Context manager.
+    """
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def timed(name: str):
+    """
+    Decorator recording the duration of every call in the <name>_seconds histogram, and every call that raises in the
+    <name>_errors counter.
+
+    :param name: Metric name prefix, e.g. parse_token.decode
+    :return: Decorator.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                increment(name + '_errors')
+                raise
+            finally:
+                observe(name + '_seconds', time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def snapshot() -> dict:
+    """
+    :return: Dictionary object with the time, elapsed seconds, counters, gauges and histograms (count, sum, min, max
+             and the count of values in each bucket, keyed by the bucket's upper bound).
+    """
+    with _lock:
+        histograms = {}
+        for name, histogram in _histograms.items():
+            bounds = [str(bound) for bound in histogram['buckets']] + ['+Inf']
+            histograms[name] = {
+                'count': histogram['count'],
+                'sum': histogram['sum'],
+                'min': histogram['min'],
+                'max': histogram['max'],
+                'buckets': dict(zip(bounds, histogram['counts'])),
+            }
+        return {
+            'time': time.time(),
+            'elapsed': time.time() - _started if _started else 0.0,
+            'counters': dict(_counters),
+            'gauges': dict(_gauges),
+            'histograms': histograms,
+        }
+
+
+def format_prometheus(data: dict) -> str:
+    """
+    :param data: Dictionary object returned by snapshot.
+    :return: The snapshot in the Prometheus text exposition format (histogram buckets are cumulative).
+    """
+    lines = []
+    for name, value in sorted(data['counters'].items()):
+        name = _prometheus_name(name) + '_total'
+        lines += ['# TYPE ' + name + ' counter', name + ' ' + _prometheus_value(value)]
+    gauges = dict(data['gauges'], elapsed_seconds=data['elapsed'])
+    for name, value in sorted(gauges.items()):
+        name = _prometheus_name(name)
+        lines += ['# TYPE ' + name + ' gauge', name + ' ' + _prometheus_value(value)]
+    for name, histogram in sorted(data['histograms'].items()):
+        name = _prometheus_name(name)
+        lines.append('# TYPE ' + name + ' histogram')
+        cumulative = 0
+        for bound, count in histogram['buckets'].items():
+            cumulative += count
+            lines.append(name + '_bucket{le="' + bound + '"} ' + str(cumulative))
+        lines += [name + '_sum ' + _prometheus_value(histogram['sum']), name + '_count ' + str(histogram['count'])]
+    return '\n'.join(lines) + '\n'
+
+
+def write_snapshot(path: str, output_format: str = 'json', command: str = None):
+    """
+    Appends a JSON snapshot to the file as a single line, or replaces the file with a Prometheus snapshot.
+
+    :param path: Path to the metrics file.
+    :param output_format: json or prometheus.
+    :param command: Name of the subcommand, included in JSON snapshots.
+    :return: None
+    """
+    data = snapshot()
+    if output_format == 'prometheus':
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as metricsfile:
+            metricsfile.write(format_prometheus(data))
+        os.replace(temp_path, path)
+        return
+    with open(path, 'a', encoding='utf-8') as metricsfile:
+        metricsfile.write(json.dumps(dict(data, command=command)) + '\n')
+
+
+def run(function, args: tuple, command: str, metrics_path: str = None, metrics_format: str = 'json',
+        interval: float = INTERVAL, profile_path: str = None, trace_memory: bool = False):
+    """
+    Runs the subcommand with the requested instrumentation. Everything is reported even if the subcommand exits early
+    (e.g. through print_error, or Ctrl+C).
+
+    :param function: Function running the subcommand.
+    :param args: Arguments to call the function with.
+    :param command: Name of the subcommand.
+    :param metrics_path: Path to write metrics snapshots to, or None.
+    :param metrics_format: json or prometheus.
+    :param interval: Seconds between snapshots while the subcommand runs.
+    :param profile_path: Path to save cProfile stats to (readable with pstats or snakeviz), or None not to profile.
+    :param trace_memory: Report peak memory use and the largest allocation sites? T/F
+    :return: The function's return value.
+    """
+    stop = threading.Event()
+    writer = None
+    if metrics_path:
+        enable()
+
+        def write_periodically():
+            while not stop.wait(interval):
+                try:
+                    write_snapshot(metrics_path, metrics_format, command)
+                except OSError:
+                    pass
+        writer = threading.Thread(target=write_periodically, daemon=True)
+        writer.start()
+
+    if trace_memory:
+        import tracemalloc
+        tracemalloc.start()
+    profiler = None
+    if profile_path:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        return function(*args)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+            _print_profile(profiler, profile_path)
+        if trace_memory:
+            _print_memory()
+        if writer:
+            stop.set()
+            writer.join()
+            write_snapshot(metrics_path, metrics_format, command)
+
+
+def _print_profile(profiler, path: str):
+    # the report goes to stderr, so it never mixes with output meant to be piped
+    import pstats
+    print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Profile saved to '+Fore.CYAN+path+Fore.MAGENTA+', top functions by '
+          'cumulative time:'+Style.RESET_ALL, file=sys.stderr)
+    pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(_REPORT_LINES)
+
+
+def _print_memory():
+    import tracemalloc
+    current, peak = tracemalloc.get_traced_memory()
+    top = tracemalloc.take_snapshot().statistics('lineno')[:_REPORT_LINES]
+    tracemalloc.stop()
+    print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Memory: '+Fore.CYAN+_format_bytes(peak)+Fore.MAGENTA+' peak, ' +
+          Fore.CYAN+_format_bytes(current)+Fore.MAGENTA+' still allocated, largest allocation sites:'+Style.RESET_ALL,
+          file=sys.stderr)
+    for stat in top:
+        frame = stat.traceback[0]
+        print('   '+Fore.CYAN+_format_bytes(stat.size).rjust(10)+'  '+Fore.MAGENTA+frame.filename+':' +
+              str(frame.lineno)+Style.RESET_ALL, file=sys.stderr)
+
+
+def _format_bytes(size: int) -> str:
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            return '{:.1f} {}'.format(size, unit) if unit != 'B' else str(size) + ' B'
+        size /= 1024
+    return '{:.1f} GiB'.format(size)
+
+
+def _prometheus_name(name: str) -> str:
+    return PROMETHEUS_PREFIX + ''.join(c if c.isalnum() else '_' for c in name)
+
+
+def _prometheus_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
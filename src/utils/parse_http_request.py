@@ -0,0 +1,187 @@
+"""
+parse_http_request.py
+
+This file contains the functionality needed to read JWTs out of saved HTTP requests (the -r/--request flag). Raw
+request files as saved by Burp Suite or other proxies are supported, as well as several requests concatenated in one
+file, a directory of request files, and Burp's XML export of the proxy history ("Save items").
+
+Requests are parsed from the raw bytes using offsets into the buffer, so only the start line, headers and body are
+ever copied out of it, and tokens are found with a single precompiled pattern.
+
+Functions:
+- parse_request: Splits a single raw request into its start line, headers, cookies and body, and extracts its JWTs.
+- parse_cookies: Splits a Cookie header value into a dictionary of cookie names and values.
+- extract_tokens: Returns every distinct JWT-shaped string in a buffer.
+- split_requests: Returns the offsets of each request in a buffer holding one or more raw requests.
+- iter_requests: Parses every request in a file, Burp XML export or directory of request files.
+- request_tokens: Returns every distinct JWT in the requests at a path.
+- find_request: Returns the first request at a path that carries a given JWT.
+"""
+
+import os
+import re
+import base64
+import binascii
+
+# <header>.<payload>.<signature> where the header and payload are Base64url-encoded JSON objects, i.e. start with '{"'
+JWT_PATTERN = re.compile(rb'eyJ[A-Za-z0-9_-]*\.eyJ[A-Za-z0-9_-]*\.[A-Za-z0-9_-]*')
+
+# start line of a request, used to find where each request begins in a file of concatenated requests
+REQUEST_LINE_PATTERN = re.compile(
+    rb'^(?:GET|POST|PUT|DELETE|PATCH|HEAD|OPTIONS|TRACE|CONNECT) [^ \r\n]+ HTTP/[0-9.]+\r?$', re.MULTILINE)
+
+# a single request item in a Burp Suite XML export
+BURP_ITEM_PATTERN = re.compile(rb'<request base64="(true|false)"><!\[CDATA\[(.*?)\]\]></request>', re.DOTALL)
+
+_LINE_END = re.compile(rb'\r?\n')
+_HEADERS_END = re.compile(rb'\r?\n\r?\n')
+
+
+def parse_request(data: bytes, start: int = 0, end: int = None) -> dict:
+    """
+    Parses a single raw HTTP request from data[start:end].
+
+    :param data: Buffer holding the raw request.
+    :param start: Offset of the start of the request in the buffer.
+    :param end: Offset of the end of the request in the buffer (default: end of the buffer).
+    :return: Dictionary object with method, target, version, headers (list of (name, value) tuples), cookies, body
+             (bytes) and tokens (list of (location, token) tuples, e.g. ('header:Authorization', 'eyJ...')).
+    """
+    if end is None:
+        end = len(data)
+
+    match = _HEADERS_END.search(data, start, end)
+    headers_end, body_start = (match.start(), match.end()) if match else (end, end)
+
+    match = _LINE_END.search(data, start, headers_end)
+    line_end, next_line = (match.start(), match.end()) if match else (headers_end, headers_end)
+    method, _, rest = data[start:line_end].decode('latin-1').partition(' ')
+    target, _, version = rest.rpartition(' ') if ' HTTP/' in rest else (rest, '', '')
+
+    request = {
+        'method': method,
+        'target': target,
+        'version': version,
+        'headers': [],
+        'cookies': {},
+        'body': data[body_start:end],
+        'tokens': [],
+    }
+
+    for token in extract_tokens(data[start:line_end]):
+        request['tokens'].append(('target', token))
+
+    for line in _LINE_END.split(data[next_line:headers_end]):
+        name, sep, value = line.decode('latin-1').partition(':')
+        if not sep:
+            continue
+        name, value = name.strip(), value.strip()
+        request['headers'].append((name, value))
+        if name.lower() == 'cookie':
+            cookies = parse_cookies(value)
+            request['cookies'].update(cookies)
+            for cookie, cookie_value in cookies.items():
+                for token in extract_tokens(cookie_value.encode('latin-1')):
+                    request['tokens'].append(('cookie:' + cookie, token))
+        else:
+            for token in extract_tokens(value.encode('latin-1')):
+                request['tokens'].append(('header:' + name, token))
+
+    for token in extract_tokens(request['body']):
+        request['tokens'].append(('body', token))
+
+    return request
+
+
+def parse_cookies(value: str) -> dict:
+    """
+    :param value: Value of a Cookie header, e.g. 'session=eyJ...; theme=dark'
+    :return: Dictionary object of cookie names and values.
+    """
+    cookies = {}
+    for pair in value.split(';'):
+        name, sep, cookie_value = pair.partition('=')
+        if sep and name.strip():
+            cookies[name.strip()] = cookie_value.strip()
+    return cookies
+
+
+def extract_tokens(data: bytes) -> list:
+    """
+    :param data: Any buffer, e.g. a whole request, a header value or a log line.
+    :return: List of the distinct JWT-shaped strings in the buffer, in the order they first appear.
+    """
+    return list(dict.fromkeys(token.decode('ascii') for token in JWT_PATTERN.findall(data)))
+
+
+def split_requests(data: bytes) -> list:
+    """
+    Finds each request in a buffer of one or more raw requests, by the request line that starts each of them.
+
+    :param data: Buffer holding the raw requests.
+    :return: List of (start, end) offsets of each request in the buffer. If no request line is found, the whole buffer
+             is treated as a single request.
+    """
+    starts = [match.start() for match in REQUEST_LINE_PATTERN.finditer(data)]
+    if not starts:
+        return [(0, len(data))] if data.strip() else []
+    return list(zip(starts, starts[1:] + [len(data)]))
+
+
+def iter_requests(path: str):
+    """
+    Parses every request at the path. Directories are walked recursively, in name order.
+
+    :param path: Path to a raw request file, a file of concatenated requests, a Burp XML export, or a directory of any
+                 of these.
+    :return: Generator of request dictionaries (see parse_request), each with the 'source' file it was read from.
+    """
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                yield from iter_requests(os.path.join(root, name))
+        return
+
+    with open(path, 'rb') as request_file:
+        data = request_file.read()
+
+    if data.lstrip().startswith(b'<?xml') and b'<items' in data:
+        buffers = [_burp_item(encoded, raw) for encoded, raw in BURP_ITEM_PATTERN.findall(data)]
+    else:
+        buffers = [data]
+
+    for buffer in buffers:
+        for start, end in split_requests(buffer):
+            request = parse_request(buffer, start, end)
+            request['source'] = path
+            yield request
+
+
+def request_tokens(path: str) -> list:
+    """
+    :param path: Path accepted by iter_requests.
+    :return: List of the distinct JWTs in every request at the path, in the order they first appear.
+    """
+    return list(dict.fromkeys(token for request in iter_requests(path) for _, token in request['tokens']))
+
+
+def find_request(path: str, token: str) -> dict:
+    """
+    :param path: Path accepted by iter_requests.
+    :param token: JWT to look for.
+    :return: The first request at the path that carries the token, or None if none of them do.
+    """
+    for request in iter_requests(path):
+        if any(found == token for _, found in request['tokens']):
+            return request
+    return None
+
+
+def _burp_item(encoded: bytes, raw: bytes) -> bytes:
+    if encoded != b'true':
+        return raw
+    try:
+        return base64.b64decode(raw)
+    except (binascii.Error, ValueError):
+        return b''
@@ -5,14 +5,17 @@ This file is intended to contain all the functionality needed by the tool to par
 
 Functions:
 - parse_token: The main function for token parsing, calls other functions for easier readability.
+- decode_token: Splits and decodes a token without any output, raising ValueError if it is malformed.
 - base64_decode: Takes the Base-64 encoded header or payload and returns a Python dict of the decoded data.
-- fetch_details: Pulls data from data/claims.json for the claims in the provided JWT. Runs data_updater if data/claims.json does not exist.
+- base64_decode_bytes: Takes any Base64url-encoded JWT section (including the signature) and returns the raw bytes.
+- base64_encode: Takes a Python dict of header or payload claims and returns its Base64url encoding.
+- base64_encode_bytes: Takes the raw bytes of any JWT section and returns its Base64url encoding.
+- fetch_details: Looks up the definitions of the claims in the provided JWT in the claims table (see claims.py).
 - convert_unix_to_utc: Takes a Unix timestamp and returns human-readable datetime string in UTC.
 - create_print_string: Creates printable, formatted string on a per-claim basis.
 - print_token: The main function for outputting parsed token details to the user.
 """
 
-import os
 import sys
 import json
 import time
@@ -20,11 +23,18 @@ import base64
 from colorama import Fore, Style
 from datetime import datetime
 
-import src.utils.data_updater
+import src.utils.claims
+import src.utils.metrics
 import src.utils.error_handler
 
+# reused for every encode, json.dumps builds a new encoder per call when given any options
+_COMPACT_JSON = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
 
-def parse_token(token: str, details: bool) -> dict:
+# claims holding Unix timestamps, shown with a human-readable UTC time
+TIMESTAMP_CLAIMS = ('exp', 'iat', 'nbf')
+
+
+def parse_token(token: str, details: bool, output: bool = True) -> dict:
     """
     Decodes the header and payload of a given token into human-readable format.
 
@@ -33,35 +43,59 @@ def parse_token(token: str, details: bool) -> dict:
     and the token's signature.
     :param token: The JWT to be read.
     :param details: Include additional information? T/F
+    :param output: Print the decoded token to the terminal? T/F
     :return: Decoded information about the JWT in nested dictionary object.
     """
 
-    header, payload, signature = '', '', ''
     try:
-        header, payload, signature = token.split('.')
-    except ValueError:
-        src.utils.error_handler.print_error('JWT not in correct format. Expected: <header>.<payload>.<signature>')
+        token_dict = decode_token(token)
+    except ValueError as e:
+        src.utils.error_handler.print_error(str(e))
 
-    token_dict = {}
     details_dict = {}
-
-    header_dict = base64_decode(header)
-    payload_dict = base64_decode(payload)
-
     if details:
-        # perform lookup of claim definitions from data/claims.json
-        details_dict = fetch_details(header_dict, payload_dict)
-
-    token_dict['original_token'] = token
-    token_dict['header_dict'] = header_dict
-    token_dict['payload_dict'] = payload_dict
-    token_dict['signature'] = signature
+        # perform lookup of claim definitions from the claims table
+        details_dict = fetch_details(token_dict['header_dict'], token_dict['payload_dict'])
     token_dict['details'] = details_dict
 
-    print_token(token_dict)
+    if output:
+        print_token(token_dict)
     return token_dict
 
 
+@src.utils.metrics.timed('parse_token.decode')
+def decode_token(token: str) -> dict:
+    """
+    Splits the token into its sections and decodes the header and payload, without any output or exiting on error so
+    that it can be used on many tokens at once.
+
+    :param token: The JWT to be decoded.
+    :return: Dictionary object with the original token, header_dict, payload_dict and signature.
+    """
+    try:
+        header, payload, signature = token.split('.')
+    except ValueError:
+        raise ValueError('JWT not in correct format. Expected: <header>.<payload>.<signature>')
+
+    try:
+        header_dict = base64_decode(header)
+        payload_dict = base64_decode(payload)
+    except ValueError:
+        # covers invalid Base64, invalid UTF-8 and invalid JSON
+        raise ValueError('JWT header or payload could not be decoded.')
+    except RecursionError:
+        raise ValueError('JWT header or payload is nested too deeply to decode.')
+    if not isinstance(header_dict, dict) or not isinstance(payload_dict, dict):
+        raise ValueError('JWT header and payload must be JSON objects.')
+
+    return {
+        'original_token': token,
+        'header_dict': header_dict,
+        'payload_dict': payload_dict,
+        'signature': signature,
+    }
+
+
 def base64_decode(chunk: str) -> dict:
     """
     Performs Base64-decoding of the provided string and returns a dictionary object representation of the string
@@ -70,13 +104,8 @@ def base64_decode(chunk: str) -> dict:
     :return: Dictionary object of the decoded data.
     """
 
-    # Add padding if necessary
-    padding = len(chunk) % 4
-    if padding != 0:
-        chunk += '=' * (4 - padding)
-
     # Decode the Base64 string to a JSON string
-    decoded = base64.urlsafe_b64decode(chunk)
+    decoded = base64_decode_bytes(chunk)
     json_str = decoded.decode('utf-8')
 
     # Convert JSON string to a Python dictionary
@@ -85,30 +114,57 @@ def base64_decode(chunk: str) -> dict:
     return data_dict
 
 
+def base64_decode_bytes(chunk: str) -> bytes:
+    """
+    Performs Base64url-decoding of the provided string, adding any padding stripped by the JWT encoding
+
+    :param chunk: A Base64url-encoded string (any JWT section, including the signature)
+    :return: The raw decoded bytes.
+    """
+
+    # Add padding if necessary
+    padding = len(chunk) % 4
+    if padding != 0:
+        chunk += '=' * (4 - padding)
+
+    return base64.urlsafe_b64decode(chunk)
+
+
+def base64_encode(data: dict) -> str:
+    """
+    Performs Base64url-encoding of the provided dictionary object as compact JSON, the way JWT libraries encode the
+    header and payload sections
+
+    :param data: Dictionary object of the header or payload claims
+    :return: A Base64url-encoded string without padding.
+    """
+    return base64_encode_bytes(_COMPACT_JSON.encode(data).encode('utf-8'))
+
+
+def base64_encode_bytes(data: bytes) -> str:
+    """
+    Performs Base64url-encoding of the provided bytes, stripping the padding as the JWT encoding does
+
+    :param data: Raw bytes of any JWT section (including the signature)
+    :return: A Base64url-encoded string without padding.
+    """
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+@src.utils.metrics.timed('parse_token.claims_lookup')
 def fetch_details(header: dict, payload: dict) -> dict:
     """
-    Performs definition lookup of the provided claims from data/claims.json. Runs the data_updater script to create
-    this file if it does not already exist.
+    Performs definition lookup of the provided claims from the claims table shipped in src/data/claims.json. The table
+    is loaded once per process, so this is cheap to call for every token.
 
     :param header: Dictionary object of the Base64 decoded JWT header
     :param payload: Dictionary object of the Base64 decoded JWT payload
     :return: Dictionary object containing all claims from both JWT parts and their definitions
     """
-    # Define the file path using os.path.join for cross-platform compatibility
-    file_path = os.path.join('data', 'claims.json')
-
-    # Check if the file exists
-    if not os.path.exists(file_path):
-        # call the data_updater script to create the claims.json file
-        src.utils.data_updater.main()
-
-    with open(file_path, 'r', encoding='utf-8') as jsonfile:
-        definitions = json.loads(jsonfile.read())
-
     # Merge the two dictionaries
     combined_dict = {**header, **payload}
     # details_dict[claim] = definition (if exists), else '**Custom Claim**'
-    details_dict = {k: definitions['claims'].get(k.lower(), "**Custom Claim**") for k in combined_dict}
+    details_dict = {k: src.utils.claims.lookup_claim(k) for k in combined_dict}
 
     return details_dict
 
@@ -152,7 +208,7 @@ def create_print_string(claim: str, token_dict: dict) -> str:
     else:
         src.utils.error_handler.print_error('The claim - '+claim+' - was not found')
 
-    if claim_name in ['exp', 'iat', 'nbf']:
+    if claim_name in TIMESTAMP_CLAIMS:
         is_timestamp = True
 
     if token_dict['details']:
@@ -0,0 +1,126 @@
+"""
+potfile.py
+
+This file contains the persistent result index (potfile) used by the bruteforce subcommand. Every cracked signing key
+is recorded against its token, along with every keyspace (wordlist and rules, or mask) that has already been exhausted
+for a token without finding the key, so the same work is never repeated across runs.
+
+Tokens are identified by (alg, SHA-256 of the signing input, signature), so the potfile never stores the tokens
+themselves. Records are appended as JSON lines, one per cracked key or exhausted keyspace, to
+~/.jwtjuggernaut/jwtjuggernaut.potfile by default.
+
+Functions:
+- default_path: Returns the default potfile location.
+- target_id: Returns the potfile identifier of a prepared bruteforce target.
+- load_potfile: Reads the potfile into an index of cracked keys and exhausted keyspaces.
+- record_cracked: Appends a cracked key to the potfile and index.
+- record_exhausted: Appends an exhausted keyspace to the potfile and index.
+- known_keys: Returns every key previously cracked for any token, for use as a first pass.
+"""
+
+import os
+import json
+import hashlib
+
+# hashlib digest name -> JWT alg header value, so potfile records read the same as the tokens
+_ALGORITHMS = {
+    'sha256': 'HS256',
+    'sha384': 'HS384',
+    'sha512': 'HS512',
+}
+
+
+def default_path() -> str:
+    """
+    :return: Path to the default potfile, ~/.jwtjuggernaut/jwtjuggernaut.potfile
+    """
+    return os.path.join(os.path.expanduser('~'), '.jwtjuggernaut', 'jwtjuggernaut.potfile')
+
+
+def target_id(target: tuple) -> tuple:
+    """
+    Returns the identifier of the target in the potfile.
+
+    :param target: Tuple of (digest name, signing input bytes, raw signature bytes) from bruteforce.prepare_target.
+    :return: Tuple of (alg, hex SHA-256 of the signing input, hex signature).
+    """
+    digest_name, signing_input, signature = target
+    return _ALGORITHMS[digest_name], hashlib.sha256(signing_input).hexdigest(), signature.hex()
+
+
+def load_potfile(path: str) -> dict:
+    """
+    Reads every record in the potfile. Unreadable lines (e.g. from a run killed mid-write) are skipped.
+
+    :param path: Path to the potfile.
+    :return: Dictionary object with 'path', 'cracked' (target id -> key bytes) and 'exhausted' (target id -> set of
+             keyspace fingerprints).
+    """
+    index = {'path': path, 'cracked': {}, 'exhausted': {}}
+    if not os.path.exists(path):
+        return index
+
+    with open(path, 'r', encoding='utf-8') as potfile:
+        for line in potfile:
+            try:
+                record = json.loads(line)
+                tid = (record['alg'], record['input'], record['sig'])
+                if 'key' in record:
+                    index['cracked'][tid] = bytes.fromhex(record['key'])
+                elif 'exhausted' in record:
+                    index['exhausted'].setdefault(tid, set()).add(record['exhausted'])
+            except (ValueError, KeyError, TypeError):
+                continue
+    return index
+
+
+def record_cracked(index: dict, target: tuple, key: bytes):
+    """
+    Records the cracked key for the target, unless it is already in the potfile.
+
+    :param index: Dictionary object returned by load_potfile.
+    :param target: Tuple returned by bruteforce.prepare_target.
+    :param key: The recovered signing key.
+    :return: None
+    """
+    tid = target_id(target)
+    if tid in index['cracked']:
+        return
+    index['cracked'][tid] = key
+    _append(index['path'], tid, {'key': key.hex()})
+
+
+def record_exhausted(index: dict, target: tuple, fingerprint: str):
+    """
+    Records that the keyspace has been fully tested against the target without finding the key.
+
+    :param index: Dictionary object returned by load_potfile.
+    :param target: Tuple returned by bruteforce.prepare_target.
+    :param fingerprint: Fingerprint of the exhausted keyspace.
+    :return: None
+    """
+    tid = target_id(target)
+    if fingerprint in index['exhausted'].get(tid, ()):
+        return
+    index['exhausted'].setdefault(tid, set()).add(fingerprint)
+    _append(index['path'], tid, {'exhausted': fingerprint})
+
+
+def known_keys(index: dict) -> list:
+    """
+    Returns every distinct key cracked in any previous run. Secrets are commonly reused across services, so these
+    make a tiny, high-yield first pass before the full keyspace.
+
+    :param index: Dictionary object returned by load_potfile.
+    :return: List of keys as bytes.
+    """
+    return list(dict.fromkeys(index['cracked'].values()))
+
+
+def _append(path: str, tid: tuple, fields: dict):
+    if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    record = {'alg': tid[0], 'input': tid[1], 'sig': tid[2], **fields}
+    with open(path, 'a', encoding='utf-8') as potfile:
+        potfile.write(json.dumps(record) + '\n')
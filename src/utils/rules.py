@@ -0,0 +1,238 @@
+"""
+rules.py
+
+This file contains the candidate mangling pipeline used by the bruteforce subcommand. Rule files use the hashcat rule
+syntax, one rule per line, and each rule is compiled once into a list of byte transforms so that mangled candidates
+can be generated on the fly inside each worker instead of shipping pre-expanded wordlists between processes.
+
+Supported rule functions (N is a position 0-9 or A-Z for 10-35, X and Y are single characters):
+    :  do nothing             l  lowercase all           u  uppercase all
+    c  capitalize             C  invert capitalize       t  toggle case of all
+    TN toggle case at N       r  reverse                 d  duplicate
+    f  reflect                {  rotate left             }  rotate right
+    $X append X               ^X prepend X               [  delete first
+    ]  delete last            DN delete at N             'N truncate at N
+    sXY replace X with Y      @X purge all X             pN duplicate N times
+
+Functions:
+- load_rules: Reads a rule file (or built-in rule set) and returns its rule lines.
+- compile_rule: Compiles a single rule line into a callable transform.
+- compile_rules: Compiles every rule line into the transform program used by the workers.
+- rules_hash: Returns a hash identifying a rule set, used to tie checkpoints and results to it.
+- iter_batches: Lazily applies the transform program to base words and yields batches of mangled candidates.
+"""
+
+import os
+import hashlib
+
+# built-in rule sets are stored in src/data/rules/<name>.rule
+RULES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'rules')
+
+# number of mangled candidates handed to the HMAC check at a time
+BATCH_SIZE = 4096
+
+_POSITIONS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def load_rules(rules: str) -> list:
+    """
+    Reads the rule lines from a rule file, skipping blank lines and comments. If the path does not exist, it is looked
+    up as the name of a built-in rule set instead (e.g. 'default').
+
+    :param rules: Path to a hashcat-style rule file, or the name of a built-in rule set.
+    :return: List of rule lines.
+    """
+    path = rules
+    if not os.path.isfile(path):
+        path = os.path.join(RULES_DIR, rules + '.rule')
+        if not os.path.isfile(path):
+            raise ValueError('Rule file not found: ' + rules)
+
+    with open(path, 'r', encoding='utf-8') as rulefile:
+        lines = [line.rstrip('\r\n') for line in rulefile]
+    return [line for line in lines if line.strip() and not line.startswith('#')]
+
+
+def compile_rule(rule: str):
+    """
+    Compiles a single hashcat-style rule into a callable that transforms a candidate (as bytes).
+
+    :param rule: A single rule line, e.g. 'c $2 $0 $2 $4 $!'
+    :return: Callable taking and returning bytes.
+    """
+    transforms = []
+    i = 0
+    while i < len(rule):
+        op = rule[i]
+        i += 1
+        if op in ' \t:':
+            continue
+        if op in _SIMPLE:
+            transforms.append(_SIMPLE[op])
+            continue
+
+        arity = 2 if op == 's' else 1
+        if op not in _WITH_ARGS or i + arity > len(rule):
+            raise ValueError('Invalid rule function ' + repr(op) + ' in rule: ' + rule)
+        args = rule[i:i + arity]
+        i += arity
+        transforms.append(_WITH_ARGS[op](*args))
+
+    if not transforms:
+        return _noop
+    if len(transforms) == 1:
+        return transforms[0]
+
+    def apply(word: bytes) -> bytes:
+        for transform in transforms:
+            word = transform(word)
+        return word
+    return apply
+
+
+def compile_rules(rules: list) -> list:
+    """
+    Compiles every rule line into the transform program applied to each base word.
+
+    :param rules: List of rule lines returned by load_rules.
+    :return: List of callables taking and returning bytes.
+    """
+    return [compile_rule(rule) for rule in rules]
+
+
+def rules_hash(rules: list) -> str:
+    """
+    Hashes the rule lines so checkpoints and results can be tied to the rule set they were created with.
+
+    :param rules: List of rule lines, or None.
+    :return: Hex encoded SHA-256 hash of the rules.
+    """
+    return hashlib.sha256('\n'.join(rules or []).encode('utf-8')).hexdigest()
+
+
+def iter_batches(words, program: list, batch_size: int = BATCH_SIZE):
+    """
+    Lazily applies every rule in the program to every base word, yielding the mangled candidates in batches.
+
+    :param words: Iterable of base words as bytes.
+    :param program: List of callables returned by compile_rules.
+    :param batch_size: Maximum number of candidates per batch.
+    :return: Generator of lists of candidates as bytes.
+    """
+    batch = []
+    append = batch.append
+    for word in words:
+        for transform in program:
+            append(transform(word))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+            append = batch.append
+    if batch:
+        yield batch
+
+
+def _noop(word: bytes) -> bytes:
+    return word
+
+
+def _position(char: str) -> int:
+    index = _POSITIONS.find(char)
+    if index == -1:
+        raise ValueError('Invalid rule position: ' + repr(char))
+    return index
+
+
+def _toggle_at(char: str):
+    n = _position(char)
+
+    def transform(word: bytes) -> bytes:
+        if n >= len(word):
+            return word
+        return word[:n] + word[n:n + 1].swapcase() + word[n + 1:]
+    return transform
+
+
+def _delete_at(char: str):
+    n = _position(char)
+
+    def transform(word: bytes) -> bytes:
+        return word[:n] + word[n + 1:]
+    return transform
+
+
+def _truncate_at(char: str):
+    n = _position(char)
+
+    def transform(word: bytes) -> bytes:
+        return word[:n]
+    return transform
+
+
+def _duplicate_times(char: str):
+    n = _position(char) + 1
+
+    def transform(word: bytes) -> bytes:
+        return word * n
+    return transform
+
+
+def _append(char: str):
+    suffix = char.encode('utf-8')
+
+    def transform(word: bytes) -> bytes:
+        return word + suffix
+    return transform
+
+
+def _prepend(char: str):
+    prefix = char.encode('utf-8')
+
+    def transform(word: bytes) -> bytes:
+        return prefix + word
+    return transform
+
+
+def _replace(old: str, new: str):
+    old, new = old.encode('utf-8'), new.encode('utf-8')
+
+    def transform(word: bytes) -> bytes:
+        return word.replace(old, new)
+    return transform
+
+
+def _purge(char: str):
+    char = char.encode('utf-8')
+
+    def transform(word: bytes) -> bytes:
+        return word.replace(char, b'')
+    return transform
+
+
+# rule functions that take no arguments
+_SIMPLE = {
+    'l': bytes.lower,
+    'u': bytes.upper,
+    'c': bytes.capitalize,
+    'C': lambda word: word[:1].lower() + word[1:].upper(),
+    't': bytes.swapcase,
+    'r': lambda word: word[::-1],
+    'd': lambda word: word + word,
+    'f': lambda word: word + word[::-1],
+    '{': lambda word: word[1:] + word[:1],
+    '}': lambda word: word[-1:] + word[:-1],
+    '[': lambda word: word[1:],
+    ']': lambda word: word[:-1],
+}
+
+# rule functions that take arguments, mapped to a factory that builds the transform
+_WITH_ARGS = {
+    'T': _toggle_at,
+    'D': _delete_at,
+    "'": _truncate_at,
+    'p': _duplicate_times,
+    '$': _append,
+    '^': _prepend,
+    's': _replace,
+    '@': _purge,
+}
